@@ -0,0 +1,210 @@
+"""Contrôle d'admission: rejet précoce des requêtes coûteuses quand le serveur sature.
+
+Sous une rafale, les analyses et les CLI lancées s'empilaient jusqu'à ce que le
+processus s'écroule. Chaque point d'entrée coûteux (analyse, reprise, relance, CLI,
+backtest) passe d'abord par ``controller.check``:
+
+- HTTP 429 si la file est pleine: trop d'analyses admises en cours
+  (``ADMISSION_MAX_ANALYSES``), trop d'appels LLM interactifs en attente d'un slot
+  (``ADMISSION_MAX_LLM_WAITING``), trop de sous-processus CLI vivants
+  (``CLI_MAX_PROCESSES``);
+- HTTP 503 si le processus lui-même est sous pression: mémoire résidente au-delà
+  de ``ADMISSION_MAX_RSS_MB`` ou boucle asyncio en retard de plus de
+  ``ADMISSION_MAX_LOOP_LAG_MS``.
+
+``Retry-After`` est estimé d'après le débit observé (complétions des 60 dernières
+secondes). Les endpoints de santé et de statut n'appellent jamais ``check``: un
+serveur saturé reste observable.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from fairqueue import INTERACTIVE, llm_scheduler
+
+if TYPE_CHECKING:  # annotations seulement: subprocess reste chargé à la demande (voir server)
+    import subprocess
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_ANALYSES = int(os.environ.get("ADMISSION_MAX_ANALYSES", 16))
+ADMISSION_MAX_LLM_WAITING = int(os.environ.get("ADMISSION_MAX_LLM_WAITING", 64))
+ADMISSION_MAX_RSS_MB = float(os.environ.get("ADMISSION_MAX_RSS_MB", 2048))
+ADMISSION_MAX_LOOP_LAG_MS = float(os.environ.get("ADMISSION_MAX_LOOP_LAG_MS", 500))
+CLI_MAX_PROCESSES = int(os.environ.get("CLI_MAX_PROCESSES", 2))
+
+# Nombre maximal de travaux simultanés par type (None: seule la pression du processus compte)
+LIMITS = {"analysis": ADMISSION_MAX_ANALYSES, "cli": CLI_MAX_PROCESSES, "backtest": None}
+SAMPLE_SECONDS = 0.25
+# Décroissance du retard mesuré: un pic isolé est oublié en une à deux secondes
+LAG_DECAY = 0.7
+THROUGHPUT_WINDOW = 60.0
+DEFAULT_RETRY_SECONDS = 10
+MAX_RETRY_SECONDS = 300
+
+
+def _page_size() -> int:
+    try:
+        return os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return 4096
+
+
+_PAGE_SIZE = _page_size()
+
+
+def read_rss(pid="self") -> int:
+    """Mémoire résidente actuelle du processus (par défaut le processus courant), en octets"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        pass
+    if pid != "self":
+        return 0
+    try:
+        import resource
+    except ImportError:  # Windows: pas de mesure
+        return 0
+    # Hors Linux: pic de mémoire (octets sur macOS), faute de mieux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class AdmissionController:
+    def __init__(self):
+        self.active: Dict[str, int] = defaultdict(int)
+        self.processes: Dict[str, List[Tuple["subprocess.Popen", float]]] = defaultdict(list)
+        self.rejected: Dict[str, int] = defaultdict(int)
+        self.loop_lag_ms = 0.0
+        self.rss_bytes = 0
+        self._completions: Dict[str, Deque[Tuple[float, float]]] = defaultdict(lambda: deque(maxlen=1000))
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.rss_bytes = read_rss()
+        self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _monitor(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(SAMPLE_SECONDS)
+            lag_ms = max(0.0, (loop.time() - start - SAMPLE_SECONDS) * 1000)
+            self.loop_lag_ms = max(lag_ms, self.loop_lag_ms * LAG_DECAY)
+            self.rss_bytes = read_rss()
+
+    # --- Décision ---
+
+    def running(self, kind: str) -> int:
+        alive = []
+        for process, started in self.processes[kind]:
+            if process.poll() is None:
+                alive.append((process, started))
+            else:
+                self._completed(kind, time.monotonic() - started)
+        self.processes[kind] = alive
+        return self.active[kind] + len(alive)
+
+    def pressure(self) -> Optional[str]:
+        """Raison de surcharge du processus (mémoire, boucle), None si tout va bien"""
+        if ADMISSION_MAX_RSS_MB and self.rss_bytes > ADMISSION_MAX_RSS_MB * 1024 * 1024:
+            return f"mémoire résidente {self.rss_bytes / 1024 / 1024:.0f} Mo > {ADMISSION_MAX_RSS_MB:g} Mo"
+        if ADMISSION_MAX_LOOP_LAG_MS and self.loop_lag_ms > ADMISSION_MAX_LOOP_LAG_MS:
+            return f"boucle asyncio en retard de {self.loop_lag_ms:.0f} ms"
+        return None
+
+    def check(self, kind: str):
+        """HTTP 429 (file pleine) ou 503 (processus sous pression) avec Retry-After"""
+        reason = self.pressure()
+        if reason is not None:
+            self._reject(kind, 503, f"Serveur surchargé ({reason})", self.retry_after("analysis"))
+        limit = LIMITS.get(kind)
+        running = self.running(kind)
+        if limit is not None and running >= limit:
+            self._reject(kind, 429, f"Trop de travaux '{kind}' en cours ({running}/{limit})",
+                         self.retry_after(kind, running - limit + 1))
+        if kind == "analysis":
+            waiting = llm_scheduler.waiting_for(INTERACTIVE)
+            if ADMISSION_MAX_LLM_WAITING and waiting >= ADMISSION_MAX_LLM_WAITING:
+                self._reject(kind, 429, f"File LLM saturée ({waiting} appels en attente)",
+                             self.retry_after(kind, running or 1))
+
+    def _reject(self, kind: str, status_code: int, detail: str, retry_after: int):
+        self.rejected[f"{kind}:{status_code}"] += 1
+        logger.warning(f"🚦 Requête {kind} refusée ({status_code}): {detail}, réessayer dans {retry_after}s")
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+    @asynccontextmanager
+    async def admit(self, kind: str):
+        """Admission puis comptage du travail jusqu'à sa fin (débit pour Retry-After)"""
+        self.check(kind)
+        self.active[kind] += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active[kind] -= 1
+            self._completed(kind, time.monotonic() - start)
+
+    def track_process(self, kind: str, process: "subprocess.Popen"):
+        """Sous-processus compté tant qu'il est vivant (au-delà de la requête qui l'a lancé)"""
+        self.processes[kind].append((process, time.monotonic()))
+
+    # --- Débit ---
+
+    def _completed(self, kind: str, duration: float):
+        self._completions[kind].append((time.monotonic(), duration))
+
+    def throughput(self, kind: str) -> float:
+        """Complétions par seconde sur la fenêtre récente"""
+        now = time.monotonic()
+        recent = [at for at, _ in self._completions[kind] if now - at < THROUGHPUT_WINDOW]
+        if not recent:
+            return 0.0
+        return len(recent) / max(1.0, now - recent[0])
+
+    def retry_after(self, kind: str, excess: int = 1) -> int:
+        """Secondes avant que ``excess`` places se libèrent au débit actuel"""
+        rate = self.throughput(kind)
+        if rate > 0:
+            seconds = excess / rate
+        elif self._completions[kind]:
+            # Aucune complétion récente: durée moyenne d'un travail
+            durations = [duration for _, duration in self._completions[kind]]
+            seconds = sum(durations) / len(durations)
+        else:
+            seconds = DEFAULT_RETRY_SECONDS
+        return int(min(MAX_RETRY_SECONDS, max(1, math.ceil(seconds))))
+
+    def stats(self) -> dict:
+        return {
+            "limits": {
+                **{kind: limit for kind, limit in LIMITS.items() if limit is not None},
+                "llm_waiting": ADMISSION_MAX_LLM_WAITING,
+                "rss_mb": ADMISSION_MAX_RSS_MB,
+                "loop_lag_ms": ADMISSION_MAX_LOOP_LAG_MS,
+            },
+            "running": {kind: self.running(kind) for kind in LIMITS},
+            "llm_waiting": llm_scheduler.waiting_for(INTERACTIVE),
+            "throughput_per_minute": {kind: round(self.throughput(kind) * 60, 2) for kind in LIMITS},
+            "rss_mb": round(self.rss_bytes / 1024 / 1024, 1),
+            "loop_lag_ms": round(self.loop_lag_ms, 1),
+            "pressure": self.pressure(),
+            "rejected": dict(self.rejected),
+        }
+
+
+controller = AdmissionController()
@@ -0,0 +1,232 @@
+"""Phases du pipeline adossées au LLM (modes live, record et replay).
+
+Même contrat que les phases simulées de ``pipeline``: ``(config, outputs) -> dict``;
+chaque sortie porte son ``token_usage`` pour la comptabilité des résultats.
+"""
+import asyncio
+import json
+import re
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import ingestion
+import ledger
+import prompt_context
+import routing
+import tracing
+import upstream
+from prompt_context import DebateMemory, count_tokens
+
+SYSTEM_PROMPT = "Vous êtes un agent du framework TradingAgents. Répondez en français, de façon concise."
+
+ANALYST_FOCUS = {
+    "market": "l'évolution du cours et les indicateurs techniques",
+    "social": "le sentiment des investisseurs et des réseaux sociaux",
+    "news": "l'actualité récente de l'entreprise et du secteur",
+    "fundamentals": "les fondamentaux financiers et la valorisation",
+}
+
+DECISION_PATTERN = re.compile(r"DECISION\s*:\s*(BUY|SELL|HOLD)", re.IGNORECASE)
+CONFIDENCE_PATTERN = re.compile(r"CONFIDENCE\s*:\s*([01](?:\.\d+)?)", re.IGNORECASE)
+
+
+def _usage(*responses: dict) -> dict:
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    for response in responses:
+        for key in usage:
+            usage[key] += response.get("usage", {}).get(key, 0)
+    usage["tokens_saved"] = sum(r.get("context", {}).get("tokens_saved", 0) for r in responses)
+    return usage
+
+
+def _naive_tokens(instruction: str, *blocks: str) -> int:
+    """Taille qu'aurait eue le prompt sans compaction (tout l'historique, sans dédoublonnage)"""
+    return count_tokens(SYSTEM_PROMPT) + count_tokens(instruction) + sum(count_tokens(b) for b in blocks)
+
+
+async def _ask(role: str, instruction: str, shared: Sequence[str] = (),
+               sections: Sequence[Tuple[str, str]] = (), naive_tokens: Optional[int] = None) -> Tuple[str, dict]:
+    with tracing.span(f"agent {role}", **{"agent.role": role}) as span:
+        messages, stats = prompt_context.build_messages(role, SYSTEM_PROMPT, instruction, shared, sections, naive_tokens)
+        span.set_attribute("prompt.sent_tokens", stats["sent_tokens"])
+        span.set_attribute("prompt.tokens_saved", stats["tokens_saved"])
+        response = await routing.complete(role, messages)
+        span.set_attribute("gen_ai.response.model", response.get("routed_model"))
+    response["context"] = stats
+    return response["choices"][0]["message"]["content"], response
+
+
+async def collect_analyst_data(analyst: str, ticker: str, analysis_date: str):
+    """Données brutes FinnHub propres à chaque analyste; lève si la source est indisponible.
+
+    None pour un analyste sans source de données. Utilisé tel quel par le préchargement,
+    qui ne doit pas tenir un échec pour une collecte réussie.
+    """
+    if analyst == "market":
+        return await upstream.finnhub_get("/quote", {"symbol": ticker}, cache_ttl=upstream.FINNHUB_CACHE_SECONDS)
+    if analyst in ("news", "social"):
+        # Fenêtre précalculée par l'ingestion (dédoublonnée, sentiment déjà scoré)
+        return await ingestion.analyst_view(ticker, analyst, analysis_date)
+    if analyst == "fundamentals":
+        return (await upstream.finnhub_get(
+            "/stock/metric", {"symbol": ticker, "metric": "all"}, cache_ttl=upstream.FINNHUB_CACHE_SECONDS,
+        )).get("metric", {})
+    return None
+
+
+async def fetch_analyst_data(analyst: str, ticker: str, analysis_date: str) -> str:
+    """Données de l'analyste en texte compact pour le prompt (message d'indisponibilité en cas d'échec)"""
+    try:
+        data = await collect_analyst_data(analyst, ticker, analysis_date)
+    except upstream.CassetteMiss:
+        raise
+    except Exception as e:
+        return f"Données indisponibles ({type(e).__name__})"
+    if data is None:
+        return "Aucune source de données pour cet analyste."
+    return json.dumps(data, ensure_ascii=False)[:4000]
+
+
+async def _run_analyst(analyst: str, config: dict) -> Tuple[str, dict]:
+    data = await fetch_analyst_data(analyst, config["ticker"], config["analysis_date"])
+    focus = ANALYST_FOCUS.get(analyst, analyst)
+    with ledger.attribute(agent=analyst):
+        return await _ask(
+            routing.analyst_role(analyst),
+            f"Analyste {analyst}: rédigez un rapport sur {config['ticker']} au {config['analysis_date']} "
+            f"centré sur {focus}.",
+            sections=[("Données", data)],
+        )
+
+
+async def run_analysts(config: dict, outputs: dict) -> dict:
+    answers = await asyncio.gather(*[_run_analyst(a, config) for a in config["analysts"]])
+    return {
+        "reports": {a: text for a, (text, _) in zip(config["analysts"], answers)},
+        "token_usage": _usage(*[response for _, response in answers]),
+    }
+
+
+async def run_research(config: dict, outputs: dict) -> dict:
+    raw_reports = outputs["analysts"]["reports"]
+    naive_reports = "\n\n".join(f"[{a}] {r}" for a, r in raw_reports.items())
+    # Bloc commun à tous les appels du débat: préfixe identique, phrases redondantes retirées
+    reports = "Rapports des analystes:\n" + "\n\n".join(
+        f"[{a}] {r}" for a, r in prompt_context.dedupe_blocks(raw_reports).items()
+    )
+    memory = DebateMemory()
+    rounds: List[dict] = []
+    responses = []
+    for i in range(config["research_depth"]):
+        instruction = f"Chercheur haussier, round {i + 1}. Défendez l'achat de {config['ticker']}."
+        bull, r1 = await _ask(
+            "bull_researcher", instruction, shared=[reports],
+            sections=[("Débat", memory.render())],
+            naive_tokens=_naive_tokens(instruction, naive_reports, memory.full_text),
+        )
+        memory.add_turn("Haussier", bull)
+        instruction = f"Chercheur baissier, round {i + 1}. Défendez la vente de {config['ticker']}."
+        bear, r2 = await _ask(
+            "bear_researcher", instruction, shared=[reports],
+            sections=[("Débat", memory.render([("Haussier", bull)]))],
+            naive_tokens=_naive_tokens(instruction, naive_reports, memory.full_text),
+        )
+        memory.add_turn("Baissier", bear)
+        memory.add_round(i + 1, bull, bear)
+        rounds.append({"round": i + 1, "bull": bull, "bear": bear})
+        responses += [r1, r2]
+    return {
+        "rounds": rounds,
+        "summary": f"Débat de {len(rounds)} round(s) entre chercheurs haussiers et baissiers",
+        "token_usage": _usage(*responses),
+    }
+
+
+async def run_trader(config: dict, outputs: dict) -> dict:
+    memory = DebateMemory()
+    for r in outputs["research"]["rounds"]:
+        memory.add_turn("Haussier", r["bull"])
+        memory.add_turn("Baissier", r["bear"])
+        memory.add_round(r["round"], r["bull"], r["bear"])
+    instruction = f"Trader: proposez un plan de trading pour {config['ticker']} à partir du débat suivant."
+    plan, response = await _ask(
+        "trader", instruction,
+        sections=[("Débat", memory.render())],
+        naive_tokens=_naive_tokens(instruction, memory.full_text),
+    )
+    return {"plan": plan, "token_usage": _usage(response)}
+
+
+async def run_risk(config: dict, outputs: dict) -> dict:
+    assessment, response = await _ask(
+        "risk_manager",
+        f"Gestionnaire des risques: évaluez le plan suivant pour {config['ticker']}. "
+        "Commencez par 'RISQUE: faible|modéré|élevé'.",
+        sections=[("Plan", outputs["trader"]["plan"])],
+    )
+    match = re.search(r"RISQUE\s*:\s*(faible|modéré|élevé)", assessment, re.IGNORECASE)
+    return {
+        "risk_level": match.group(1).lower() if match else "modéré",
+        "assessment": assessment,
+        "token_usage": _usage(response),
+    }
+
+
+async def run_portfolio(config: dict, outputs: dict) -> dict:
+    # L'évaluation des risques cite souvent le plan: les phrases reprises ne sont envoyées qu'une fois
+    blocks = prompt_context.dedupe_blocks({"Plan": outputs["trader"]["plan"], "Risque": outputs["risk"]["assessment"]})
+    instruction = (
+        f"Gestionnaire de portefeuille: décision finale sur {config['ticker']}. "
+        "Terminez par 'DECISION: BUY|SELL|HOLD' puis 'CONFIDENCE: 0.00-1.00'."
+    )
+    rationale, response = await _ask(
+        "portfolio_manager", instruction,
+        sections=list(blocks.items()),
+        naive_tokens=_naive_tokens(instruction, outputs["trader"]["plan"], outputs["risk"]["assessment"]),
+    )
+    decision = DECISION_PATTERN.search(rationale)
+    confidence = CONFIDENCE_PATTERN.search(rationale)
+    return {
+        "decision": decision.group(1).upper() if decision else "HOLD",
+        "confidence": min(float(confidence.group(1)), 1.0) if confidence else 0.5,
+        "rationale": rationale,
+        "token_usage": _usage(response),
+    }
+
+
+# --- Mode comparaison (voir ``comparison``) ---
+
+async def summarize_market(config: dict, tickers: List[str], medians: dict, news: List[dict]) -> Tuple[str, dict]:
+    """Contexte de marché et sectoriel commun à tous les tickers comparés"""
+    summary, response = await _ask(
+        "macro_analyst",
+        f"Analyste macro: résumez en quelques phrases le contexte de marché et sectoriel au "
+        f"{config['analysis_date']} pour comparer {', '.join(tickers)}.",
+        sections=[
+            ("Fondamentaux du groupe (médianes)", json.dumps(medians, ensure_ascii=False)),
+            ("Actualité générale", json.dumps(news, ensure_ascii=False)),
+        ],
+    )
+    return summary, _usage(response)
+
+
+async def rank_tickers(config: dict, tickers: List[str], context: str, dossiers: str) -> Tuple[str, dict]:
+    """Classement de tous les tickers en un appel (une ligne par ticker)"""
+    instruction = (
+        f"Gestionnaire de portefeuille: classez ces {len(tickers)} tickers ({', '.join(tickers)}) du plus "
+        f"au moins attractif à l'achat au {config['analysis_date']}. Une ligne par ticker, sans autre texte: "
+        "'RANG. TICKER | SCORE: 0-100 | DECISION: BUY|SELL|HOLD | justification en une phrase'."
+    )
+    text, response = await _ask(
+        "comparison_ranker", instruction, shared=[f"Contexte de marché:\n{context}"],
+        sections=[("Dossiers", dossiers)],
+    )
+    return text, _usage(response)
+
+
+PHASE_RUNNERS: Dict[str, Callable] = {
+    "analysts": run_analysts,
+    "research": run_research,
+    "trader": run_trader,
+    "risk": run_risk,
+    "portfolio": run_portfolio,
+}
@@ -0,0 +1,149 @@
+"""Backtest vectorisé des décisions stockées contre l'historique de prix local.
+
+Les prix sont lus depuis un cache local (un CSV par ticker, colonnes ``Date`` et
+``Adj Close``/``Close``) et assemblés en une matrice dates x tickers; tous les calculs
+(rendements, taux de réussite, Sharpe, drawdown) se font en NumPy sans boucle Python
+par décision. ``run_backtest_from_cache`` est destiné à tourner dans un ProcessPoolExecutor.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+PRICE_CACHE_DIR = Path(os.environ.get("PRICE_CACHE_DIR", Path(__file__).parent / "data" / "prices"))
+TRADING_DAYS = 252
+SIGNALS = {"BUY": 1.0, "SELL": -1.0, "HOLD": 0.0}
+
+# Cache par processus worker: (chemin, mtime) -> série de clôtures
+_series_cache: Dict[Tuple[str, float], pd.Series] = {}
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # forkserver comme workers.py: pas de fork d'un processus qui porte déjà les threads de Motor
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(max_workers=int(os.environ.get("BACKTEST_WORKERS", os.cpu_count() or 2)),
+                                    mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _load_series(path: Path) -> pd.Series:
+    key = (str(path), path.stat().st_mtime)
+    series = _series_cache.get(key)
+    if series is None:
+        frame = pd.read_csv(path, index_col="Date", parse_dates=["Date"])
+        column = "Adj Close" if "Adj Close" in frame.columns else "Close"
+        series = frame[column].astype("float64").sort_index()
+        _series_cache[key] = series
+    return series
+
+
+def load_prices(tickers: List[str], cache_dir: Path = PRICE_CACHE_DIR) -> pd.DataFrame:
+    """Matrice des clôtures (index: dates, colonnes: tickers présents dans le cache)"""
+    series = {}
+    for ticker in tickers:
+        path = Path(cache_dir) / f"{ticker}.csv"
+        if path.exists():
+            series[ticker] = _load_series(path)
+    if not series:
+        return pd.DataFrame()
+    return pd.DataFrame(series).sort_index()
+
+
+def run_backtest(tickers: List[str], dates: List[str], decisions: List[str],
+                 prices: pd.DataFrame, horizon: int = 5) -> dict:
+    """Score les décisions (colonnes parallèles) contre la matrice de prix.
+
+    Chaque décision est prise à la clôture du premier jour de bourse >= analysis_date et
+    la position (+1 BUY, -1 SELL, 0 HOLD) est tenue ``horizon`` jours ou jusqu'à la décision
+    suivante sur le même ticker: le portefeuille et le rendement par décision couvrent la
+    même fenêtre. Le portefeuille est équipondéré entre positions actives.
+    """
+    if prices.empty or not tickers:
+        return {"decisions": 0, "skipped": len(tickers), "metrics": None, "per_ticker": []}
+
+    values = prices.to_numpy()
+    n_days = values.shape[0]
+    col = prices.columns.get_indexer(pd.Index(tickers))
+    row = prices.index.searchsorted(pd.to_datetime(pd.Index(dates)))
+    signal = pd.Index(decisions).str.upper().map(SIGNALS).to_numpy(dtype="float64", na_value=np.nan)
+    keep = (col >= 0) & (row < n_days) & ~np.isnan(signal)
+    col, row, signal = col[keep], row[keep], signal[keep]
+    skipped = int((~keep).sum())
+
+    # Rendement à horizon de chaque décision
+    end = np.minimum(row + horizon, n_days - 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        forward = values[end, col] / values[row, col] - 1.0
+    scored = (end > row) & np.isfinite(forward)
+    signed = signal * forward
+    directional = scored & (signal != 0)
+    hits = signed[directional] > 0
+
+    # Matrice des positions puis rendements quotidiens du portefeuille: la position prise au
+    # jour r porte sur les rendements r -> r+1 ... r+horizon-1 -> r+horizon, soit la ligne r
+    # et ses horizon - 1 suivantes
+    order = np.argsort(row, kind="stable")
+    positions = np.full(values.shape, np.nan)
+    positions[row[order], col[order]] = signal[order]
+    positions = pd.DataFrame(positions)
+    if horizon > 1:
+        positions = positions.ffill(limit=horizon - 1)
+    positions = positions.fillna(0.0).to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        daily = np.nan_to_num(values[1:] / values[:-1] - 1.0, nan=0.0, posinf=0.0, neginf=0.0)
+    held = positions[:-1]
+    active = np.count_nonzero(held, axis=1)
+    portfolio = np.divide((held * daily).sum(axis=1), active, out=np.zeros(len(active)), where=active > 0)
+    portfolio = portfolio[row.min():] if len(row) else portfolio[:0]
+
+    equity = np.cumprod(1.0 + portfolio)
+    drawdown = equity / np.maximum.accumulate(equity) - 1.0 if len(equity) else np.zeros(1)
+    std = portfolio.std()
+    metrics = {
+        "total_return": float(equity[-1] - 1.0) if len(equity) else 0.0,
+        "annualized_return": float(equity[-1] ** (TRADING_DAYS / len(equity)) - 1.0) if len(equity) else 0.0,
+        "sharpe": float(portfolio.mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else 0.0,
+        "max_drawdown": float(drawdown.min()),
+        "hit_rate": float(hits.mean()) if len(hits) else None,
+        "avg_decision_return": float(signed[directional].mean()) if directional.any() else None,
+        "days": int(len(portfolio)),
+    }
+
+    frame = pd.DataFrame({
+        "ticker": prices.columns.to_numpy()[col][directional],
+        "ret": signed[directional],
+        "hit": hits,
+    })
+    per_ticker = frame.groupby("ticker").agg(
+        decisions=("ret", "size"), avg_return=("ret", "mean"), hit_rate=("hit", "mean")
+    ).reset_index()
+
+    return {
+        "decisions": int(keep.sum()),
+        "skipped": skipped,
+        "metrics": metrics,
+        "per_ticker": per_ticker.to_dict(orient="records"),
+    }
+
+
+def run_backtest_from_cache(tickers: List[str], dates: List[str], decisions: List[str],
+                            horizon: int = 5, cache_dir: str = str(PRICE_CACHE_DIR)) -> dict:
+    """Point d'entrée du worker: charge les prix (cache du processus) puis score"""
+    prices = load_prices(sorted(set(tickers)), Path(cache_dir))
+    result = run_backtest(tickers, dates, decisions, prices, horizon)
+    result["tickers_without_prices"] = sorted(set(tickers) - set(prices.columns))
+    return result
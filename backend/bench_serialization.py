@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de sérialisation des réponses, route par route
+
+Compare l'ancien chemin (modèles Pydantic + validation du response_model +
+jsonable_encoder + JSONResponse) au chemin actuel (json_response orjson avec
+fragments pré-sérialisés). Aucune base ni réseau nécessaires.
+
+Usage: python bench_serialization.py [--number 200] [--json]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import timeit
+import uuid
+import warnings
+from datetime import datetime
+from typing import List
+
+os.environ.setdefault("WARMUP_IMPORTS", "0")
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import pipeline
+import results
+import server
+from responses import json_response, orjson
+
+
+def _expand(value):
+    """Remplace les fragments pré-sérialisés par leur valeur Python (ancien chemin)"""
+    if orjson is not None and isinstance(value, getattr(orjson, "Fragment", ())):
+        return orjson.loads(orjson.dumps(value))
+    if isinstance(value, dict):
+        return {k: _expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand(v) for v in value]
+    return value
+
+
+# FastAPI construit le champ du response_model une seule fois par route
+_adapter = functools.lru_cache(maxsize=None)(TypeAdapter)
+
+
+def _legacy(payload, response_model=None):
+    content = payload
+    if response_model is not None:
+        content = _adapter(response_model).validate_python(content)
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def build_payloads():
+    config = server.TradingAnalysisRequest().dict()
+    outputs = {}
+    for phase in pipeline.PHASE_NAMES:
+        outputs[phase] = asyncio.run(pipeline.PHASE_RUNNERS[phase](config, outputs))
+    analysis_id = str(uuid.uuid4())
+    result = results.build_result(analysis_id, config, outputs)
+    summary = results.AnalysisSummary(**result.dict(exclude={"reports"}))
+    status_docs = [
+        {"id": str(uuid.uuid4()), "client_name": f"client-{i}", "timestamp": datetime.utcnow()}
+        for i in range(1000)
+    ]
+    summaries = [dict(summary.dict(), id=str(uuid.uuid4())) for _ in range(50)]
+
+    # route -> (payload actuel, payload ancien, response_model de l'ancien chemin)
+    return {
+        "GET /api/status (1000 docs)": (
+            status_docs,
+            [server.StatusCheck(**d) for d in status_docs],
+            List[server.StatusCheck],
+        ),
+        "POST /api/status": (status_docs[0], server.StatusCheck(**status_docs[0]), server.StatusCheck),
+        "GET /api/trading/status": (server._trading_status(), server._trading_status(), None),
+        "POST /api/trading/launch-cli": (
+            server._cli_response(analysis_id, "ok"), _expand(server._cli_response(analysis_id, "ok")), None,
+        ),
+        "POST /api/trading/analyze": (
+            server._analysis_response(analysis_id, config, outputs, summary),
+            _expand(server._analysis_response(analysis_id, config, outputs, summary)),
+            None,
+        ),
+        "GET /api/trading/analyses (50)": (
+            {"items": summaries, "next_cursor": None},
+            {"items": summaries, "next_cursor": None},
+            None,
+        ),
+        "GET /api/trading/analyses/{id}": (summary.dict(), summary, results.AnalysisSummary),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = []
+    for route, (current, legacy, model) in build_payloads().items():
+        assert json.loads(json_response(current).body) == json.loads(_legacy(legacy, model))
+        legacy_s = min(timeit.repeat(lambda: _legacy(legacy, model), number=args.number, repeat=3))
+        current_s = min(timeit.repeat(lambda: json_response(current).body, number=args.number, repeat=3))
+        report.append({
+            "route": route,
+            "bytes": len(json_response(current).body),
+            "legacy_us": round(legacy_s / args.number * 1e6, 1),
+            "current_us": round(current_s / args.number * 1e6, 1),
+            "speedup": round(legacy_s / current_s, 1) if current_s else None,
+        })
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print("⚡ Sérialisation des réponses (µs par réponse)")
+    print("=" * 78)
+    print(f"{'Route':<36}{'Octets':>8}{'Avant':>12}{'Après':>12}{'Gain':>8}")
+    for row in report:
+        print(f"{row['route']:<36}{row['bytes']:>8}{row['legacy_us']:>12}{row['current_us']:>12}{row['speedup']:>7}x")
+
+
+if __name__ == "__main__":
+    main()
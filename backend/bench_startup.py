@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark du démarrage à froid du backend (python -X importtime -c "import server")
+
+Usage: python bench_startup.py [--runs 5] [--top 15] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+# Modules qui ne doivent pas être chargés à l'import de server.py
+HEAVY_MODULES = ("pandas", "numpy", "motor", "pymongo.mongo_client", "requests", "langchain_openai", "pyarrow")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_once():
+    """Lance un interpréteur neuf, retourne (temps total µs, {module: (self, cumulé)})"""
+    code = "import server"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules.get("server", (0, 0))[1], modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    totals, last = [], {}
+    for _ in range(args.runs):
+        total, last = run_once()
+        totals.append(total)
+
+    top = sorted(last.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    report = {
+        "runs": args.runs,
+        "import_server_ms": {
+            "median": round(statistics.median(totals) / 1000, 1),
+            "min": round(min(totals) / 1000, 1),
+            "max": round(max(totals) / 1000, 1),
+        },
+        "heavy_modules_loaded": [m for m in HEAVY_MODULES if m in last],
+        "top_self_ms": [{"module": m, "self_ms": round(s / 1000, 1), "cumulative_ms": round(c / 1000, 1)}
+                        for m, (s, c) in top],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print("🚀 Démarrage à froid - import server")
+    print("=" * 50)
+    t = report["import_server_ms"]
+    print(f"import server: médiane {t['median']}ms (min {t['min']}ms, max {t['max']}ms) sur {args.runs} runs")
+    heavy = report["heavy_modules_loaded"]
+    print(f"Modules lourds chargés: {', '.join(heavy) if heavy else '✅ aucun'}")
+    print(f"\nTop {args.top} (temps propre):")
+    for row in report["top_self_ms"]:
+        print(f"  {row['self_ms']:>8.1f}ms  {row['cumulative_ms']:>8.1f}ms  {row['module']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark des status checks: mémoire par enregistrement et débit de GET /api/status
+
+Mémoire (tracemalloc) d'un enregistrement selon sa représentation: modèle Pydantic
+``StatusCheck``, document MongoDB (dict) et ``StatusRecord`` compact (UUID sur 16
+octets, horodatage en ms). Débit de la liste (1000 status checks, lecture MongoDB
+exclue): ancien chemin Pydantic, dicts + orjson, vue en mémoire (corps en cache, et
+re-rendu après une écriture), ETag compris. Aucune base ni réseau nécessaires.
+
+Usage: python bench_status.py [--records 100000] [--number 200] [--json]
+"""
+import argparse
+import json
+import os
+import timeit
+import tracemalloc
+import uuid
+import warnings
+from datetime import datetime, timedelta
+from typing import List
+
+os.environ.setdefault("WARMUP_IMPORTS", "0")
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import server
+from responses import etag_for, json_response
+from status_cache import StatusCache, StatusRecord
+
+CLIENTS = [f"client-{i}" for i in range(50)]
+
+
+def make_documents(count: int) -> List[dict]:
+    start = datetime(2024, 5, 10)
+    # Horodatages à la ms, comme relus depuis MongoDB
+    return [
+        {"id": str(uuid.uuid4()), "client_name": CLIENTS[i % len(CLIENTS)],
+         "timestamp": start + timedelta(milliseconds=37 * i)}
+        for i in range(count)
+    ]
+
+
+def bytes_per_record(build, documents: List[dict]) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build(documents)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(kept) == len(documents)
+    return (after - before) / len(documents)
+
+
+def memory_report(count: int) -> List[dict]:
+    representations = {
+        "StatusCheck (Pydantic)": lambda docs: [server.StatusCheck(**d) for d in docs],
+        "document MongoDB (dict)": lambda docs: [
+            {"id": d["id"], "client_name": d["client_name"], "timestamp": d["timestamp"] + timedelta(0)} for d in docs
+        ],
+        "StatusRecord": lambda docs: [StatusRecord.from_document(d) for d in docs],
+    }
+    # Chaînes et datetimes recopiés à chaque construction: le coût mesuré inclut les champs
+    documents = json.loads(json.dumps(make_documents(count), default=str))
+    for document in documents:
+        document["timestamp"] = datetime.fromisoformat(document["timestamp"])
+    return [
+        {"representation": name, "bytes_per_record": round(bytes_per_record(build, documents), 1)}
+        for name, build in representations.items()
+    ]
+
+
+def throughput_report(number: int) -> List[dict]:
+    documents = make_documents(1000)
+    adapter = TypeAdapter(List[server.StatusCheck])
+    cache = StatusCache(capacity=1000)
+    for document in documents:
+        cache.add(document)
+
+    def cache_after_write():
+        cache.add_record(StatusRecord.new("client-0"))
+        return cache.rendered()[0]
+
+    paths = {
+        "Pydantic + jsonable_encoder": lambda: JSONResponse(jsonable_encoder(adapter.validate_python(documents))).body,
+        "dicts MongoDB + orjson": lambda: etag_for(json_response(documents).body),
+        "vue en mémoire (cache)": lambda: cache.rendered()[0],
+        "vue en mémoire (après écriture)": cache_after_write,
+    }
+    assert json.loads(cache.rendered()[0]) == json.loads(json_response(documents).body)
+    report = []
+    for name, path in paths.items():
+        seconds = min(timeit.repeat(path, number=number, repeat=3)) / number
+        report.append({"path": name, "us_per_request": round(seconds * 1e6, 1),
+                       "requests_per_s": round(1 / seconds) if seconds else None})
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = {"memory": memory_report(args.records), "list_endpoint": throughput_report(args.number)}
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"🧠 Mémoire par status check ({args.records} enregistrements)")
+    print("=" * 60)
+    for row in report["memory"]:
+        print(f"{row['representation']:<36}{row['bytes_per_record']:>12} octets")
+    print()
+    print("⚡ GET /api/status, 1000 status checks (hors lecture MongoDB)")
+    print("=" * 60)
+    for row in report["list_endpoint"]:
+        print(f"{row['path']:<36}{row['us_per_request']:>10} µs{row['requests_per_s']:>10} req/s")
+
+
+if __name__ == "__main__":
+    main()
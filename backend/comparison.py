@@ -0,0 +1,321 @@
+"""Mode comparaison: classement de plusieurs tickers à la même date.
+
+"Lequel de ces 20 semi-conducteurs acheter aujourd'hui?" demandait jusqu'ici 20
+analyses complètes (analystes, débat, trader, risque, portefeuille) puis une
+comparaison manuelle. Ici:
+
+1. rapports d'analystes par ticker, en parallèle (au plus ``COMPARISON_CONCURRENCY``
+   tickers à la fois); ceux déjà calculés par une analyse ou une comparaison
+   précédente (mêmes ticker, date et analystes) sont réutilisés. Chaque ticker
+   calculé devient un job ``partial`` qu'une analyse complète reprendra à la
+   phase de recherche;
+2. contexte commun calculé une seule fois: actualité générale du marché et
+   fondamentaux du groupe (médianes et position de chaque ticker), résumés en un
+   appel LLM;
+3. un seul appel de classement sur l'ensemble: liste ordonnée avec score, décision
+   et justification.
+
+Soit ``len(analysts)`` appels par ticker non encore calculé, plus deux, au lieu de
+``len(analysts) + 2 × research_depth + 3`` par ticker.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import statistics
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import agents
+import ledger
+import pipeline
+import prompt_context
+import tenants
+import tracing
+import upstream
+import workers
+from fairqueue import BATCH
+from realtime import hub
+
+logger = logging.getLogger(__name__)
+
+COMPARISON_MAX_TICKERS = int(os.environ.get("COMPARISON_MAX_TICKERS", 30))
+COMPARISON_CONCURRENCY = int(os.environ.get("COMPARISON_CONCURRENCY", 8))
+# Part du prompt de classement accordée à chaque ticker (rapports résumés au-delà)
+RANKING_TOKENS_PER_TICKER = 400
+RANKING_RESERVED_TOKENS = 2500
+MARKET_NEWS_LIMIT = 15
+
+# Fondamentaux comparés entre tickers (clé FinnHub -> libellé)
+PEER_METRICS = {
+    "peTTM": "PER",
+    "52WeekPriceReturnDaily": "perf. 52 sem. %",
+    "revenueGrowthTTMYoy": "croissance CA %",
+    "netProfitMarginTTM": "marge nette %",
+    "beta": "bêta",
+}
+
+# Tolère le balisage Markdown courant des réponses (gras, lignes de tableau, "82/100")
+RANKING_PATTERN = re.compile(
+    r"^\W*(?:\d+\s*[.)\-:]\s*)?\**([A-Za-z][A-Za-z0-9.\-]{0,9})\**\s*\|"
+    r"\s*\**SCORE\**\s*:\s*\**(\d{1,3}(?:[.,]\d+)?)(?:\s*/\s*100)?\**"
+    r"\s*\|\s*\**DECISION\**\s*:\s*\**(BUY|SELL|HOLD)\**\s*(?:\|\s*(.*))?$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+class ComparisonError(ValueError):
+    pass
+
+
+def normalize_tickers(tickers: List[str]) -> List[str]:
+    """Tickers en majuscules, doublons retirés (ordre conservé), nombre borné"""
+    unique = list(dict.fromkeys(t.strip().upper() for t in tickers if t.strip()))
+    if len(unique) < 2:
+        raise ComparisonError("Au moins deux tickers distincts sont nécessaires")
+    if len(unique) > COMPARISON_MAX_TICKERS:
+        raise ComparisonError(f"Au plus {COMPARISON_MAX_TICKERS} tickers par comparaison ({len(unique)} demandés)")
+    return unique
+
+
+def single_analysis_calls(config: dict) -> int:
+    """Appels LLM d'une analyse complète (base de comparaison)"""
+    return len(config["analysts"]) + 2 * config["research_depth"] + 3
+
+
+async def ensure_indexes(db):
+    await db.comparisons.create_index("id", unique=True)
+    await db.comparisons.create_index("created_at")
+
+
+async def get_comparison(db, comparison_id: str) -> Optional[dict]:
+    return await db.comparisons.find_one({"id": comparison_id}, {"_id": 0})
+
+
+# --- Étape 1: rapports par ticker ---
+
+async def _ticker_reports(db, comparison_id: str, config: dict, ticker: str,
+                          semaphore: asyncio.Semaphore, progress: dict) -> dict:
+    ticker_config = {"ticker": ticker, "analysis_date": config["analysis_date"],
+                     "analysts": config["analysts"], "research_depth": config["research_depth"]}
+    found = await pipeline.find_analyst_reports(db, ticker_config)
+    if found is not None:
+        job, outputs = found
+        entry = {"ticker": ticker, "source": "cached", "job_id": job["id"], "llm_calls": 0,
+                 "reports": outputs["analysts"]["reports"], "decision": outputs.get("portfolio")}
+    else:
+        # Travail de masse: places de worker et slots LLM cédés aux analyses interactives
+        tenants.current_priority.set(BATCH)
+        async with semaphore:
+            job_id = str(uuid.uuid4())
+            await pipeline.create_job(db, job_id, ticker_config)
+            outputs = await workers.supervisor.run_pipeline(db, job_id, ticker_config, until_phase="analysts")
+        simulated = upstream.mode() == "simulated"
+        entry = {"ticker": ticker, "source": "computed", "job_id": job_id,
+                 "llm_calls": 0 if simulated else len(config["analysts"]),
+                 "reports": outputs["analysts"]["reports"], "decision": None,
+                 "token_usage": outputs["analysts"].get("token_usage")}
+    progress["done"] += 1
+    hub.publish(f"comparison:{comparison_id}", {"stage": "analysts", **progress})
+    return entry
+
+
+# --- Étape 2: contexte commun ---
+
+async def _peer_metrics(tickers: List[str]) -> Dict[str, dict]:
+    """Fondamentaux de chaque ticker (déjà en cache si l'analyste fondamental a tourné)"""
+    async def fetch(ticker: str) -> dict:
+        try:
+            data = await upstream.finnhub_get("/stock/metric", {"symbol": ticker, "metric": "all"},
+                                              cache_ttl=upstream.FINNHUB_CACHE_SECONDS)
+        except upstream.CassetteMiss:
+            raise
+        except Exception as e:
+            logger.info(f"Fondamentaux {ticker} indisponibles pour la comparaison: {e}")
+            return {}
+        metrics = (data or {}).get("metric") or {}
+        return {key: metrics[key] for key in PEER_METRICS if isinstance(metrics.get(key), (int, float))}
+
+    return dict(zip(tickers, await asyncio.gather(*[fetch(t) for t in tickers])))
+
+
+def peer_table(metrics: Dict[str, dict]) -> dict:
+    """Médiane du groupe par indicateur et valeurs de chaque ticker, libellés lisibles"""
+    medians = {}
+    for key in PEER_METRICS:
+        values = [m[key] for m in metrics.values() if key in m]
+        if values:
+            medians[key] = round(statistics.median(values), 2)
+    return {
+        "medians": {PEER_METRICS[k]: v for k, v in medians.items()},
+        "tickers": {
+            ticker: {PEER_METRICS[k]: round(v, 2) for k, v in m.items()}
+            for ticker, m in metrics.items()
+        },
+    }
+
+
+async def _market_news() -> List[dict]:
+    try:
+        articles = await upstream.finnhub_get("/news", {"category": "general"},
+                                              cache_ttl=upstream.FINNHUB_CACHE_SECONDS) or []
+    except upstream.CassetteMiss:
+        raise
+    except Exception as e:
+        logger.info(f"Actualité générale indisponible pour la comparaison: {e}")
+        return []
+    return [{"headline": a.get("headline"), "summary": (a.get("summary") or "")[:200]}
+            for a in articles[:MARKET_NEWS_LIMIT] if isinstance(a, dict)]
+
+
+async def shared_context(config: dict, tickers: List[str]) -> dict:
+    """Contexte secteur et macro commun à tous les tickers, calculé une fois"""
+    if upstream.mode() == "simulated":
+        return {
+            "summary": f"Contexte simulé du marché au {config['analysis_date']} pour {len(tickers)} tickers.",
+            "peers": {"medians": {}, "tickers": {}},
+            "llm_calls": 0,
+        }
+    news, metrics = await asyncio.gather(_market_news(), _peer_metrics(tickers))
+    peers = peer_table(metrics)
+    with ledger.attribute(agent="macro"):
+        summary, usage = await agents.summarize_market(config, tickers, peers["medians"], news)
+    return {"summary": summary, "peers": peers, "llm_calls": 1, "token_usage": usage}
+
+
+# --- Étape 3: classement ---
+
+def _digest(entry: dict, max_tokens: int) -> str:
+    """Rapports d'un ticker dédoublonnés et raccourcis pour le prompt de classement"""
+    reports = prompt_context.dedupe_blocks(entry["reports"])
+    text = "\n".join(f"[{analyst}] {report}" for analyst, report in reports.items())
+    if entry.get("decision"):
+        previous = entry["decision"]
+        text += f"\n[analyse complète] {previous.get('decision')} (confiance {previous.get('confidence')})"
+    return prompt_context.truncate_tokens(text, max_tokens)
+
+
+def parse_ranking(text: str, tickers: List[str]) -> Dict[str, dict]:
+    """Lignes ``TICKER | SCORE: n | DECISION: x | justification`` des tickers demandés"""
+    known = set(tickers)
+    ranked: Dict[str, dict] = {}
+    for match in RANKING_PATTERN.finditer(text):
+        ticker = match.group(1).upper()
+        if ticker in known and ticker not in ranked:
+            ranked[ticker] = {
+                "score": min(100.0, float(match.group(2).replace(",", "."))),
+                "decision": match.group(3).upper(),
+                "rationale": (match.group(4) or "").strip().rstrip("|").strip(),
+            }
+    return ranked
+
+
+def _ordered(entries: List[dict], ranked: Dict[str, dict]) -> List[dict]:
+    rows = []
+    for entry in entries:
+        ticker = entry["ticker"]
+        row = ranked.get(ticker)
+        if row is None:
+            previous = entry.get("decision") or {}
+            row = {"score": None, "decision": previous.get("decision", "HOLD"), "rationale": "Absent du classement"}
+        rows.append({"ticker": ticker, **row, "source": entry["source"], "job_id": entry["job_id"]})
+    # Tri stable: à score égal, l'ordre donné par le classeur est conservé
+    order = {ticker: index for index, ticker in enumerate(ranked)}
+    rows.sort(key=lambda r: (r["score"] is None, -(r["score"] or 0), order.get(r["ticker"], len(order))))
+    return [{"rank": index + 1, **row} for index, row in enumerate(rows)]
+
+
+async def rank(config: dict, entries: List[dict], context: dict) -> dict:
+    tickers = [e["ticker"] for e in entries]
+    if upstream.mode() == "simulated":
+        ranked = {}
+        for ticker in tickers:
+            score = pipeline._seed(ticker, config["analysis_date"], "comparison") % 101
+            decision = "BUY" if score >= 65 else "SELL" if score <= 35 else "HOLD"
+            ranked[ticker] = {"score": float(score), "decision": decision,
+                              "rationale": f"Score simulé {score}/100"}
+        return {"ranking": _ordered(entries, ranked), "llm_calls": 0}
+
+    budget = prompt_context.ROLE_BUDGETS["comparison_ranker"]
+    per_ticker = max(80, min(RANKING_TOKENS_PER_TICKER, (budget - RANKING_RESERVED_TOKENS) // len(entries)))
+    peers = context["peers"]["tickers"]
+    dossiers = "\n\n".join(
+        f"## {e['ticker']}\nFondamentaux: {json.dumps(peers.get(e['ticker'], {}), ensure_ascii=False)}\n"
+        f"{_digest(e, per_ticker)}"
+        for e in entries
+    )
+    with ledger.attribute(agent="ranking"):
+        text, usage = await agents.rank_tickers(config, tickers, context["summary"], dossiers)
+    ranked = parse_ranking(text, tickers)
+    if len(ranked) < len(tickers):
+        logger.warning(f"Classement incomplet: {len(ranked)}/{len(tickers)} tickers reconnus")
+    return {"ranking": _ordered(entries, ranked), "llm_calls": 1, "token_usage": usage}
+
+
+# --- Orchestration ---
+
+def _total_usage(*usages: Optional[dict]) -> dict:
+    total = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "tokens_saved": 0}
+    for usage in usages:
+        for key in total:
+            total[key] += (usage or {}).get(key, 0)
+    return total
+
+
+async def run_comparison(db, config: dict) -> dict:
+    """Compare les tickers de ``config`` et enregistre le classement dans ``comparisons``"""
+    tickers = normalize_tickers(config["tickers"])
+    config = {**config, "tickers": tickers}
+    comparison_id = str(uuid.uuid4())
+    start = time.perf_counter()
+    document = {"id": comparison_id, "config": config, "mode": upstream.mode(),
+                "status": "running", "created_at": datetime.utcnow()}
+    await db.comparisons.insert_one(dict(document))
+    progress = {"done": 0, "total": len(tickers)}
+    semaphore = asyncio.Semaphore(COMPARISON_CONCURRENCY)
+    try:
+        with tracing.span("comparison", **{"comparison.id": comparison_id, "comparison.tickers": len(tickers)}), \
+                ledger.attribute(analysis_id=comparison_id, comparison_id=comparison_id):
+            # Le contexte commun se calcule pendant les rapports par ticker
+            context_task = asyncio.create_task(shared_context(config, tickers))
+            try:
+                entries = await asyncio.gather(*[
+                    _ticker_reports(db, comparison_id, config, t, semaphore, progress) for t in tickers
+                ])
+            except BaseException:
+                context_task.cancel()
+                raise
+            context = await context_task
+            hub.publish(f"comparison:{comparison_id}", {"stage": "ranking", **progress})
+            ranking = await rank(config, entries, context)
+    except Exception as e:
+        logger.error(f"Comparaison {comparison_id} en échec: {e}")
+        await db.comparisons.update_one({"id": comparison_id}, {"$set": {"status": "failed", "error": str(e)}})
+        hub.publish(f"comparison:{comparison_id}", {"stage": "failed", "error": str(e)})
+        raise
+
+    analyst_calls = sum(e["llm_calls"] for e in entries)
+    total_calls = analyst_calls + context["llm_calls"] + ranking["llm_calls"]
+    result = {
+        "status": "completed",
+        "ranking": ranking["ranking"],
+        "context": {"summary": context["summary"], "peers": context["peers"]},
+        "reused": [e["ticker"] for e in entries if e["source"] == "cached"],
+        "llm_calls": {
+            "analysts": analyst_calls,
+            "context": context["llm_calls"],
+            "ranking": ranking["llm_calls"],
+            "total": total_calls,
+            # Même question posée en analyses complètes indépendantes
+            "independent_analyses": 0 if upstream.mode() == "simulated" else single_analysis_calls(config) * len(tickers),
+        },
+        "token_usage": _total_usage(*[e.get("token_usage") for e in entries],
+                                    context.get("token_usage"), ranking.get("token_usage")),
+        "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    await db.comparisons.update_one({"id": comparison_id}, {"$set": result})
+    hub.publish(f"comparison:{comparison_id}", {"stage": "completed", **progress})
+    return {**document, **result}
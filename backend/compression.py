@@ -0,0 +1,156 @@
+"""Middleware ASGI de compression des réponses (brotli si disponible, sinon gzip).
+
+Même principe que ``GZipMiddleware`` de Starlette, avec choix de l'encodage selon
+``Accept-Encoding``, seuil de taille et prise en charge des réponses en streaming.
+"""
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # gzip uniquement
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript")
+
+
+class _Compressor:
+    def __init__(self, encoding: str, level: Optional[int]):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=level if level is not None else 4)
+        else:
+            self._obj = zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.finish() if self.encoding == "br" else self._obj.flush()
+
+
+def _accepted(accept_encoding: str) -> dict:
+    """Encodages acceptés et leur poids ``q`` (``q=0``: refusé)"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.lower().startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    weights = {encoding: accepted.get(encoding, wildcard) for encoding in candidates}
+    best = max(candidates, key=lambda encoding: weights[encoding])  # égalité: brotli d'abord
+    return best if weights[best] > 0 else None
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+            if encoding:
+                responder = _Responder(self.app, encoding, self.levels[encoding], self.minimum_size)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class _Responder:
+    def __init__(self, app: ASGIApp, encoding: str, level: int, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+        self.negotiated = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def _mark_negotiated(self, headers: MutableHeaders):
+        """Même validateur et même ``Vary`` pour toutes les réponses de cet encodage (200 compressé,
+        200 sous le seuil, 304): les caches distinguent les représentations"""
+        headers.add_vary_header("Accept-Encoding")
+        if headers.get("etag", "").startswith('"'):
+            headers["ETag"] = headers["etag"][:-1] + f'-{self.encoding}"'
+
+    async def send_compressed(self, message: Message):
+        if message["type"] == "http.response.start":
+            # En attente du premier morceau de corps pour décider de compresser
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+            # Représentation qui dépend d'Accept-Encoding, même servie sans compression:
+            # type compressible, ou 304 (sans Content-Type) d'une réponse conditionnelle
+            self.negotiated = "content-encoding" not in headers and (
+                content_type.startswith(COMPRESSIBLE_TYPES) or message["status"] == 304
+            )
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            start, self.start_message = self.start_message, None
+            if self.passthrough or (not more_body and len(body) < self.minimum_size):
+                self.passthrough = True
+                if self.negotiated:
+                    self._mark_negotiated(MutableHeaders(raw=start["headers"]))
+                await self.send(start)
+                await self.send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding, self.level)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            self._mark_negotiated(headers)
+            payload = self.compressor.compress(body)
+            if not more_body:
+                payload += self.compressor.finish()
+                headers["Content-Length"] = str(len(payload))
+            elif "content-length" in headers:
+                del headers["Content-Length"]
+            await self.send(start)
+            await self.send({"type": "http.response.body", "body": payload, "more_body": more_body})
+            return
+
+        if self.passthrough:
+            await self.send(message)
+            return
+        payload = self.compressor.compress(body)
+        if not more_body:
+            payload += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": payload, "more_body": more_body})
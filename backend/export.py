@@ -0,0 +1,187 @@
+"""Export en flux des status checks et des résultats d'analyse (NDJSON ou Arrow IPC).
+
+Les documents sont lus par lots (``batch_size``) sur un curseur MongoDB trié par
+(horodatage, id) et envoyés au fil de l'eau: la mémoire du serveur ne dépend que de
+la taille d'un lot, quel que soit le volume exporté, et l'envoi suit le rythme du
+client (contre-pression de la réponse en streaming).
+
+Filtre de période ``since``/``until`` (bornes incluse/exclue) sur l'horodatage. Pour
+reprendre un export interrompu, le client renvoie l'``id`` du dernier enregistrement
+reçu (``resume_after``): l'export repart juste après, dans le même ordre.
+
+Arrow IPC (format stream) nécessite pyarrow; NDJSON est toujours disponible.
+"""
+import importlib.util
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from lazy import lazy_module
+
+try:
+    import orjson
+except ImportError:  # json standard, plus lent
+    orjson = None
+
+# pyarrow (et numpy) chargés au premier export Arrow seulement, pas au démarrage du serveur
+ARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None  # sinon export NDJSON uniquement
+pyarrow = lazy_module("pyarrow")
+pyarrow_ipc = lazy_module("pyarrow.ipc")
+
+DEFAULT_BATCH_SIZE = 1000
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "arrow": "application/vnd.apache.arrow.stream"}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def _status_schema():
+    return pyarrow.schema([
+        ("id", pyarrow.string()),
+        ("client_name", pyarrow.string()),
+        ("timestamp", pyarrow.timestamp("ms")),
+    ])
+
+
+def _analysis_schema():
+    token_usage = pyarrow.struct([
+        ("prompt_tokens", pyarrow.int64()),
+        ("completion_tokens", pyarrow.int64()),
+        ("total_tokens", pyarrow.int64()),
+        ("tokens_saved", pyarrow.int64()),
+    ])
+    return pyarrow.schema([
+        ("id", pyarrow.string()),
+        ("ticker", pyarrow.string()),
+        ("analysis_date", pyarrow.string()),
+        ("analysts", pyarrow.list_(pyarrow.string())),
+        ("research_depth", pyarrow.int32()),
+        ("llm_model", pyarrow.string()),
+        ("decision", pyarrow.string()),
+        ("confidence", pyarrow.float64()),
+        ("token_usage", token_usage),
+        ("report_bytes", pyarrow.int64()),
+        ("parent_id", pyarrow.string()),
+        ("created_at", pyarrow.timestamp("ms")),
+    ])
+
+
+@dataclass
+class Dataset:
+    collection: str
+    time_field: str
+    arrow_schema: Callable
+
+
+DATASETS = {
+    "status_checks": Dataset("status_checks", "timestamp", _status_schema),
+    # Résumés uniquement: les rapports compressés restent accessibles par analyse
+    "analyses": Dataset("analyses", "created_at", _analysis_schema),
+}
+
+
+async def ensure_indexes(db):
+    for dataset in DATASETS.values():
+        await db[dataset.collection].create_index([(dataset.time_field, 1), ("id", 1)])
+    await db.status_checks.create_index("id")
+
+
+async def open_cursor(db, name: str, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      resume_after: Optional[str] = None, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Curseur trié (horodatage, id) sur la période, repris après ``resume_after``"""
+    dataset = DATASETS.get(name)
+    if dataset is None:
+        raise ExportError(f"Jeu de données inconnu: {name} ({', '.join(DATASETS)})")
+    collection = db[dataset.collection]
+    time_field = dataset.time_field
+    clauses = []
+    if since or until:
+        period = {}
+        if since:
+            period["$gte"] = since
+        if until:
+            period["$lt"] = until
+        clauses.append({time_field: period})
+    if resume_after:
+        last = await collection.find_one({"id": resume_after}, {"_id": 0, time_field: 1})
+        if last is None:
+            raise ExportError(f"resume_after inconnu: {resume_after}")
+        clauses.append({"$or": [
+            {time_field: {"$gt": last[time_field]}},
+            {time_field: last[time_field], "id": {"$gt": resume_after}},
+        ]})
+    query = {"$and": clauses} if clauses else {}
+    cursor = collection.find(query, {"_id": 0}).sort([(time_field, 1), ("id", 1)]).batch_size(batch_size)
+    return dataset, cursor
+
+
+async def _batches(cursor, batch_size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    try:
+        async for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        # Client déconnecté en cours d'export: libère le curseur côté serveur
+        await cursor.close()
+
+
+def _ndjson_line(document: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(document, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(document, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+
+async def stream_ndjson(cursor, batch_size: int = DEFAULT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Une ligne JSON par document, un bloc envoyé par lot"""
+    async for batch in _batches(cursor, batch_size):
+        yield b"".join(_ndjson_line(document) for document in batch)
+
+
+class _Drain:
+    """Sortie fichier pour pyarrow: les octets écrits sont récupérés après chaque lot"""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+async def stream_arrow(cursor, dataset: Dataset, batch_size: int = DEFAULT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Flux Arrow IPC: un RecordBatch par lot de documents"""
+    schema = dataset.arrow_schema()
+    drain = _Drain()
+    writer = pyarrow_ipc.new_stream(pyarrow.PythonFile(drain, mode="w"), schema)
+    try:
+        async for batch in _batches(cursor, batch_size):
+            writer.write_batch(pyarrow.RecordBatch.from_pylist(batch, schema=schema))
+            yield drain.take()
+    finally:
+        writer.close()
+    yield drain.take()
+
+
+def content(format: str) -> Tuple[str, str]:
+    """Type MIME et extension de fichier du format demandé"""
+    if format == "arrow" and not ARROW_AVAILABLE:
+        raise ExportError("Export Arrow indisponible: pyarrow n'est pas installé")
+    if format not in MEDIA_TYPES:
+        raise ExportError(f"Format inconnu: {format} ({', '.join(MEDIA_TYPES)})")
+    return MEDIA_TYPES[format], "arrows" if format == "arrow" else "ndjson"
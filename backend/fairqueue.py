@@ -0,0 +1,124 @@
+"""Ordonnancement équitable pondéré (WFQ) des appels au pool LLM.
+
+Chaque tenant est un flux avec un poids; une requête reçoit une étiquette de fin
+virtuelle ``max(V, dernière_fin_du_flux) + coût / poids`` et les slots libres sont
+attribués par étiquette croissante. Les requêtes ``interactive`` passent avant les
+``batch`` et disposent de slots réservés: une analyse ponctuelle trouve toujours
+une place même quand un batch sature l'upstream.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, Callable, Dict, List, Optional
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+_CLASS_RANK = {INTERACTIVE: 0, BATCH: 1}
+
+
+class FairScheduler:
+    def __init__(self, capacity: int, interactive_reserve: int):
+        self.capacity = capacity
+        self.interactive_reserve = min(interactive_reserve, capacity - 1) if capacity > 1 else 0
+        self.in_flight = {INTERACTIVE: 0, BATCH: 0}
+        self.virtual_time = 0.0
+        self.last_finish: Dict[str, float] = {}
+        self._heap: List[tuple] = []
+        self._order = itertools.count()
+        self._delegate: Optional[Callable[..., AsyncContextManager]] = None
+
+    def delegate(self, slot: Callable[..., AsyncContextManager]):
+        """Processus worker (voir ``workers``): slots demandés au scheduler du processus serveur"""
+        self._delegate = slot
+
+    @property
+    def waiting(self) -> int:
+        return len(self._heap)
+
+    def waiting_for(self, priority: str) -> int:
+        return sum(1 for entry in self._heap if entry[3] == priority and not entry[4].done())
+
+    def _can_start(self, priority: str) -> bool:
+        total = self.in_flight[INTERACTIVE] + self.in_flight[BATCH]
+        if total >= self.capacity:
+            return False
+        if priority == BATCH:
+            return self.in_flight[BATCH] < self.capacity - self.interactive_reserve
+        return True
+
+    def _dispatch(self):
+        # Le tas est ordonné (classe, étiquette); un batch bloqué par la réserve laisse passer
+        # les interactifs suivants, d'où le parcours des éléments mis de côté
+        skipped = []
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            _, finish, _, priority, future, _ = entry
+            if future.done():
+                continue
+            if not self._can_start(priority):
+                skipped.append(entry)
+                if self.in_flight[INTERACTIVE] + self.in_flight[BATCH] >= self.capacity:
+                    break
+                continue
+            self.in_flight[priority] += 1
+            self.virtual_time = max(self.virtual_time, finish)
+            future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+
+    def _withdraw(self, flow: str, finish: float, share: float):
+        """Requête annulée avant d'obtenir un slot: le flux récupère la part qu'elle avait réservée"""
+        self.last_finish[flow] -= share
+        shifted = False
+        for index, entry in enumerate(self._heap):
+            # Requêtes suivantes du même flux: étiquettes calculées à partir de celle annulée
+            if entry[5] == flow and entry[1] > finish and not entry[4].done():
+                self._heap[index] = (entry[0], entry[1] - share, *entry[2:])
+                shifted = True
+        if shifted:
+            heapq.heapify(self._heap)
+
+    @asynccontextmanager
+    async def slot(self, flow: str, weight: float = 1.0, priority: str = INTERACTIVE, cost: float = 1.0):
+        priority = priority if priority in _CLASS_RANK else INTERACTIVE
+        if self._delegate is not None:
+            async with self._delegate(flow, weight, priority, cost):
+                yield
+            return
+        share = cost / max(weight, 0.01)
+        start = max(self.virtual_time, self.last_finish.get(flow, 0.0))
+        finish = start + share
+        self.last_finish[flow] = finish
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (_CLASS_RANK[priority], finish, next(self._order), priority, future, flow))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.in_flight[priority] -= 1
+                self._dispatch()
+            else:
+                self._withdraw(flow, finish, share)
+            raise
+        try:
+            yield
+        finally:
+            self.in_flight[priority] -= 1
+            self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "interactive_reserve": self.interactive_reserve,
+            "in_flight": dict(self.in_flight),
+            "waiting": self.waiting,
+        }
+
+
+llm_scheduler = FairScheduler(
+    capacity=int(os.environ.get("LLM_MAX_CONCURRENCY", 8)),
+    interactive_reserve=int(os.environ.get("LLM_INTERACTIVE_RESERVE", 2)),
+)
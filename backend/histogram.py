@@ -0,0 +1,88 @@
+"""Histogramme de latences à la HdrHistogram (log-linéaire, ~0.4 % de précision relative).
+
+Mémoire bornée quel que soit le nombre de mesures; fusion possible entre histogrammes
+et export de la distribution au format texte ``.hgrm`` (HdrHistogram plotter).
+Valeurs entières, en microsecondes par convention.
+"""
+import math
+from collections import defaultdict
+from typing import Dict
+
+
+class Histogram:
+    def __init__(self, sub_bits: int = 8):
+        self.sub_bits = sub_bits
+        self.counts: Dict[tuple, int] = defaultdict(int)
+        self.total = 0
+        self.sum = 0
+        self.sum_squares = 0
+        self.max = 0
+
+    def _key(self, value: int) -> tuple:
+        shift = max(0, value.bit_length() - self.sub_bits - 1)
+        return shift, value >> shift
+
+    @staticmethod
+    def _value(key: tuple) -> int:
+        shift, sub = key
+        return ((sub + 1) << shift) - 1 if shift else sub
+
+    def record(self, value_us: float):
+        value = max(0, int(value_us))
+        self.counts[self._key(value)] += 1
+        self.total += 1
+        self.sum += value
+        self.sum_squares += value * value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram"):
+        for key, count in other.counts.items():
+            self.counts[key] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.sum_squares += other.sum_squares
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """Valeur (µs) sous laquelle se trouvent q % des mesures"""
+        if not self.total:
+            return 0.0
+        target = max(1, math.ceil(self.total * q / 100))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= target:
+                return min(self._value(key), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.total if self.total else 0.0
+
+    def to_hgrm(self, unit: float = 1000.0) -> str:
+        """Distribution au format texte HdrHistogram (valeurs en ms)"""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            fraction = seen / self.total
+            inverse = f"{1 / (1 - fraction):14.2f}" if fraction < 1 else f"{'inf':>14}"
+            lines.append(f"{min(self._value(key), self.max) / unit:12.3f} {fraction:14.12f} {seen:10d} {inverse}")
+        deviation = math.sqrt(max(0.0, self.sum_squares / self.total - self.mean ** 2)) if self.total else 0.0
+        lines += [
+            f"#[Mean    = {self.mean / unit:12.3f}, StdDeviation   = {deviation / unit:12.3f}]",
+            f"#[Max     = {self.max / unit:12.3f}, Total count    = {self.total:12d}]",
+            f"#[Buckets = {len(self.counts):12d}, SubBuckets     = {2 ** (self.sub_bits + 1):12d}]",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def summary(self, unit: float = 1000.0) -> dict:
+        """Nombre de mesures et percentiles usuels (en ms par défaut)"""
+        return {
+            "count": self.total,
+            "mean_ms": round(self.mean / unit, 3),
+            "p50_ms": round(self.percentile(50) / unit, 3),
+            "p95_ms": round(self.percentile(95) / unit, 3),
+            "p99_ms": round(self.percentile(99) / unit, 3),
+            "max_ms": round(self.max / unit, 3),
+        }
@@ -0,0 +1,475 @@
+"""Ingestion continue des actualités et du sentiment social par ticker.
+
+Étapes enchaînées en flux (générateurs asynchrones): collecte FinnHub incrémentale
+-> normalisation -> dédoublonnage (hash de contenu exact puis SimHash 64 bits pour
+les quasi-doublons, ex. dépêches reprises par plusieurs sites) -> score de
+sentiment par lots -> écriture dans ``news_items`` indexée par (ticker, published_at).
+
+Les analystes ``news`` et ``social`` lisent ensuite une fenêtre précalculée
+(``read_window``): ni téléchargement ni re-scoring par analyse. Les périodes couvertes
+par ticker (intervalles disjoints) sont suivies dans ``ingest_state``; seule la partie
+manquante d'une fenêtre est collectée, une fois, et chaque période n'est marquée
+couverte qu'une fois sa collecte écrite. Une collecte porte au plus sur
+``INGEST_MAX_DAYS`` jours.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Deque, Dict, Iterable, List, Optional, Tuple
+
+import tracing
+import upstream
+from lazy import lazy_module
+
+pymongo_errors = lazy_module("pymongo.errors")
+
+logger = logging.getLogger(__name__)
+
+INGEST_INTERVAL = int(os.environ.get("INGEST_INTERVAL_SECONDS", 900))
+INGEST_TICKERS = [t for t in os.environ.get("INGEST_TICKERS", "").upper().split(",") if t]
+# Recouvrement des collectes incrémentales (articles publiés avec retard)
+OVERLAP = timedelta(days=1)
+SENTIMENT_BATCH = 64
+SIMHASH_BITS = 64
+# Sur des titres + résumés courts: reprises à 6-7 bits, articles distincts à plus de 20
+NEAR_DUPLICATE_DISTANCE = 8
+# SimHash récents gardés en mémoire par ticker pour la détection des quasi-doublons
+SIMHASH_WINDOW = 2000
+# Hashes exacts récents par ticker; au-delà, l'index unique de news_items fait foi
+HASH_WINDOW = 10 * SIMHASH_WINDOW
+DEDUP_MAX_TICKERS = int(os.environ.get("INGEST_DEDUP_MAX_TICKERS", 500))
+INGEST_MAX_DAYS = int(os.environ.get("INGEST_MAX_DAYS", 31))
+DUPLICATE_KEY = 11000
+
+KINDS = ("news", "social")
+
+# Lexique financier minimal (titres FinnHub en anglais, quelques termes français)
+POSITIVE_WORDS = frozenset("""
+beat beats surge surges soar soars jump jumps rally rallies gain gains rise rises record strong growth
+upgrade upgrades outperform bullish profit profits buy raise raises raised boost boosts exceed exceeds
+expand expands partnership approval approved wins win rebound hausse croissance bénéfice record
+""".split())
+NEGATIVE_WORDS = frozenset("""
+miss misses plunge plunges drop drops fall falls slump slumps decline declines loss losses weak cut cuts
+downgrade downgrades underperform bearish sell lawsuit probe investigation recall risk risks warning
+warns layoffs fraud delay delays halt baisse perte chute risque
+""".split())
+
+_TOKENS = re.compile(r"[a-zà-ÿ']+")
+
+
+# --- Dédoublonnage ---
+
+def normalize(text: str) -> List[str]:
+    return _TOKENS.findall(text.lower())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(" ".join(normalize(text)).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str, bits: int = SIMHASH_BITS) -> int:
+    """SimHash des mots et bigrammes: deux textes proches ont peu de bits différents"""
+    words = normalize(text)
+    features = words + [" ".join(words[i:i + 2]) for i in range(len(words) - 1)]
+    weights = [0] * bits
+    for shingle in features:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _to_int64(value: int) -> int:
+    # BSON ne stocke que des entiers signés 64 bits
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _from_int64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+# --- Sentiment ---
+
+def score_batch(texts: List[str]) -> List[float]:
+    """Score lexical dans [-1, 1] pour un lot de textes"""
+    scores = []
+    for text in texts:
+        words = normalize(text)
+        positive = sum(1 for w in words if w in POSITIVE_WORDS)
+        negative = sum(1 for w in words if w in NEGATIVE_WORDS)
+        scores.append(round((positive - negative) / (positive + negative), 3) if positive + negative else 0.0)
+    return scores
+
+
+# --- Étapes du flux ---
+
+def _parse_news(ticker: str, article: dict, fallback: datetime) -> dict:
+    timestamp = article.get("datetime")
+    published_at = datetime.utcfromtimestamp(timestamp) if timestamp else fallback
+    headline = article.get("headline") or ""
+    summary = article.get("summary") or ""
+    return {
+        "ticker": ticker,
+        "kind": "news",
+        "published_at": published_at,
+        "headline": headline,
+        "summary": summary[:1000],
+        "source": article.get("source"),
+        "url": article.get("url"),
+        "text": f"{headline}. {summary}",
+    }
+
+
+def _parse_social(ticker: str, platform: str, entry: dict) -> dict:
+    published_at = datetime.strptime(entry["atTime"], "%Y-%m-%d %H:%M:%S")
+    return {
+        "ticker": ticker,
+        "kind": "social",
+        "published_at": published_at,
+        "source": platform,
+        "mention": entry.get("mention", 0),
+        "positive_mention": entry.get("positiveMention", 0),
+        "negative_mention": entry.get("negativeMention", 0),
+        # FinnHub fournit déjà un score agrégé par tranche horaire
+        "sentiment": entry.get("score"),
+        "text": f"{platform} {entry['atTime']}",
+    }
+
+
+async def fetch_items(ticker: str, kind: str, start: datetime, end: datetime) -> AsyncIterator[dict]:
+    # ``end`` est exclusif, le paramètre ``to`` de FinnHub inclusif
+    params = {"symbol": ticker, "from": start.strftime("%Y-%m-%d"),
+              "to": (end - timedelta(seconds=1)).strftime("%Y-%m-%d")}
+    if kind == "news":
+        for article in await upstream.finnhub_get("/company-news", params) or []:
+            yield _parse_news(ticker, article, end)
+    else:
+        data = await upstream.finnhub_get("/stock/social-sentiment", params) or {}
+        for platform in ("reddit", "twitter"):
+            for entry in data.get(platform) or []:
+                if entry.get("atTime"):
+                    yield _parse_social(ticker, platform, entry)
+
+
+class Deduplicator:
+    """Hashes exacts et SimHash des éléments écrits, par ticker (rechargés depuis MongoDB au besoin).
+
+    Mémoire bornée: ``HASH_WINDOW`` hashes et ``SIMHASH_WINDOW`` SimHash les plus récents
+    par ticker, ``DEDUP_MAX_TICKERS`` tickers (le moins récemment utilisé est oublié).
+    """
+
+    def __init__(self):
+        self.hashes: Dict[str, "OrderedDict[str, None]"] = defaultdict(OrderedDict)
+        self.simhashes: Dict[str, Deque[Tuple[int, str]]] = defaultdict(lambda: deque(maxlen=SIMHASH_WINDOW))
+        self.loaded: "OrderedDict[str, None]" = OrderedDict()
+
+    def _touch(self, ticker: str):
+        self.loaded[ticker] = None
+        self.loaded.move_to_end(ticker)
+        while len(self.loaded) > DEDUP_MAX_TICKERS:
+            oldest, _ = self.loaded.popitem(last=False)
+            self.hashes.pop(oldest, None)
+            self.simhashes.pop(oldest, None)
+
+    async def load(self, db, ticker: str):
+        if ticker in self.loaded:
+            self._touch(ticker)
+            return
+        self._touch(ticker)
+        cursor = db.news_items.find(
+            {"ticker": ticker}, {"_id": 0, "content_hash": 1, "simhash": 1, "kind": 1}
+        ).sort("published_at", -1).limit(SIMHASH_WINDOW)
+        docs = await cursor.to_list(None)
+        for doc in reversed(docs):  # du plus ancien au plus récent
+            self.remember(doc if doc.get("kind") != "news" or doc.get("simhash") is None
+                          else {**doc, "simhash": _from_int64(doc["simhash"])})
+
+    def check(self, item: dict, pending: Dict[str, dict]) -> Optional[str]:
+        """None si l'élément est nouveau (ajouté à ``pending`` jusqu'à son écriture), sinon le hash de l'original"""
+        ticker = item["ticker"]
+        if item["content_hash"] in self.hashes[ticker] or item["content_hash"] in pending:
+            return item["content_hash"]
+        if item["kind"] == "news":
+            for other, other_hash in self.simhashes[ticker]:
+                if hamming(item["simhash"], other) <= NEAR_DUPLICATE_DISTANCE:
+                    return other_hash
+            for other_hash, other in pending.items():
+                if other["kind"] == "news" and hamming(item["simhash"], other["simhash"]) <= NEAR_DUPLICATE_DISTANCE:
+                    return other_hash
+        pending[item["content_hash"]] = item
+        return None
+
+    def remember(self, item: dict):
+        """Élément présent en base: doublon pour les collectes suivantes"""
+        ticker = item["ticker"]
+        hashes = self.hashes[ticker]
+        hashes[item["content_hash"]] = None
+        while len(hashes) > HASH_WINDOW:
+            hashes.popitem(last=False)
+        if item.get("kind") == "news" and item.get("simhash") is not None:
+            self.simhashes[ticker].append((item["simhash"], item["content_hash"]))
+
+
+async def dedupe(items: AsyncIterator[dict], deduplicator: Deduplicator, stats: dict,
+                 pending: Dict[str, dict]) -> AsyncIterator[dict]:
+    async for item in items:
+        item["content_hash"] = content_hash(item["text"])
+        if item["kind"] == "news":
+            item["simhash"] = simhash(item["text"])
+        original = deduplicator.check(item, pending)
+        if original is None:
+            yield item
+        else:
+            stats["duplicates"] += 1
+            if original != item["content_hash"]:  # reprise d'un article (pas une simple re-collecte)
+                stats["duplicate_of"][original] += 1
+
+
+async def score(items: AsyncIterator[dict], batch_size: int = SENTIMENT_BATCH) -> AsyncIterator[List[dict]]:
+    batch: List[dict] = []
+
+    async def flush(batch):
+        pending = [item for item in batch if item.get("sentiment") is None]
+        if pending:
+            scores = await asyncio.to_thread(score_batch, [item["text"] for item in pending])
+            for item, value in zip(pending, scores):
+                item["sentiment"] = value
+        return batch
+
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield await flush(batch)
+            batch = []
+    if batch:
+        yield await flush(batch)
+
+
+async def store(db, batches: AsyncIterator[List[dict]], stats: dict, deduplicator: Deduplicator,
+                pending: Dict[str, dict]):
+    """Écrit les lots; seuls les éléments effectivement en base deviennent des doublons connus"""
+    async for batch in batches:
+        now = datetime.utcnow()
+        docs = []
+        for item in batch:
+            doc = {k: v for k, v in item.items() if k != "text"}
+            if "simhash" in doc:
+                doc["simhash"] = _to_int64(doc["simhash"])
+            doc.update(duplicates=0, ingested_at=now)
+            docs.append(doc)
+        failed = set()
+        try:
+            await db.news_items.insert_many(docs, ordered=False)
+            stats["stored"] += len(docs)
+        except pymongo_errors.BulkWriteError as e:
+            # Doublons concurrents (index unique): déjà en base, comme les documents écrits
+            errors = e.details.get("writeErrors", [])
+            failed = {error["index"] for error in errors if error.get("code") != DUPLICATE_KEY}
+            stats["stored"] += e.details.get("nInserted", 0)
+            if failed:
+                logger.warning(f"{len(failed)} actualité(s) non écrite(s): {errors[0].get('errmsg')}")
+        for index, item in enumerate(batch):
+            pending.pop(item["content_hash"], None)
+            if index not in failed:
+                deduplicator.remember(item)
+    # Nombre de reprises d'un même article: indicateur de diffusion
+    for original, count in stats["duplicate_of"].items():
+        await db.news_items.update_one({"content_hash": original}, {"$inc": {"duplicates": count}})
+
+
+# --- Ingesteur ---
+
+def _public(stats: dict) -> dict:
+    return {"stored": stats["stored"], "duplicates": stats["duplicates"]}
+
+
+def _missing(covered: List[Tuple[datetime, datetime]], start: datetime, end: datetime,
+             refresh: bool) -> List[Tuple[datetime, datetime]]:
+    """Parties de [start, end[ à collecter, hors des intervalles couverts (triés, disjoints).
+
+    Une partie qui prolonge une période couverte repart ``OVERLAP`` plus tôt (articles
+    publiés avec retard); ``refresh`` recollecte aussi le dernier jour de la fenêtre.
+    """
+    gaps, cursor = [], start
+    for covered_from, covered_to in covered:
+        if covered_to <= cursor:
+            continue
+        if covered_from >= end:
+            break
+        if covered_from > cursor:
+            gaps.append((max(start, cursor - OVERLAP) if cursor > start else cursor, covered_from))
+        cursor = max(cursor, covered_to)
+    if cursor < end:
+        gaps.append((max(start, cursor - OVERLAP) if cursor > start else cursor, end))
+    if refresh:
+        gaps.append((max(start, end - OVERLAP), end))
+    ranges: List[Tuple[datetime, datetime]] = []
+    for gap in sorted(gaps):
+        ranges = _merge(ranges, *gap)
+    return ranges
+
+
+def _merge(covered: List[Tuple[datetime, datetime]], start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    merged: List[Tuple[datetime, datetime]] = []
+    for interval_start, interval_end in sorted([*covered, (start, end)]):
+        if merged and interval_start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], interval_end))
+        else:
+            merged.append((interval_start, interval_end))
+    return merged
+
+
+def _covered(state: dict) -> List[Tuple[datetime, datetime]]:
+    if "covered" in state:
+        return [tuple(interval) for interval in state["covered"]]
+    # Ancien format: un seul intervalle
+    if state.get("covered_from") is not None:
+        return [(state["covered_from"], state["covered_to"])]
+    return []
+
+
+class Ingestor:
+    def __init__(self):
+        self.db = None
+        self.tickers = set(INGEST_TICKERS)
+        self.deduplicator = Deduplicator()
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db):
+        self.db = db
+        try:
+            await db.news_items.create_index([("ticker", 1), ("published_at", -1)])
+            await db.news_items.create_index([("ticker", 1), ("content_hash", 1)], unique=True)
+            await db.ingest_state.create_index([("ticker", 1), ("kind", 1)], unique=True)
+        except Exception as e:
+            logger.error(f"Index d'ingestion impossibles à créer: {e}")
+        if upstream.mode() != "simulated":
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def watch(self, ticker: str):
+        self.tickers.add(ticker.upper())
+
+    async def ingest(self, ticker: str, kind: str, start: datetime, end: datetime, refresh: bool = False) -> dict:
+        """Collecte la partie de [start, end[ non encore couverte et met à jour la couverture.
+
+        ``refresh``: recollecte aussi la fin de la période couverte (nouveaux articles du jour).
+        """
+        ticker = ticker.upper()
+        if end - start > timedelta(days=INGEST_MAX_DAYS):
+            logger.info(f"Ingestion {kind} {ticker}: période ramenée à {INGEST_MAX_DAYS} jours avant {end:%Y-%m-%d}")
+            start = end - timedelta(days=INGEST_MAX_DAYS)
+        async with self._locks[(ticker, kind)]:
+            state = await self.db.ingest_state.find_one({"ticker": ticker, "kind": kind}, {"_id": 0}) or {}
+            covered = _covered(state)
+            ranges = _missing(covered, start, end, refresh)
+            stats = {"stored": 0, "duplicates": 0, "duplicate_of": defaultdict(int)}
+            if not ranges:
+                return {"ticker": ticker, "kind": kind, "fetched": False, **_public(stats)}
+
+            with tracing.span(f"ingest {kind}", **{"ticker": ticker, "ingest.ranges": len(ranges)}) as span:
+                await self.deduplicator.load(self.db, ticker)
+                for range_start, range_end in ranges:
+                    pending: Dict[str, dict] = {}
+                    items = fetch_items(ticker, kind, range_start, range_end)
+                    await store(self.db, score(dedupe(items, self.deduplicator, stats, pending)), stats,
+                                self.deduplicator, pending)
+                    # Période marquée couverte seulement une fois collectée et écrite
+                    covered = _merge(covered, range_start, range_end)
+                    await self.db.ingest_state.update_one(
+                        {"ticker": ticker, "kind": kind},
+                        {"$set": {"covered": [list(interval) for interval in covered], "updated_at": datetime.utcnow()},
+                         "$unset": {"covered_from": "", "covered_to": ""}},
+                        upsert=True,
+                    )
+                span.set_attribute("ingest.stored", stats["stored"])
+                span.set_attribute("ingest.duplicates", stats["duplicates"])
+        return {"ticker": ticker, "kind": kind, "fetched": True, **_public(stats)}
+
+    async def ingest_recent(self, ticker: str, days: int = 7) -> List[dict]:
+        end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        return [await self.ingest(ticker, kind, end - timedelta(days=days), end, refresh=True) for kind in KINDS]
+
+    async def _loop(self):
+        while True:
+            for ticker in sorted(self.tickers):
+                try:
+                    await self.ingest_recent(ticker)
+                except Exception as e:
+                    logger.warning(f"Ingestion {ticker} en échec: {e}")
+            await asyncio.sleep(INGEST_INTERVAL)
+
+
+ingestor = Ingestor()
+
+
+# Éléments de la fenêtre transmis à l'analyste (les plus récents)
+WINDOW_LIMIT = 50
+
+
+def window_bounds(analysis_date: str, days: int = 7) -> Tuple[datetime, datetime]:
+    """[analysis_date - days, analysis_date] inclus"""
+    day = datetime.strptime(analysis_date, "%Y-%m-%d")
+    return day - timedelta(days=days), day + timedelta(days=1)
+
+
+async def read_window(db, ticker: str, kind: str, start: datetime, end: datetime, limit: int = WINDOW_LIMIT) -> List[dict]:
+    return await db.news_items.find(
+        {"ticker": ticker.upper(), "kind": kind, "published_at": {"$gte": start, "$lt": end}},
+        {"_id": 0, "simhash": 0, "content_hash": 0},
+    ).sort("published_at", -1).to_list(limit)
+
+
+def summarize_window(kind: str, items: Iterable[dict]) -> dict:
+    """Vue compacte transmise à l'analyste (articles + agrégats précalculés)"""
+    items = list(items)
+    scores = [i["sentiment"] for i in items if i.get("sentiment") is not None]
+    summary = {"count": len(items), "avg_sentiment": round(sum(scores) / len(scores), 3) if scores else None}
+    if kind == "news":
+        summary["articles"] = [
+            {"headline": i.get("headline"), "summary": (i.get("summary") or "")[:300],
+             "sentiment": i.get("sentiment"), "reprises": i.get("duplicates", 0)}
+            for i in items[:10]
+        ]
+    else:
+        by_source: Dict[str, dict] = {}
+        for item in items:
+            source = by_source.setdefault(item["source"], {"mention": 0, "positive": 0, "negative": 0})
+            source["mention"] += item.get("mention", 0)
+            source["positive"] += item.get("positive_mention", 0)
+            source["negative"] += item.get("negative_mention", 0)
+        summary["sources"] = by_source
+    return summary
+
+
+async def analyst_view(ticker: str, kind: str, analysis_date: str) -> dict:
+    """Fenêtre de 7 jours précalculée; collectée une seule fois si encore absente"""
+    start, end = window_bounds(analysis_date)
+    if ingestor.db is None or upstream.mode() in ("record", "replay"):
+        # Hors serveur (scripts, benchmarks) ou cassette: même traitement, sans persistance.
+        # En record/replay la fenêtre est toujours collectée: la cassette ne dépend pas de
+        # ce que MongoDB contient déjà
+        stats = {"stored": 0, "duplicates": 0, "duplicate_of": defaultdict(int)}
+        items = [item async for batch in score(dedupe(fetch_items(ticker, kind, start, end), Deduplicator(), stats, {}))
+                 for item in batch]
+        return summarize_window(kind, sorted(items, key=lambda i: i["published_at"], reverse=True)[:WINDOW_LIMIT])
+    await ingestor.ingest(ticker, kind, start, end)
+    return summarize_window(kind, await read_window(ingestor.db, ticker, kind, start, end))
@@ -0,0 +1,47 @@
+"""Imports différés pour un démarrage à froid rapide.
+
+``requests = lazy_module("requests")`` ne charge le module qu'au premier accès à un
+attribut; ensuite l'accès passe directement par le module mis en cache.
+"""
+import importlib
+import sys
+import threading
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lock = threading.Lock()
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attr):
+        module = self._load()
+        # Les accès suivants à cet attribut ne passent plus par __getattr__
+        value = getattr(module, attr)
+        setattr(self, attr, value)
+        return value
+
+
+def lazy_module(name: str) -> LazyModule:
+    return LazyModule(name)
+
+
+def is_loaded(name: str) -> bool:
+    return name in sys.modules
+
+
+def warm(*names: str):
+    """Précharge des modules (à lancer dans un thread après le démarrage)"""
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
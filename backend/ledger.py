@@ -0,0 +1,278 @@
+"""Registre des appels LLM (tokens, latence, modèle, cache) et agrégats de coût.
+
+Chaque appel produit un événement append-only dans ``llm_ledger``. Les écritures
+sont groupées: le tampon est vidé toutes les ``FLUSH_SECONDS`` (ou dès ``BATCH_SIZE``
+événements) en un ``insert_many`` plus un ``$inc`` par seau pré-agrégé de
+``llm_cost_buckets`` (minute, heure, jour x dimension). Les endpoints de coût ne
+lisent que ces seaux, jamais les événements bruts.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from lazy import lazy_module
+
+pymongo = lazy_module("pymongo")
+pymongo_errors = lazy_module("pymongo.errors")
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = 2
+BATCH_SIZE = 500
+# Au-delà (MongoDB indisponible), les plus anciens événements non écrits sont abandonnés
+MAX_BUFFER = 50_000
+DUPLICATE_KEY = 11000
+
+# USD par million de tokens (tarifs DeepSeek, surchargeables via LLM_PRICE_<MODELE>_<INPUT|CACHED|OUTPUT>)
+PRICES = {
+    "deepseek-chat": {"input": 0.27, "cached": 0.07, "output": 1.10},
+    "deepseek-reasoner": {"input": 0.55, "cached": 0.14, "output": 2.19},
+}
+
+GRANULARITIES = ("minute", "hour", "day")
+_TRUNCATE = {
+    "minute": lambda ts: ts.replace(second=0, microsecond=0),
+    "hour": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "day": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+# Dimension -> granularités tenues à jour (une analyse n'a pas besoin d'une série à la minute)
+DIMENSIONS = {
+    "total": GRANULARITIES,
+    "tenant": GRANULARITIES,
+    "model": GRANULARITIES,
+    "ticker": ("hour", "day"),
+    "analyst": ("hour", "day"),
+    "role": ("hour", "day"),
+    "analysis": ("day",),
+}
+# Champ de l'événement servant de clé pour chaque dimension
+_DIMENSION_FIELD = {"tenant": "tenant_id", "model": "model", "ticker": "ticker",
+                    "analyst": "agent", "role": "role", "analysis": "analysis_id"}
+METRICS = ("calls", "prompt_tokens", "completion_tokens", "total_tokens",
+           "cached_tokens", "cache_hits", "fallbacks", "latency_ms", "cost_usd")
+
+_attribution: ContextVar[dict] = ContextVar("ledger_attribution", default={})
+
+
+@contextmanager
+def attribute(**fields):
+    """Rattache les appels LLM du bloc à une analyse, un ticker, un agent..."""
+    token = _attribution.set({**_attribution.get(), **fields})
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def _price(model: str, kind: str) -> float:
+    override = os.environ.get(f"LLM_PRICE_{model.upper().replace('-', '_')}_{kind.upper()}")
+    if override is not None:
+        return float(override)
+    return PRICES.get(model, {}).get(kind, 0.0)
+
+
+def compute_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    return (
+        (prompt_tokens - cached_tokens) * _price(model, "input")
+        + cached_tokens * _price(model, "cached")
+        + completion_tokens * _price(model, "output")
+    ) / 1_000_000
+
+
+def build_event(model: str, usage: dict, latency_ms: float, replayed: bool = False,
+                tenant_id: Optional[str] = None) -> dict:
+    """Événement du registre pour une réponse ``/chat/completions``.
+
+    ``cache_hit``: réponse rejouée depuis une cassette (aucun coût) ou préfixe du
+    prompt servi par le cache de contexte DeepSeek (``prompt_cache_hit_tokens``).
+    """
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    cached_tokens = usage.get("prompt_cache_hit_tokens", 0)
+    event = {
+        # Identifiant client: un événement réécrit après un échec partiel reste unique
+        "_id": uuid.uuid4().hex,
+        "ts": datetime.utcnow(),
+        "model": model,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": usage.get("total_tokens", prompt_tokens + completion_tokens),
+        "cached_tokens": cached_tokens,
+        "cache_hit": replayed or cached_tokens > 0,
+        "replayed": replayed,
+        "latency_ms": round(latency_ms, 1),
+        "cost_usd": 0.0 if replayed else compute_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+        "tenant_id": tenant_id,
+    }
+    for key, value in _attribution.get().items():
+        event.setdefault(key, value)
+    return event
+
+
+def aggregate(events: List[dict]) -> Dict[tuple, Dict[str, float]]:
+    """Pré-agrégation en mémoire: (dimension, clé, granularité, début du seau) -> métriques"""
+    buckets: Dict[tuple, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    for event in events:
+        values = {
+            "calls": 1,
+            "prompt_tokens": event["prompt_tokens"],
+            "completion_tokens": event["completion_tokens"],
+            "total_tokens": event["total_tokens"],
+            "cached_tokens": event["cached_tokens"],
+            "cache_hits": int(event["cache_hit"]),
+            "fallbacks": int(event.get("fallback", False)),
+            "latency_ms": event["latency_ms"],
+            "cost_usd": event["cost_usd"],
+        }
+        for dimension, granularities in DIMENSIONS.items():
+            key = "all" if dimension == "total" else event.get(_DIMENSION_FIELD[dimension])
+            if key is None:
+                continue
+            for granularity in granularities:
+                bucket = buckets[(dimension, key, granularity, _TRUNCATE[granularity](event["ts"]))]
+                for metric, value in values.items():
+                    bucket[metric] += value
+    return buckets
+
+
+class Ledger:
+    def __init__(self):
+        self.db = None
+        self._buffer: List[dict] = []
+        self._pending_buckets: List[tuple] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def start(self, db):
+        self.db = db
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        try:
+            await db.llm_cost_buckets.create_index(
+                [("dimension", 1), ("granularity", 1), ("key", 1), ("start", 1)], unique=True
+            )
+            await db.llm_cost_buckets.create_index([("dimension", 1), ("granularity", 1), ("start", 1)])
+            await db.llm_ledger.create_index("ts")
+        except Exception as e:
+            logger.error(f"Index du registre de coûts impossibles à créer: {e}")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+    def record(self, event: dict):
+        self._buffer.append(event)
+        if len(self._buffer) > MAX_BUFFER:
+            dropped = len(self._buffer) - MAX_BUFFER
+            del self._buffer[:dropped]
+            logger.warning(f"Registre de coûts saturé: {dropped} événement(s) abandonné(s)")
+        if len(self._buffer) >= BATCH_SIZE and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        if self.db is None or self._lock is None:
+            return
+        async with self._lock:
+            events, self._buffer = self._buffer, []
+            if events:
+                try:
+                    await self.db.llm_ledger.insert_many([dict(e) for e in events], ordered=False)
+                except pymongo_errors.BulkWriteError as e:
+                    # Doublons: déjà écrits par un essai précédent, comptés comme écrits
+                    errors = e.details.get("writeErrors", [])
+                    failed = {error["index"] for error in errors if error.get("code") != DUPLICATE_KEY}
+                    if failed:
+                        logger.warning(f"{len(failed)} événement(s) du registre non écrit(s): {errors[0].get('errmsg')}")
+                        self._buffer[:0] = [event for index, event in enumerate(events) if index in failed]
+                        events = [event for index, event in enumerate(events) if index not in failed]
+                except Exception as e:
+                    # Peut-être écrits malgré l'erreur (timeout): l'_id évite le double comptage
+                    logger.warning(f"Écriture du registre de coûts en échec: {e}")
+                    self._buffer[:0] = events
+                    return
+                self._pending_buckets.extend(aggregate(events).items())
+            if not self._pending_buckets:
+                return
+            # Seaux conservés séparément: un échec ici ne réécrit pas les événements bruts
+            buckets, self._pending_buckets = self._pending_buckets, []
+            try:
+                await self.db.llm_cost_buckets.bulk_write([
+                    pymongo.UpdateOne(
+                        {"dimension": dimension, "key": key, "granularity": granularity, "start": start},
+                        {"$inc": metrics},
+                        upsert=True,
+                    )
+                    for (dimension, key, granularity, start), metrics in buckets
+                ], ordered=False)
+            except Exception as e:
+                logger.warning(f"Mise à jour des agrégats de coût en échec: {e}")
+                self._pending_buckets[:0] = buckets
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+ledger = Ledger()
+
+
+async def cost_breakdown(db, dimension: str, key: Optional[str] = None, date_from: Optional[datetime] = None,
+                         date_to: Optional[datetime] = None, limit: int = 100) -> List[dict]:
+    """Coût cumulé par clé d'une dimension (seaux journaliers), trié par coût décroissant"""
+    query = {"dimension": dimension, "granularity": "day"}
+    if key is not None:
+        query["key"] = key
+    if date_from or date_to:
+        query["start"] = {}
+        if date_from:
+            query["start"]["$gte"] = _TRUNCATE["day"](date_from)
+        if date_to:
+            query["start"]["$lte"] = date_to
+    pipeline = [
+        {"$match": query},
+        {"$group": {"_id": "$key", **{m: {"$sum": f"${m}"} for m in METRICS}}},
+        {"$sort": {"cost_usd": -1}},
+        {"$limit": limit},
+    ]
+    items = []
+    async for doc in db.llm_cost_buckets.aggregate(pipeline):
+        items.append(_finalize({"key": doc.pop("_id"), **doc}))
+    return items
+
+
+async def cost_timeline(db, granularity: str, dimension: str = "total", key: str = "all",
+                        date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> List[dict]:
+    """Série temporelle des seaux d'une clé (ex.: coût par heure d'un tenant)"""
+    query = {"dimension": dimension, "granularity": granularity, "key": key}
+    if date_from or date_to:
+        query["start"] = {}
+        if date_from:
+            query["start"]["$gte"] = date_from
+        if date_to:
+            query["start"]["$lte"] = date_to
+    docs = await db.llm_cost_buckets.find(query, {"_id": 0}).sort("start", 1).to_list(None)
+    return [_finalize({"start": d["start"], **{m: d.get(m, 0) for m in METRICS}}) for d in docs]
+
+
+def _finalize(row: dict) -> dict:
+    calls = row.get("calls") or 0
+    row["cost_usd"] = round(row.get("cost_usd", 0), 6)
+    row["avg_latency_ms"] = round(row.pop("latency_ms", 0) / calls, 1) if calls else None
+    row["cache_hit_rate"] = round(row.get("cache_hits", 0) / calls, 3) if calls else None
+    return row
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Générateur de charge en boucle ouverte pour l'API /api/*
+
+Les arrivées suivent un processus de Poisson au débit demandé: chaque requête part à
+son heure prévue, que les précédentes aient répondu ou non, et sa latence est mesurée
+depuis cette heure prévue (pas d'omission coordonnée quand le serveur sature). Le
+débit est augmenté palier par palier jusqu'à saturation (débit servi < 90 % du débit
+offert, p99 au-delà du SLO ou plus de 1 % d'erreurs).
+
+Mélange de trafic: synthétique pondéré (``--mix mix.json`` pour changer les poids),
+ou trace enregistrée rejouée (``--replay trace.jsonl``, une ligne
+``{"t": secondes, "method": "GET", "path": "/api/...", "body": {...}}``;
+``--save-trace`` écrit la trace d'un run synthétique pour le rejouer à l'identique).
+
+``--spawn`` lance des upstreams factices (DeepSeek/FinnHub, latence réglable) et un
+backend uvicorn branché dessus en mode ``live`` (MongoDB requis, base ``loadtest``).
+
+Rapports (``--out``): summary.json, stages.csv (par palier et par route) et un
+histogramme HDR par palier au format .hgrm (HdrHistogram plotter).
+
+Usage:
+  python loadgen.py --spawn --rates 2,5,10,20,40 --stage-seconds 30
+  python loadgen.py --base-url http://localhost:8001 --replay trace.jsonl --speed 2
+  python loadgen.py stub --port 18999 --llm-latency-ms 800
+"""
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from histogram import Histogram
+
+BACKEND_DIR = Path(__file__).parent
+TICKERS = ["NVDA", "AAPL", "MSFT", "AMZN", "GOOGL", "META", "TSLA", "AMD", "NFLX", "INTC"]
+DATES = [(datetime(2024, 5, 10) - timedelta(days=7 * i)).strftime("%Y-%m-%d") for i in range(8)]
+SATURATION_THROUGHPUT = 0.9
+SATURATION_ERRORS = 0.01
+
+
+# --- Mélange de trafic ---
+
+@dataclass
+class Route:
+    name: str
+    weight: float
+    method: str
+    path: Callable[["State"], Optional[str]]
+    body: Callable[["State"], Optional[dict]] = lambda state: None
+
+
+class State:
+    """Identifiants découverts pendant le run (analyses terminées) pour les routes de lecture"""
+
+    def __init__(self, fresh_ratio: float):
+        self.analysis_ids: List[str] = []
+        self.fresh_ratio = fresh_ratio
+
+    def analysis_id(self) -> Optional[str]:
+        return random.choice(self.analysis_ids) if self.analysis_ids else None
+
+    def observe(self, route: str, payload):
+        if route == "analyze" and isinstance(payload, dict) and payload.get("status") == "completed":
+            self.analysis_ids.append(payload["id"])
+            del self.analysis_ids[:-500]
+
+
+def _analysis_body(state: State) -> dict:
+    return {
+        "ticker": random.choice(TICKERS),
+        "analysis_date": random.choice(DATES),
+        "analysts": random.sample(["market", "social", "news", "fundamentals"], k=random.randint(1, 4)),
+        "research_depth": random.choice([1, 1, 2, 3]),
+    }
+
+
+def _with_id(template: str) -> Callable[[State], Optional[str]]:
+    def build(state: State) -> Optional[str]:
+        analysis_id = state.analysis_id()
+        return template.format(id=analysis_id) if analysis_id else None
+    return build
+
+
+# Poids par défaut: tableau de bord (lectures) majoritaire, analyses LLM minoritaires.
+# network-status, test-deepseek* et launch-cli joignent les vrais services: poids 0.
+ROUTES = [
+    Route("root", 1, "GET", lambda s: "/api/"),
+    Route("status_list", 4, "GET", lambda s: "/api/status"),
+    Route("status_create", 2, "POST", lambda s: "/api/status", lambda s: {"client_name": f"load-{random.randint(1, 50)}"}),
+    Route("trading_status", 10, "GET", lambda s: "/api/trading/status"),
+    Route("analyze", 3, "POST",
+          lambda s: "/api/trading/analyze" + ("?fresh=true" if random.random() < s.fresh_ratio else ""),
+          _analysis_body),
+    Route("analyze_job", 3, "GET", _with_id("/api/trading/analyze/{id}")),
+    Route("analyses_list", 12, "GET", lambda s: f"/api/trading/analyses?limit=50&ticker={random.choice(TICKERS)}"),
+    Route("analyses_stats", 3, "GET", lambda s: "/api/trading/analyses/stats"),
+    Route("analysis_summary", 10, "GET", _with_id("/api/trading/analyses/{id}")),
+    Route("analysis_reports", 5, "GET", _with_id("/api/trading/analyses/{id}/reports")),
+    Route("analysis_cost", 2, "GET", _with_id("/api/trading/analyses/{id}/cost")),
+    Route("backtest", 1, "POST", lambda s: "/api/trading/backtest", lambda s: {"horizon_days": 5}),
+    Route("news", 4, "GET", lambda s: f"/api/trading/news/{random.choice(TICKERS)}"),
+    Route("routing", 1, "GET", lambda s: "/api/trading/routing"),
+    Route("costs_ticker", 2, "GET", lambda s: "/api/costs/ticker"),
+    Route("costs_timeline", 2, "GET", lambda s: "/api/costs/timeline?granularity=minute"),
+    Route("tenant_usage", 2, "GET", lambda s: "/api/tenants/me/usage"),
+    Route("watchlists", 1, "GET", lambda s: "/api/watchlists"),
+    Route("network_status", 0, "GET", lambda s: "/api/trading/network-status"),
+    Route("test_deepseek_quick", 0, "GET", lambda s: "/api/trading/test-deepseek-quick"),
+    Route("launch_cli", 0, "POST", lambda s: "/api/trading/launch-cli"),
+]
+
+
+def load_mix(path: Optional[str]) -> List[Route]:
+    routes = {r.name: Route(r.name, r.weight, r.method, r.path, r.body) for r in ROUTES}
+    if path:
+        with open(path) as f:
+            for name, weight in json.load(f).items():
+                if name not in routes:
+                    raise SystemExit(f"Route inconnue dans {path}: {name} ({sorted(routes)})")
+                routes[name].weight = float(weight)
+    return [r for r in routes.values() if r.weight > 0]
+
+
+def synthetic_arrivals(routes: List[Route], state: State, rate: float, duration: float):
+    """(décalage prévu, nom, méthode, chemin, corps) selon un processus de Poisson"""
+    weights = [r.weight for r in routes]
+    offset = random.expovariate(rate)
+    while offset < duration:
+        route = random.choices(routes, weights)[0]
+        path = route.path(state)
+        if path is not None:
+            yield offset, route.name, route.method, path, route.body(state)
+        offset += random.expovariate(rate)
+
+
+def load_trace(path: str, speed: float) -> List[tuple]:
+    arrivals = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                name = entry.get("route") or entry["path"].split("?")[0]
+                arrivals.append((entry["t"] / speed, name, entry["method"], entry["path"], entry.get("body")))
+    arrivals.sort(key=lambda a: a[0])
+    return arrivals
+
+
+# --- Exécution ---
+
+class StageResult:
+    def __init__(self, label: str, offered_rate: Optional[float]):
+        self.label = label
+        self.offered_rate = offered_rate
+        self.histogram = Histogram()
+        self.routes: Dict[str, Histogram] = defaultdict(Histogram)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[int, int] = defaultdict(int)
+        self.sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.duration = 0.0
+
+    def row(self, route: Optional[str] = None) -> dict:
+        histogram = self.routes[route] if route else self.histogram
+        errors = self.errors[route] if route else sum(self.errors.values())
+        count = histogram.total + (errors if route else 0)
+        return {
+            "stage": self.label,
+            "route": route or "ALL",
+            "offered_rps": round(self.offered_rate, 2) if self.offered_rate and not route else None,
+            "achieved_rps": round(histogram.total / self.duration, 2) if self.duration else None,
+            "requests": count if route else self.sent,
+            "errors": errors,
+            "p50_ms": round(histogram.percentile(50) / 1000, 2),
+            "p90_ms": round(histogram.percentile(90) / 1000, 2),
+            "p99_ms": round(histogram.percentile(99) / 1000, 2),
+            "p999_ms": round(histogram.percentile(99.9) / 1000, 2),
+            "max_ms": round(histogram.max / 1000, 2),
+            "mean_ms": round(histogram.mean / 1000, 2),
+        }
+
+
+async def _fire(client, result: StageResult, state: State, intended: float, name: str, method: str,
+                path: str, body, trace: Optional[list], trace_origin: float):
+    result.in_flight += 1
+    result.max_in_flight = max(result.max_in_flight, result.in_flight)
+    if trace is not None:
+        trace.append({"t": round(intended - trace_origin, 4), "route": name, "method": method, "path": path, "body": body})
+    try:
+        response = await client.request(method, path, json=body)
+        latency_us = (time.perf_counter() - intended) * 1e6
+        result.statuses[response.status_code] += 1
+        if response.status_code >= 400:
+            result.errors[name] += 1
+        else:
+            result.histogram.record(latency_us)
+            result.routes[name].record(latency_us)
+            if name == "analyze":
+                state.observe(name, response.json())
+    except Exception:
+        result.errors[name] += 1
+        result.statuses[0] += 1
+    finally:
+        result.in_flight -= 1
+
+
+async def run_stage(client, label: str, arrivals, state: State, offered_rate: Optional[float],
+                    drain_seconds: float, trace: Optional[list], trace_origin: float = 0.0) -> StageResult:
+    result = StageResult(label, offered_rate)
+    start = time.perf_counter()
+    tasks = []
+    for offset, name, method, path, body in arrivals:
+        intended = start + offset
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        result.sent += 1
+        tasks.append(asyncio.create_task(_fire(
+            client, result, state, intended, name, method, path, body, trace, trace_origin
+        )))
+    if tasks:
+        done, pending = await asyncio.wait(tasks, timeout=drain_seconds)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        result.errors["timeout"] += len(pending)
+    result.duration = time.perf_counter() - start
+    return result
+
+
+def saturated(result: StageResult, slo_ms: float) -> Optional[str]:
+    if not result.sent:
+        return None
+    if sum(result.errors.values()) / result.sent > SATURATION_ERRORS:
+        return "taux d'erreur"
+    if result.offered_rate and result.histogram.total / result.duration < SATURATION_THROUGHPUT * result.offered_rate:
+        return "débit servi"
+    if result.histogram.percentile(99) / 1000 > slo_ms:
+        return "p99 > SLO"
+    return None
+
+
+def write_reports(out: Path, results: List[StageResult], meta: dict):
+    out.mkdir(parents=True, exist_ok=True)
+    rows = []
+    for result in results:
+        rows.append(result.row())
+        rows.extend(result.row(route) for route in sorted(result.routes))
+        (out / f"{result.label}.hgrm").write_text(result.histogram.to_hgrm())
+    with open(out / "stages.csv", "w", newline="") as f:
+        # Aucun palier terminé (interruption pendant le premier): en-tête seul
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else list(StageResult("", None).row()))
+        writer.writeheader()
+        writer.writerows(rows)
+    summary = {
+        **meta,
+        "stages": [
+            {**r.row(), "max_in_flight": r.max_in_flight, "statuses": dict(r.statuses),
+             "errors_by_route": dict(r.errors), "routes": [r.row(route) for route in sorted(r.routes)]}
+            for r in results
+        ],
+    }
+    (out / "summary.json").write_text(json.dumps(summary, indent=2, ensure_ascii=False))
+
+
+# --- Upstreams factices et backend local ---
+
+def stub_app(llm_latency_ms: float, data_latency_ms: float, error_rate: float):
+    """Application ASGI imitant /chat/completions (DeepSeek) et l'API FinnHub"""
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route as HttpRoute
+
+    async def chat(request: Request):
+        body = await request.json()
+        await asyncio.sleep(random.lognormvariate(math.log(max(llm_latency_ms, 1) / 1000), 0.4))
+        if random.random() < error_rate:
+            return JSONResponse({"error": "rate limited"}, status_code=429)
+        prompt = sum(len(m["content"]) for m in body["messages"]) // 4
+        completion = random.randint(80, min(400, body.get("max_tokens", 400)))
+        content = (f"RISQUE: modéré. Analyse simulée pour la charge. "
+                   f"DECISION: {random.choice(['BUY', 'SELL', 'HOLD'])} CONFIDENCE: {random.random():.2f}")
+        return JSONResponse({
+            "model": body["model"],
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion},
+        })
+
+    async def finnhub(request: Request):
+        await asyncio.sleep(data_latency_ms / 1000)
+        path = request.url.path
+        if path.endswith("/company-news"):
+            now = int(time.time())
+            return JSONResponse([
+                {"datetime": now - i * 3600, "headline": f"Headline {random.randint(0, 30)} for {request.query_params.get('symbol')}",
+                 "summary": "Shares rise after strong results.", "source": "stub", "url": f"https://stub/{i}"}
+                for i in range(10)
+            ])
+        if path.endswith("/social-sentiment"):
+            return JSONResponse({"reddit": [], "twitter": []})
+        if path.endswith("/quote"):
+            return JSONResponse({"c": 100.0, "h": 101.0, "l": 99.0, "o": 100.5, "pc": 99.5})
+        return JSONResponse({"metric": {"peTTM": 30.0}})
+
+    return Starlette(routes=[
+        HttpRoute("/chat/completions", chat, methods=["POST"]),
+        HttpRoute("/{path:path}", finnhub, methods=["GET"]),
+    ])
+
+
+def run_stub(args):
+    import uvicorn
+    uvicorn.run(stub_app(args.llm_latency_ms, args.data_latency_ms, args.error_rate),
+                host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def _wait_ready(url: str, timeout: float = 30):
+    import httpx
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise SystemExit(f"❌ {url} ne répond pas après {timeout}s")
+
+
+def spawn(args) -> List[subprocess.Popen]:
+    stub_port, backend_port = args.stub_port, args.backend_port
+    stub = subprocess.Popen(
+        [sys.executable, __file__, "stub", "--port", str(stub_port),
+         "--llm-latency-ms", str(args.llm_latency_ms), "--data-latency-ms", str(args.data_latency_ms),
+         "--error-rate", str(args.error_rate)],
+        cwd=BACKEND_DIR,
+    )
+    env = {
+        **os.environ,
+        "TRADING_PIPELINE_MODE": "live",
+        "DEEPSEEK_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "FINNHUB_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "DB_NAME": os.environ.get("LOADTEST_DB_NAME", "loadtest"),
+    }
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(backend_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    _wait_ready(f"http://127.0.0.1:{stub_port}/quote")
+    _wait_ready(f"http://127.0.0.1:{backend_port}/api/")
+    args.base_url = f"http://127.0.0.1:{backend_port}"
+    return [backend, stub]
+
+
+async def run(args) -> int:
+    import httpx
+
+    state = State(args.fresh_ratio)
+    routes = load_mix(args.mix)
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+    results: List[StageResult] = []
+    trace: Optional[list] = [] if args.save_trace else None
+    saturation = None
+    origin = time.perf_counter()
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        if args.warmup:
+            # Quelques analyses pour alimenter les routes de lecture (résumés, rapports, coûts)
+            warmup = list(synthetic_arrivals([r for r in routes if r.name == "analyze"], state, args.warmup, 1.0))
+            await run_stage(client, "warmup", warmup, state, None, args.drain_seconds, None)
+
+        if args.replay:
+            arrivals = load_trace(args.replay, args.speed)
+            results.append(await run_stage(client, "replay", arrivals, state, None, args.drain_seconds, trace, origin))
+        else:
+            for rate in args.rates:
+                arrivals = synthetic_arrivals(routes, state, rate, args.stage_seconds)
+                result = await run_stage(client, f"rate-{rate:g}", arrivals, state, rate, args.drain_seconds, trace, origin)
+                results.append(result)
+                row = result.row()
+                reason = saturated(result, args.slo_ms)
+                print(f"  {row['stage']:>12}: {row['achieved_rps']:>7} req/s  p50 {row['p50_ms']:>8} ms  "
+                      f"p99 {row['p99_ms']:>8} ms  erreurs {row['errors']:>4}  en vol max {result.max_in_flight}"
+                      + (f"  ⚠️ saturation ({reason})" if reason else ""))
+                if reason and saturation is None:
+                    saturation = {"rate": rate, "reason": reason}
+                    if not args.keep_going:
+                        break
+
+    meta = {
+        "base_url": args.base_url,
+        "started_at": datetime.utcnow().isoformat(),
+        "mode": "replay" if args.replay else "synthetic",
+        "rates": args.rates,
+        "stage_seconds": args.stage_seconds,
+        "slo_ms": args.slo_ms,
+        "mix": {r.name: r.weight for r in routes},
+        "saturation": saturation,
+    }
+    out = Path(args.out or BACKEND_DIR / "loadtest" / datetime.now().strftime("%Y%m%d-%H%M%S"))
+    write_reports(out, results, meta)
+    if trace is not None:
+        with open(args.save_trace, "w") as f:
+            for entry in sorted(trace, key=lambda e: e["t"]):
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    print(f"📄 Rapports: {out}")
+    if saturation:
+        print(f"🚦 Saturation à {saturation['rate']} req/s ({saturation['reason']})")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+    stub = sub.add_parser("stub", help="upstreams factices seuls")
+    stub.add_argument("--port", type=int, default=18999)
+    stub.add_argument("--llm-latency-ms", type=float, default=800)
+    stub.add_argument("--data-latency-ms", type=float, default=50)
+    stub.add_argument("--error-rate", type=float, default=0.0)
+
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--spawn", action="store_true", help="lance upstreams factices + backend local")
+    parser.add_argument("--stub-port", type=int, default=18999)
+    parser.add_argument("--backend-port", type=int, default=18001)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--llm-latency-ms", type=float, default=800)
+    parser.add_argument("--data-latency-ms", type=float, default=50, help="latence du faux FinnHub")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="part de 429 renvoyés par le faux DeepSeek")
+    parser.add_argument("--rates", type=lambda v: [float(x) for x in v.split(",")], default=[2, 5, 10, 20, 40, 80])
+    parser.add_argument("--stage-seconds", type=float, default=30)
+    parser.add_argument("--drain-seconds", type=float, default=60)
+    parser.add_argument("--slo-ms", type=float, default=2000)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--fresh-ratio", type=float, default=0.2, help="part des analyses forcées (?fresh=true)")
+    parser.add_argument("--warmup", type=float, default=2, help="analyses/s pendant 1 s avant les paliers (0: aucune)")
+    parser.add_argument("--mix", help="JSON {route: poids}")
+    parser.add_argument("--replay", help="trace JSONL à rejouer")
+    parser.add_argument("--speed", type=float, default=1.0, help="accélération de la trace rejouée")
+    parser.add_argument("--save-trace", help="écrit la trace synthétique générée (JSONL)")
+    parser.add_argument("--keep-going", action="store_true", help="continue après la saturation")
+    parser.add_argument("--out", help="répertoire des rapports")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    if args.command == "stub":
+        run_stub(args)
+        return
+
+    processes = spawn(args) if args.spawn else []
+    print(f"🚀 Charge en boucle ouverte sur {args.base_url}")
+    try:
+        sys.exit(asyncio.run(run(args)))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
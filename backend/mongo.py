@@ -0,0 +1,288 @@
+"""Pool de connexions MongoDB (réglages, préchauffage) et instrumentation des commandes.
+
+Réglages du pool par variables d'environnement: ``MONGO_MAX_POOL_SIZE``,
+``MONGO_MIN_POOL_SIZE`` (connexions ouvertes dès le démarrage), ``MONGO_WAIT_QUEUE_TIMEOUT_MS``
+(attente maximale d'une connexion libre), ``MONGO_MAX_IDLE_TIME_MS``.
+
+Les listeners pymongo alimentent des histogrammes de latence par collection et par
+opération, ainsi que l'attente de checkout du pool: on distingue ainsi une requête
+lente d'un pool saturé. Les commandes au-delà de ``MONGO_SLOW_MS`` sont journalisées.
+
+``MONGO_EXPLAIN=1`` (débogage): chaque forme de requête de lecture (collection,
+opération, champs du filtre et du tri) est passée une fois à ``explain``; les plans
+en ``COLLSCAN`` sont journalisés et listés dans les statistiques.
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+import tracing
+from histogram import Histogram
+from lazy import lazy_module
+
+monitoring = lazy_module("pymongo.monitoring")
+
+logger = logging.getLogger(__name__)
+
+POOL_OPTIONS = {
+    "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", 100)),
+    "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", 10)),
+    "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)),
+    "maxIdleTimeMS": int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", 300_000)),
+}
+MONGO_SLOW_MS = float(os.environ.get("MONGO_SLOW_MS", 100))
+MONGO_EXPLAIN = os.environ.get("MONGO_EXPLAIN", "0") == "1"
+
+_IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue",
+                     "endSessions", "explain", "buildInfo", "getMore", "killCursors"}
+_EXPLAINED_COMMANDS = {"find", "aggregate", "count", "distinct"}
+# Champs de session/transport retirés avant de rejouer une commande dans explain
+_TRANSPORT_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+
+def _shape(command_name: str, command: dict) -> tuple:
+    """Forme d'une requête: valeurs retirées, seuls les noms de champs comptent"""
+    if command_name == "aggregate":
+        first = (command.get("pipeline") or [{}])[0]
+        query = first.get("$match", {}) if isinstance(first, dict) else {}
+        sort = {}
+    else:
+        query = command.get("filter") or command.get("query") or {}
+        sort = command.get("sort") or {}
+    return command_name, command.get(command_name), tuple(sorted(query)), tuple(sort)
+
+
+def _has_collscan(plan) -> bool:
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(_has_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_collscan(value) for value in plan)
+    return False
+
+
+class MongoMetrics:
+    """Histogrammes par (collection, opération), attente de checkout, plans en COLLSCAN"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.commands: Dict[tuple, Histogram] = defaultdict(Histogram)
+        self.errors: Dict[tuple, int] = defaultdict(int)
+        self.slow = 0
+        self.checkout_wait = Histogram()
+        self.checkout_failures: Dict[str, int] = defaultdict(int)
+        self.connections = 0
+        self.checked_out = 0
+        self.collscans: Dict[tuple, dict] = {}
+        self._pending: Dict[tuple, tuple] = {}
+        self._explained: set = set()
+        self._explain_queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def listeners(self) -> list:
+        command_listener, pool_listener = _listener_classes()
+        return [command_listener(self), pool_listener(self)]
+
+    async def start(self, db):
+        if MONGO_EXPLAIN:
+            self._loop = asyncio.get_running_loop()
+            self._explain_queue = asyncio.Queue(maxsize=1000)
+            self._task = asyncio.create_task(self._explain_loop(db))
+            logger.info("🔍 Mode explain MongoDB actif: détection des COLLSCAN")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    # Appelés depuis les threads de pymongo
+
+    def command_started(self, event):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        key = (collection if isinstance(collection, str) else event.database_name, event.command_name)
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = key
+        if self._explain_queue is not None and event.command_name in _EXPLAINED_COMMANDS:
+            self._queue_explain(event)
+
+    def command_finished(self, event, failed: bool):
+        with self._lock:
+            key = self._pending.pop((event.request_id, event.connection_id), None)
+            if key is None:
+                return
+            self.commands[key].record(event.duration_micros)
+            if failed:
+                self.errors[key] += 1
+            slow = event.duration_micros / 1000 > MONGO_SLOW_MS
+            if slow:
+                self.slow += 1
+        if slow:
+            logger.warning(f"🐢 Requête MongoDB lente: {key[1]} sur {key[0]} en {event.duration_micros / 1000:.1f} ms")
+
+    def checkout_started(self):
+        self._local.checkout_start = time.perf_counter()
+
+    def checkout_finished(self, reason: Optional[str] = None):
+        start = getattr(self._local, "checkout_start", None)
+        self._local.checkout_start = None
+        with self._lock:
+            if reason is not None:
+                self.checkout_failures[reason] += 1
+            else:
+                self.checked_out += 1
+            if start is not None:
+                self.checkout_wait.record((time.perf_counter() - start) * 1e6)
+
+    def checked_in(self):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_count(self, delta: int):
+        with self._lock:
+            self.connections += delta
+
+    # Explain (débogage)
+
+    def _queue_explain(self, event):
+        command = {k: v for k, v in event.command.items() if not k.startswith("$") and k not in _TRANSPORT_FIELDS}
+        if event.command_name == "aggregate" and any(
+            "$out" in stage or "$merge" in stage for stage in command.get("pipeline", []) if isinstance(stage, dict)
+        ):
+            return
+        shape = _shape(event.command_name, command)
+        with self._lock:
+            if shape in self._explained:
+                return
+            self._explained.add(shape)
+        try:
+            self._loop.call_soon_threadsafe(self._enqueue, (shape, event.database_name, command))
+        except RuntimeError:  # boucle arrêtée
+            pass
+
+    def _enqueue(self, item: tuple):
+        try:
+            self._explain_queue.put_nowait(item)
+        except asyncio.QueueFull:
+            pass
+
+    async def _explain_loop(self, db):
+        while True:
+            shape, database, command = await self._explain_queue.get()
+            try:
+                plan = await db.client[database].command({"explain": command, "verbosity": "queryPlanner"})
+            except Exception as e:
+                logger.info(f"Explain impossible pour {shape}: {e}")
+                continue
+            if _has_collscan(plan.get("queryPlanner", plan)):
+                operation, collection, filter_fields, sort_fields = shape
+                self.collscans[shape] = {
+                    "collection": collection, "operation": operation,
+                    "filter": list(filter_fields), "sort": list(sort_fields),
+                }
+                logger.warning(f"⚠️ COLLSCAN: {operation} sur {collection} (filtre {list(filter_fields)}, tri {list(sort_fields)})")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pool": {
+                    "options": POOL_OPTIONS,
+                    "connections": self.connections,
+                    "checked_out": self.checked_out,
+                    "checkout_wait": self.checkout_wait.summary(),
+                    "checkout_failures": dict(self.checkout_failures),
+                },
+                "slow_threshold_ms": MONGO_SLOW_MS,
+                "slow_commands": self.slow,
+                "commands": [
+                    {"collection": collection, "operation": operation,
+                     "errors": self.errors.get((collection, operation), 0), **histogram.summary()}
+                    for (collection, operation), histogram in sorted(self.commands.items())
+                ],
+                "explain": MONGO_EXPLAIN,
+                "collscans": list(self.collscans.values()),
+            }
+
+
+@functools.lru_cache(maxsize=None)
+def _listener_classes():
+    """Classes définies au premier client créé: pymongo reste hors du chemin d'import"""
+
+    class CommandListener(monitoring.CommandListener):
+        def __init__(self, metrics: MongoMetrics):
+            self.metrics = metrics
+
+        def started(self, event):
+            self.metrics.command_started(event)
+
+        def succeeded(self, event):
+            self.metrics.command_finished(event, failed=False)
+
+        def failed(self, event):
+            self.metrics.command_finished(event, failed=True)
+
+    class PoolListener(monitoring.ConnectionPoolListener):
+        def __init__(self, metrics: MongoMetrics):
+            self.metrics = metrics
+
+        def connection_created(self, event):
+            self.metrics.connection_count(1)
+
+        def connection_closed(self, event):
+            self.metrics.connection_count(-1)
+
+        def connection_check_out_started(self, event):
+            self.metrics.checkout_started()
+
+        def connection_checked_out(self, event):
+            self.metrics.checkout_finished()
+
+        def connection_check_out_failed(self, event):
+            self.metrics.checkout_finished(reason=str(event.reason))
+
+        def connection_checked_in(self, event):
+            self.metrics.checked_in()
+
+        def pool_created(self, event):
+            pass
+
+        def pool_ready(self, event):
+            pass
+
+        def pool_cleared(self, event):
+            pass
+
+        def pool_closed(self, event):
+            pass
+
+        def connection_ready(self, event):
+            pass
+
+    return CommandListener, PoolListener
+
+
+metrics = MongoMetrics()
+
+
+def client_options() -> dict:
+    """Arguments du client Motor: réglages du pool et listeners (métriques, traces)"""
+    return {**POOL_OPTIONS, "event_listeners": [*metrics.listeners(), *tracing.mongo_listeners()]}
+
+
+async def warmup(db, connections: int = POOL_OPTIONS["minPoolSize"]):
+    """Ouvre ``connections`` connexions en parallèle avant la première requête"""
+    if connections <= 0:
+        return
+    start = time.perf_counter()
+    await asyncio.gather(*[db.command("ping") for _ in range(connections)])
+    logger.info(f"🔌 Pool MongoDB préchauffé: {metrics.connections} connexion(s) en {(time.perf_counter() - start) * 1000:.0f} ms")
@@ -0,0 +1,333 @@
+"""Pipeline d'analyse TradingAgents en cinq phases avec checkpoints.
+
+Chaque phase persiste sa sortie dans ``analysis_checkpoints`` (clé: job_id + phase)
+afin qu'une relance reparte de la dernière phase terminée au lieu de tout refaire.
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import agents
+import ledger
+import tenants
+import tracing
+import upstream
+from realtime import hub
+
+logger = logging.getLogger(__name__)
+
+# Ordre d'exécution des phases et libellés affichés dans l'interface
+PHASES = [
+    ("analysts", "📊 Équipe d'Analyse - Collecte des données de marché"),
+    ("research", "🔬 Équipe de Recherche - Débat haussier vs baissier"),
+    ("trader", "💼 Équipe de Trading - Formulation de stratégie"),
+    ("risk", "⚠️ Gestion des Risques - Évaluation des risques"),
+    ("portfolio", "💰 Gestion de Portefeuille - Décision finale"),
+]
+PHASE_NAMES = [name for name, _ in PHASES]
+PHASE_LABELS = dict(PHASES)
+
+# Paramètres consommés par chaque phase: un changement oblige à relancer à partir de celle-ci
+PHASE_PARAMS = {
+    "analysts": ("ticker", "analysis_date", "analysts"),
+    "research": ("research_depth",),
+}
+
+PHASE_MAX_RETRIES = 2
+PHASE_RETRY_DELAY = 1.0
+# Un job "running" sans mise à jour depuis ce délai est considéré comme abandonné (crash)
+STALE_JOB_SECONDS = 600
+
+
+class PipelineError(Exception):
+    """Échec d'une phase après épuisement des tentatives"""
+
+    def __init__(self, phase: str, message: str):
+        super().__init__(f"Phase '{phase}' en échec: {message}")
+        self.phase = phase
+        self.message = message
+
+
+def _seed(*parts) -> int:
+    """Graine déterministe pour la simulation (même config -> même résultat)"""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+    return int(digest[:8], 16)
+
+
+# --- Phases (simulation rapide sans appels LLM coûteux, voir ``agents`` pour le LLM) ---
+
+async def run_analysts(config: dict, outputs: dict) -> dict:
+    reports = {}
+    for analyst in config["analysts"]:
+        reports[analyst] = (
+            f"Rapport {analyst} pour {config['ticker']} au {config['analysis_date']}: "
+            f"données collectées et synthétisées."
+        )
+    return {"reports": reports}
+
+
+async def run_research(config: dict, outputs: dict) -> dict:
+    reports = outputs["analysts"]["reports"]
+    rounds = []
+    for i in range(config["research_depth"]):
+        rounds.append({
+            "round": i + 1,
+            "bull": f"Argument haussier #{i + 1} basé sur {len(reports)} rapport(s)",
+            "bear": f"Argument baissier #{i + 1} basé sur {len(reports)} rapport(s)",
+        })
+    return {
+        "rounds": rounds,
+        "summary": f"Débat de {len(rounds)} round(s) entre chercheurs haussiers et baissiers",
+    }
+
+
+async def run_trader(config: dict, outputs: dict) -> dict:
+    return {
+        "plan": (
+            f"Stratégie {config['ticker']} établie à partir de "
+            f"{len(outputs['research']['rounds'])} round(s) de débat"
+        )
+    }
+
+
+async def run_risk(config: dict, outputs: dict) -> dict:
+    levels = ["faible", "modéré", "élevé"]
+    level = levels[_seed(config["ticker"], config["analysis_date"], "risk") % len(levels)]
+    return {"risk_level": level, "assessment": f"Risque {level} pour le plan proposé"}
+
+
+async def run_portfolio(config: dict, outputs: dict) -> dict:
+    seed = _seed(config["ticker"], config["analysis_date"], config["research_depth"])
+    decision = ["BUY", "SELL", "HOLD"][seed % 3]
+    confidence = round(0.5 + (seed % 50) / 100, 2)
+    return {
+        "decision": decision,
+        "confidence": confidence,
+        "rationale": f"{decision} retenu (risque {outputs['risk']['risk_level']})",
+    }
+
+
+PHASE_RUNNERS = {
+    "analysts": run_analysts,
+    "research": run_research,
+    "trader": run_trader,
+    "risk": run_risk,
+    "portfolio": run_portfolio,
+}
+
+
+# --- Checkpoints ---
+
+async def ensure_indexes(db):
+    await db.analysis_checkpoints.create_index([("job_id", 1), ("phase", 1)], unique=True)
+    await db.analysis_jobs.create_index("id", unique=True)
+    await db.analysis_jobs.create_index([("config_key", 1), ("status", 1), ("created_at", -1)])
+    await db.analysis_jobs.create_index([("config.ticker", 1), ("config.analysis_date", 1), ("completed_phases", 1)])
+
+
+async def save_checkpoint(db, job_id: str, phase: str, output: dict):
+    await db.analysis_checkpoints.update_one(
+        {"job_id": job_id, "phase": phase},
+        {"$set": {"output": output, "created_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+async def load_checkpoints(db, job_id: str) -> Dict[str, dict]:
+    docs = await db.analysis_checkpoints.find({"job_id": job_id}).to_list(len(PHASES))
+    return {doc["phase"]: doc["output"] for doc in docs}
+
+
+async def copy_checkpoints(db, source_id: str, target_id: str, phases: List[str]):
+    outputs = await load_checkpoints(db, source_id)
+    for phase in phases:
+        if phase in outputs:
+            await save_checkpoint(db, target_id, phase, outputs[phase])
+
+
+def first_changed_phase(config: dict, overrides: dict) -> Optional[str]:
+    """Première phase dont les paramètres d'entrée diffèrent après overrides"""
+    for phase in PHASE_NAMES:
+        for param in PHASE_PARAMS.get(phase, ()):
+            if param in overrides and overrides[param] != config.get(param):
+                return phase
+    return None
+
+
+# --- Jobs ---
+
+def config_key(config: dict) -> str:
+    """Empreinte d'une configuration d'analyse (et du mode): deux requêtes identiques
+    partagent le même job et le même résultat"""
+    canonical = "|".join([
+        upstream.mode(),
+        config["ticker"].upper(),
+        config["analysis_date"],
+        ",".join(sorted(config["analysts"])),
+        str(config["research_depth"]),
+    ])
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+async def create_job(db, job_id: str, config: dict, parent_id: Optional[str] = None) -> dict:
+    now = datetime.utcnow()
+    job = {
+        "id": job_id,
+        "config": config,
+        "config_key": config_key(config),
+        "parent_id": parent_id,
+        "mode": upstream.mode(),
+        "tenant_id": (tenants.current_tenant.get() or tenants.DEFAULT_TENANT).id,
+        "status": "pending",
+        "current_phase": None,
+        "completed_phases": [],
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await db.analysis_jobs.insert_one(dict(job))
+    return job
+
+
+async def get_job(db, job_id: str) -> Optional[dict]:
+    return await db.analysis_jobs.find_one({"id": job_id}, {"_id": 0})
+
+
+async def find_job(db, key: str, status: str) -> Optional[dict]:
+    """Job le plus récent de cette configuration dans l'état donné (running: non abandonné)"""
+    query = {"config_key": key, "status": status}
+    if status == "running":
+        query["updated_at"] = {"$gte": datetime.utcnow() - timedelta(seconds=STALE_JOB_SECONDS)}
+    docs = await db.analysis_jobs.find(query, {"_id": 0}).sort("created_at", -1).limit(1).to_list(1)
+    return docs[0] if docs else None
+
+
+def is_running(job: dict) -> bool:
+    """Job réellement en cours: un job ``running`` sans nouvelle depuis STALE_JOB_SECONDS est repris"""
+    return job["status"] == "running" and job["updated_at"] >= datetime.utcnow() - timedelta(seconds=STALE_JOB_SECONDS)
+
+
+async def find_analyst_reports(db, config: dict) -> Optional[Tuple[dict, Dict[str, dict]]]:
+    """Job le plus récent (terminé ou partiel) dont la phase ``analysts`` a été calculée
+    avec les mêmes entrées, quel que soit ``research_depth``, et ses sorties"""
+    analysts = sorted(config["analysts"])
+    jobs = await db.analysis_jobs.find(
+        {"config.ticker": config["ticker"].upper(), "config.analysis_date": config["analysis_date"],
+         "completed_phases": "analysts", "mode": upstream.mode()},
+        {"_id": 0},
+    ).sort("created_at", -1).limit(20).to_list(20)
+    for job in jobs:
+        if sorted(job["config"]["analysts"]) != analysts:
+            continue
+        outputs = await load_checkpoints(db, job["id"])
+        if "analysts" in outputs:
+            return job, outputs
+    return None
+
+
+async def wait_for_job(db, job_id: str, poll: float = 1.0) -> Optional[dict]:
+    """Attend la fin d'un job exécuté ailleurs (autre worker)"""
+    while True:
+        job = await get_job(db, job_id)
+        if job is None or job["status"] not in ("pending", "running"):
+            return job
+        await asyncio.sleep(poll)
+
+
+async def _update_job(db, job_id: str, **fields):
+    progress = dict(fields)
+    if "completed_phases" in fields:
+        progress["completion"] = round(100 * len(fields["completed_phases"]) / len(PHASES))
+    hub.publish(f"job:{job_id}", progress)
+    fields["updated_at"] = datetime.utcnow()
+    await db.analysis_jobs.update_one({"id": job_id}, {"$set": fields})
+
+
+async def fail_job(db, job_id: str, error: str):
+    await _update_job(db, job_id, status="failed", error=error)
+
+
+async def run_pipeline(db, job_id: str, config: dict, from_phase: Optional[str] = None,
+                       until_phase: Optional[str] = None) -> Dict[str, dict]:
+    """Exécute les phases manquantes du job et retourne toutes les sorties.
+
+    Les phases déjà présentes en checkpoint sont réutilisées; ``from_phase`` force
+    la réexécution de cette phase et de toutes les suivantes. Avec ``until_phase``,
+    le job s'arrête après cette phase à l'état ``partial`` (mode comparaison) et
+    pourra être repris plus tard.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=STALE_JOB_SECONDS)
+    claimed = await db.analysis_jobs.find_one_and_update(
+        {"id": job_id, "$or": [{"status": {"$ne": "running"}}, {"updated_at": {"$lt": stale_before}}]},
+        {"$set": {"status": "running", "error": None, "updated_at": datetime.utcnow()}},
+    )
+    if claimed is None:
+        raise PipelineError("claim", "job introuvable ou déjà en cours d'exécution")
+    hub.publish(f"job:{job_id}", {"status": "running", "error": None})
+
+    outputs = await load_checkpoints(db, job_id)
+    if from_phase:
+        for phase in PHASE_NAMES[PHASE_NAMES.index(from_phase):]:
+            outputs.pop(phase, None)
+
+    runners = PHASE_RUNNERS if upstream.mode() == "simulated" else agents.PHASE_RUNNERS
+    completed = [p for p in PHASE_NAMES if p in outputs]
+    phases = PHASE_NAMES[:PHASE_NAMES.index(until_phase) + 1] if until_phase else PHASE_NAMES
+    for phase in phases:
+        if phase in outputs:
+            continue
+        await _update_job(db, job_id, current_phase=phase, completed_phases=completed)
+        for attempt in range(PHASE_MAX_RETRIES + 1):
+            try:
+                with ledger.attribute(analysis_id=job_id, ticker=config["ticker"], phase=phase, agent=phase), \
+                        tracing.span(f"phase {phase}", **{"pipeline.phase": phase, "pipeline.attempt": attempt}):
+                    outputs[phase] = await runners[phase](config, outputs)
+                break
+            except Exception as e:
+                logger.warning(f"Phase {phase} du job {job_id} en échec (tentative {attempt + 1}): {e}")
+                if attempt == PHASE_MAX_RETRIES:
+                    await _update_job(db, job_id, status="failed", error=f"{phase}: {e}")
+                    raise PipelineError(phase, str(e)) from e
+                await asyncio.sleep(PHASE_RETRY_DELAY * (attempt + 1))
+        await save_checkpoint(db, job_id, phase, outputs[phase])
+        completed.append(phase)
+
+    status = "completed" if len(completed) == len(PHASE_NAMES) else "partial"
+    await _update_job(db, job_id, status=status, current_phase=None, completed_phases=completed)
+    return outputs
+
+
+def format_summary(config: dict, outputs: Dict[str, dict]) -> str:
+    """Rendu texte de l'analyse pour l'interface web"""
+    summary = f"""
+🚀 Analyse TradingAgents - {config['ticker']}
+==========================================
+
+Configuration:
+• Ticker: {config['ticker']}
+• Date: {config['analysis_date']}
+• Analystes: {', '.join(config['analysts'])}
+• Profondeur: {config['research_depth']}
+• LLM: DeepSeek Chat
+
+Processus d'analyse:
+"""
+    for i, (phase, label) in enumerate(PHASES):
+        mark = "✅" if phase in outputs else "⏳"
+        summary += f"\n{mark} Phase {i+1}/{len(PHASES)}: {label}"
+
+    final = outputs.get("portfolio", {})
+    summary += f"""
+
+📊 Résultat de l'analyse {config['ticker']}:
+• Status: ✅ Analyse terminée avec succès
+• Système: TradingAgents avec DeepSeek
+• Recommandation: {final.get('decision', 'N/A')} (confiance {final.get('confidence', 'N/A')})
+• Agents consultés: {len(config['analysts'])} équipes d'analyse
+• Profondeur de recherche: {config['research_depth']} round(s)
+
+🎯 L'analyse TradingAgents est terminée et prête pour la prise de décision!
+"""
+    return summary
@@ -0,0 +1,110 @@
+"""Préchargement spéculatif des données d'analyse pendant la saisie du formulaire.
+
+Dès que le ticker et la date sont choisis, l'interface envoie un indice
+(``POST /api/trading/prefetch``). Les données de chaque analyste (cours et
+fondamentaux FinnHub en cache mémoire, fenêtre d'actualités et de sentiment
+ingérée en base) sont alors collectées en tâche de fond: l'analyse soumise ensuite
+démarre avec des données chaudes.
+
+Priorité basse: file bornée (les indices en trop sont ignorés), au plus
+``PREFETCH_CONCURRENCY`` collectes simultanées et ``PREFETCH_RATE_PER_MINUTE``
+démarrages par minute pour ménager le quota FinnHub. Un même (ticker, date,
+analyste) n'est collecté qu'une fois par ``PREFETCH_DEDUP_SECONDS``.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import admission
+import agents
+import tenants
+import tracing
+import upstream
+from fairqueue import BATCH
+from scheduler import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_CONCURRENCY = int(os.environ.get("PREFETCH_CONCURRENCY", 2))
+PREFETCH_RATE_PER_MINUTE = float(os.environ.get("PREFETCH_RATE_PER_MINUTE", 30))
+PREFETCH_DEDUP_SECONDS = min(float(os.environ.get("PREFETCH_DEDUP_SECONDS", 300)), upstream.FINNHUB_CACHE_SECONDS)
+QUEUE_SIZE = 100
+PREFETCH_TENANT = tenants.Tenant(id="prefetch", name="Préchargement", weight=0.25,
+                                 requests_per_day=100_000, tokens_per_day=0)
+
+Key = Tuple[str, str, str]
+
+
+class Prefetcher:
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self.pending: set = set()
+        self.done: Dict[Key, float] = {}
+        self.counts = {"scheduled": 0, "deduplicated": 0, "dropped": 0, "completed": 0, "failed": 0}
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        limiter = RateLimiter(PREFETCH_RATE_PER_MINUTE)
+        self._workers = [asyncio.create_task(self._worker(limiter)) for _ in range(PREFETCH_CONCURRENCY)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def hint(self, ticker: str, analysis_date: str, analysts: List[str]) -> dict:
+        """Planifie la collecte des données manquantes; ne bloque jamais l'appelant"""
+        if upstream.mode() in ("simulated", "replay") or self.queue is None:
+            return {"status": "skipped", "reason": f"mode {upstream.mode()}"}
+        pressure = admission.controller.pressure()
+        if pressure is not None:
+            # Serveur sous pression: un simple indice ne mérite pas de travail en plus
+            return {"status": "skipped", "reason": pressure}
+        now = time.monotonic()
+        # Oubli des collectes trop anciennes (le cache FinnHub a expiré)
+        self.done = {key: at for key, at in self.done.items() if now - at < PREFETCH_DEDUP_SECONDS}
+        report = {"scheduled": [], "deduplicated": [], "dropped": []}
+        for analyst in analysts:
+            key = (ticker.upper(), analysis_date, analyst)
+            if key in self.pending or key in self.done:
+                report["deduplicated"].append(analyst)
+                continue
+            try:
+                self.queue.put_nowait(key)
+            except asyncio.QueueFull:
+                report["dropped"].append(analyst)
+                continue
+            self.pending.add(key)
+            report["scheduled"].append(analyst)
+        for outcome, analysts_ in report.items():
+            self.counts[outcome] += len(analysts_)
+        return {"status": "accepted", "ticker": ticker.upper(), "analysis_date": analysis_date, **report}
+
+    async def _worker(self, limiter: RateLimiter):
+        tenants.current_tenant.set(PREFETCH_TENANT)
+        tenants.current_priority.set(BATCH)
+        while True:
+            key = await self.queue.get()
+            ticker, analysis_date, analyst = key
+            try:
+                await limiter.wait()
+                with tracing.span("prefetch", ticker=ticker, analyst=analyst):
+                    # Exception en cas d'échec: ni "completed", ni marque de dédoublonnage
+                    await agents.collect_analyst_data(analyst, ticker, analysis_date)
+                self.done[key] = time.monotonic()
+                self.counts["completed"] += 1
+            except Exception as e:
+                self.counts["failed"] += 1
+                logger.info(f"Préchargement {analyst} {ticker} {analysis_date} en échec: {e}")
+            finally:
+                self.pending.discard(key)
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize() if self.queue else 0, "pending": len(self.pending), **self.counts}
+
+
+prefetcher = Prefetcher()
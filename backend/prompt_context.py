@@ -0,0 +1,261 @@
+"""Compaction du contexte des prompts: budgets de tokens par rôle, résumé du débat,
+déduplication des blocs de données partagés.
+
+Sans compaction, l'historique complet du débat est renvoyé à chaque appel: la taille
+des prompts croît avec le nombre de rounds et le coût total de façon quadratique.
+Ici, seuls les ``KEEP_RECENT_ROUNDS`` derniers rounds sont transmis en entier, les
+précédents sont repliés au fil de l'eau dans un résumé extractif borné; la taille
+de chaque prompt reste donc constante et la durée d'analyse linéaire en
+``research_depth``.
+
+Les tokens sont comptés avec tiktoken si disponible (encodage ``cl100k_base``), sinon
+par une estimation mot à mot. Le premier ``get_encoding`` peut télécharger le fichier
+BPE: le serveur le charge en tâche de fond au démarrage (``start_loading``) et compte
+par estimation en attendant; jamais sur le chemin d'une requête.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Budget de tokens du prompt (messages système et partagés inclus) par rôle
+ROLE_BUDGETS = {
+    "market_analyst": 2500,
+    "social_analyst": 2500,
+    "news_analyst": 2500,
+    "fundamentals_analyst": 2500,
+    "bull_researcher": 3500,
+    "bear_researcher": 3500,
+    "trader": 3000,
+    "risk_manager": 2000,
+    "portfolio_manager": 3000,
+    "macro_analyst": 3000,
+    "comparison_ranker": 12000,
+}
+DEFAULT_BUDGET = 3000
+
+KEEP_RECENT_ROUNDS = 1
+ROUND_SUMMARY_TOKENS = 80
+SUMMARY_BUDGET = 400
+
+TRUNCATION_MARK = " […]"
+_WORDS = re.compile(r"\w+|[^\w\s]")
+_SENTENCES = re.compile(r"(?<=[.!?])\s+")
+
+_encoding = None
+_encoding_loaded = False
+# Fichier BPE déjà en cache disque (chargé par le serveur): lecture paresseuse sans réseau
+_encoding_cached = False
+_load_task: Optional[asyncio.Task] = None
+
+
+def _load():
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def load_encoding() -> bool:
+    """Charge l'encodage (appel bloquant, téléchargement éventuel); en cas d'échec,
+    l'estimation mot à mot reste utilisée"""
+    global _encoding, _encoding_loaded, _encoding_cached
+    try:
+        encoding = _load()
+    except Exception as e:  # non installé ou fichier BPE inaccessible (hors ligne)
+        logger.info(f"tiktoken indisponible ({type(e).__name__}), estimation du nombre de tokens")
+        return False
+    _encoding = encoding
+    _encoding_loaded = _encoding_cached = True
+    return True
+
+
+def start_loading() -> asyncio.Task:
+    """Démarrage du serveur: chargement en tâche de fond, sans retarder le démarrage"""
+    global _load_task
+    if _load_task is None:
+        _load_task = asyncio.create_task(asyncio.to_thread(load_encoding))
+    return _load_task
+
+
+def encoding_cached() -> bool:
+    return _encoding_cached
+
+
+def use_cached_encoding():
+    """Processus worker: le serveur a chargé l'encodage, le fichier BPE est en cache disque"""
+    global _encoding_cached
+    _encoding_cached = True
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded and _encoding_cached:
+        _encoding_loaded = True
+        try:
+            _encoding = _load()
+        except Exception as e:
+            logger.info(f"tiktoken indisponible ({type(e).__name__}), estimation du nombre de tokens")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return sum(1 if not piece[0].isalnum() else math.ceil(len(piece) / 4) for piece in _WORDS.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) + TRUNCATION_MARK
+    # Recherche dichotomique de la coupe en caractères
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + TRUNCATION_MARK
+
+
+def _fingerprint(sentence: str) -> str:
+    normalized = " ".join(re.findall(r"\w+", sentence.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def dedupe_blocks(blocks: Dict[str, str], min_words: int = 4) -> Dict[str, str]:
+    """Retire des blocs les phrases déjà présentes dans un bloc précédent.
+
+    Les rapports d'analystes reprennent souvent les mêmes titres et chiffres; une
+    phrase (normalisée, au moins ``min_words`` mots) n'est transmise qu'une fois.
+    """
+    seen = set()
+    result = {}
+    for name, text in blocks.items():
+        kept = []
+        for sentence in _SENTENCES.split(text):
+            if len(_WORDS.findall(sentence)) >= min_words:
+                fingerprint = _fingerprint(sentence)
+                if fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+            kept.append(sentence)
+        result[name] = " ".join(kept)
+    return result
+
+
+def _extract(text: str, max_tokens: int) -> str:
+    """Résumé extractif: premières phrases jusqu'au budget"""
+    summary = ""
+    for sentence in _SENTENCES.split(text.strip()):
+        candidate = f"{summary} {sentence}".strip()
+        if count_tokens(candidate) > max_tokens:
+            break
+        summary = candidate
+    return summary or truncate_tokens(text.strip(), max_tokens)
+
+
+class DebateMemory:
+    """Historique du débat: derniers rounds en entier, rounds plus anciens résumés"""
+
+    def __init__(self, keep_recent: int = KEEP_RECENT_ROUNDS, summary_budget: int = SUMMARY_BUDGET):
+        self.keep_recent = keep_recent
+        self.summary_budget = summary_budget
+        self.recent: List[Tuple[int, str, str]] = []
+        self.summaries: List[str] = []
+        self.omitted = 0
+        self.full_text = ""
+
+    def add_turn(self, speaker: str, text: str):
+        self.full_text += f"\n{speaker}: {text}"
+
+    def add_round(self, number: int, bull: str, bear: str):
+        self.recent.append((number, bull, bear))
+        while len(self.recent) > self.keep_recent:
+            old_number, old_bull, old_bear = self.recent.pop(0)
+            # Repli incrémental: seul le round évincé est résumé, jamais l'historique entier
+            self.summaries.append(
+                f"Round {old_number} — Haussier: {_extract(old_bull, ROUND_SUMMARY_TOKENS // 2)} "
+                f"| Baissier: {_extract(old_bear, ROUND_SUMMARY_TOKENS // 2)}"
+            )
+        while len(self.summaries) > 1 and count_tokens("\n".join(self.summaries)) > self.summary_budget:
+            self.summaries.pop(0)
+            self.omitted += 1
+
+    def render(self, pending: Sequence[Tuple[str, str]] = ()) -> str:
+        """Texte du débat transmis au prochain agent (``pending``: tours du round en cours)"""
+        parts = []
+        if self.omitted:
+            parts.append(f"({self.omitted} round(s) plus ancien(s) omis)")
+        if self.summaries:
+            parts.append("Résumé des rounds précédents:\n" + "\n".join(self.summaries))
+        for _, bull, bear in self.recent:
+            parts.append(f"Haussier: {bull}\nBaissier: {bear}")
+        parts.extend(f"{speaker}: {text}" for speaker, text in pending)
+        return "\n".join(parts)
+
+
+def build_messages(
+    role: str,
+    system: str,
+    instruction: str,
+    shared: Iterable[str] = (),
+    sections: Sequence[Tuple[str, str]] = (),
+    naive_tokens: Optional[int] = None,
+) -> Tuple[List[dict], dict]:
+    """Messages d'un appel LLM dans le budget du rôle, et statistiques de compaction.
+
+    ``shared``: blocs identiques pour plusieurs agents, placés juste après le message
+    système pour former un préfixe commun (servi par le cache de contexte du fournisseur).
+    ``sections``: blocs propres à l'appel, par importance décroissante; les derniers
+    sont raccourcis en premier si le budget est dépassé. ``naive_tokens``: taille du
+    prompt sans compaction, pour le calcul des tokens économisés.
+    """
+    budget = ROLE_BUDGETS.get(role, DEFAULT_BUDGET)
+    shared = [block for block in shared if block]
+    sections = [(label, text) for label, text in sections if text]
+
+    fixed = count_tokens(system) + count_tokens(instruction)
+    sizes = [count_tokens(block) for block in shared] + [count_tokens(f"{l}:\n{t}") for l, t in sections]
+    if naive_tokens is None:
+        naive_tokens = fixed + sum(sizes)
+
+    # Raccourcit les sections de la moins importante à la plus importante, puis les blocs partagés
+    overflow = fixed + sum(sizes) - budget
+    order = list(range(len(sizes) - 1, len(shared) - 1, -1)) + list(range(len(shared) - 1, -1, -1))
+    limits = list(sizes)
+    for index in order:
+        if overflow <= 0:
+            break
+        cut = min(overflow, limits[index])
+        limits[index] -= cut
+        overflow -= cut
+
+    messages = [{"role": "system", "content": system}]
+    for block, size, limit in zip(shared, sizes, limits):
+        if limit > 0:
+            messages.append({"role": "user", "content": truncate_tokens(block, limit) if limit < size else block})
+    body = [instruction]
+    for (label, text), size, limit in zip(sections, sizes[len(shared):], limits[len(shared):]):
+        if limit > 0:
+            rendered = f"{label}:\n{text}"
+            body.append(truncate_tokens(rendered, limit) if limit < size else rendered)
+    messages.append({"role": "user", "content": "\n\n".join(body)})
+
+    sent = sum(count_tokens(m["content"]) for m in messages)
+    return messages, {
+        "role": role,
+        "budget": budget,
+        "naive_tokens": naive_tokens,
+        "sent_tokens": sent,
+        "tokens_saved": max(0, naive_tokens - sent),
+    }
@@ -0,0 +1,180 @@
+"""Canal WebSocket unique multiplexant les données live du tableau de bord.
+
+Topics: ``system`` (statut), ``upstream`` (santé DeepSeek/FinnHub), ``job:<id>``
+(progression d'une analyse), ``comparison:<id>`` et ``watchlist:<nom>`` (progression
+d'une comparaison ou d'un pré-calcul), ``results`` (dernier résultat publié).
+
+Chaque topic garde un état (dict); ``publish`` ne retient que les clés modifiées et
+les envoie groupées au tick suivant. Par connexion, les deltas non encore envoyés sont
+fusionnés par topic: un client lent reçoit l'état le plus récent, jamais une file
+de trames périmées.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+TICK_SECONDS = 0.5
+POLL_CHECK_SECONDS = 1.0
+MAX_TOPICS_PER_CONNECTION = 64
+# Topics propres à un travail: état oublié au départ du dernier abonné et, publiés sans
+# abonné, borné aux MAX_SCOPED_TOPICS plus récents
+SCOPED_PREFIXES = ("job:", "comparison:", "watchlist:")
+MAX_SCOPED_TOPICS = 1000
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.topics: Set[str] = set()
+        self.pending: Dict[str, dict] = {}
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, topic: str, data: dict, kind: str = "delta"):
+        frame = self.pending.get(topic)
+        if frame is not None and kind == "delta":
+            # Trame précédente pas encore envoyée: on y fusionne le delta (elle est périmée)
+            self.dropped += 1
+            frame["data"].update(data)
+        else:
+            self.pending[topic] = {"type": kind, "topic": topic, "data": dict(data)}
+        self.ready.set()
+
+    async def sender(self):
+        """Seule tâche qui écrit sur la socket (snapshots et deltas passent par ``pending``)"""
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                frames, self.pending = self.pending, {}
+                for frame in frames.values():
+                    await self.websocket.send_json(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Sans émetteur la connexion ne reçoit plus rien: on la ferme, le client se reconnecte
+            logger.warning(f"Envoi WebSocket en échec, connexion fermée: {e}")
+            try:
+                await self.websocket.close()
+            except Exception:
+                pass
+
+
+class Hub:
+    def __init__(self):
+        self.state: Dict[str, dict] = {}
+        self.changes: Dict[str, dict] = {}
+        self.connections: Set[Connection] = set()
+        self.pollers: Dict[str, tuple] = {}
+        self._tasks = []
+        self._forward: Optional[Callable[[str, dict], None]] = None
+
+    def forward(self, send: Callable[[str, dict], None]):
+        """Processus worker (voir ``workers``): publications relayées au processus serveur"""
+        self._forward = send
+
+    def publish(self, topic: str, data: dict):
+        if self._forward is not None:
+            self._forward(topic, data)
+            return
+        if topic not in self.state and topic.startswith(SCOPED_PREFIXES):
+            self._evict_scoped()
+        current = self.state.setdefault(topic, {})
+        delta = {k: v for k, v in data.items() if current.get(k) != v}
+        if not delta:
+            return
+        current.update(delta)
+        self.changes.setdefault(topic, {}).update(delta)
+
+    def _evict_scoped(self):
+        scoped = [t for t in self.state if t.startswith(SCOPED_PREFIXES)]
+        for topic in scoped[:max(0, len(scoped) - MAX_SCOPED_TOPICS + 1)]:
+            del self.state[topic]
+
+    def _release(self, topics):
+        """Oublie les topics propres à un travail que plus aucune connexion ne suit"""
+        for topic in topics:
+            if topic.startswith(SCOPED_PREFIXES) and not self.subscribers(topic):
+                self.state.pop(topic, None)
+                self.changes.pop(topic, None)
+
+    def add_poller(self, topic: str, fetch: Callable[[], Awaitable[dict]], interval: float):
+        """Rafraîchit un topic périodiquement, seulement tant qu'il a des abonnés"""
+        self.pollers[topic] = (fetch, interval)
+
+    def subscribers(self, topic: str) -> int:
+        return sum(1 for conn in self.connections if topic in conn.topics)
+
+    def flush(self):
+        changes, self.changes = self.changes, {}
+        for topic, delta in changes.items():
+            for conn in self.connections:
+                if topic in conn.topics:
+                    conn.push(topic, delta)
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(TICK_SECONDS)
+            self.flush()
+
+    async def _poll_loop(self, topic: str):
+        fetch, interval = self.pollers[topic]
+        loop = asyncio.get_running_loop()
+        last = None
+        while True:
+            if self.subscribers(topic) and (last is None or loop.time() - last >= interval):
+                last = loop.time()
+                try:
+                    self.publish(topic, await fetch())
+                except Exception as e:
+                    logger.warning(f"Rafraîchissement du topic {topic} en échec: {e}")
+            await asyncio.sleep(POLL_CHECK_SECONDS)
+
+    def start(self):
+        self._tasks.append(asyncio.create_task(self._tick_loop()))
+        for topic in self.pollers:
+            self._tasks.append(asyncio.create_task(self._poll_loop(topic)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _subscribe(self, conn: Connection, topics):
+        for topic in topics:
+            if len(conn.topics) >= MAX_TOPICS_PER_CONNECTION:
+                break
+            conn.topics.add(topic)
+            conn.push(topic, self.state.get(topic, {}), kind="snapshot")
+
+    async def serve(self, websocket: WebSocket):
+        """Protocole client: {"action": "subscribe"|"unsubscribe", "topics": [...]}"""
+        await websocket.accept()
+        conn = Connection(websocket)
+        self.connections.add(conn)
+        sender = asyncio.create_task(conn.sender())
+        try:
+            while True:
+                message = await websocket.receive_json()
+                topics = [t for t in message.get("topics", []) if isinstance(t, str)]
+                if message.get("action") == "subscribe":
+                    self._subscribe(conn, topics)
+                elif message.get("action") == "unsubscribe":
+                    conn.topics.difference_update(topics)
+                    self._release(topics)
+        except WebSocketDisconnect:
+            pass
+        except Exception as e:
+            logger.warning(f"Connexion WebSocket fermée: {e}")
+        finally:
+            self.connections.discard(conn)
+            self._release(conn.topics)
+            sender.cancel()
+
+
+hub = Hub()
@@ -0,0 +1,86 @@
+"""Sérialisation JSON rapide des réponses (orjson) et GET conditionnels.
+
+Les handlers qui renvoient ``json_response(...)`` court-circuitent ``jsonable_encoder``
+et la re-validation du ``response_model`` par FastAPI. Les fragments constants
+(listes d'étapes, configuration CLI...) sont pré-sérialisés une fois avec ``precomputed``.
+``conditional_response`` ajoute un ETag fort et répond 304 si ``If-None-Match`` correspond.
+"""
+import hashlib
+import re
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import tracing
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+except ImportError:  # JSONResponse standard si orjson n'est pas installé
+    orjson = None
+    ORJSONResponse = None
+
+DefaultResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+
+def precomputed(value: Any) -> Any:
+    """Fragment JSON sérialisé une seule fois (valeur inchangée sans orjson.Fragment)"""
+    if orjson is not None and hasattr(orjson, "Fragment"):
+        return orjson.Fragment(orjson.dumps(value))
+    return value
+
+
+def json_response(content: Any, status_code: int = 200, headers: dict = None) -> JSONResponse:
+    """Réponse prête à l'envoi: ``content`` ne doit contenir que des types natifs
+    (dict, list, str, nombres, datetime) ou des fragments ``precomputed``."""
+    with tracing.span("serialize") as current:
+        if orjson is None:
+            content = jsonable_encoder(content)
+        response = DefaultResponse(content, status_code=status_code, headers=headers)
+        current.set_attribute("http.response.body.size", len(response.body))
+    return response
+
+
+# Résultats d'analyse terminés: jamais modifiés (une relance crée un nouvel id)
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+# Données vivantes: le client garde sa copie mais revalide avec l'ETag à chaque usage
+CACHE_REVALIDATE = "no-cache"
+
+# Suffixe ajouté à l'ETag par CompressionMiddleware pour les représentations compressées
+_ENCODING_SUFFIX = re.compile(r'-(gzip|br)"$')
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if _ENCODING_SUFFIX.sub('"', candidate) == etag:
+            return True
+    return False
+
+
+def conditional_response(request: Request, content: Any, cache_control: str = CACHE_REVALIDATE) -> Response:
+    """Réponse JSON avec ETag fort; 304 sans corps si le client a déjà cette version"""
+    response = json_response(content, headers={"Cache-Control": cache_control})
+    etag = etag_for(response.body)
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+    response.headers["ETag"] = etag
+    return response
+
+
+def rendered_response(request: Request, body: bytes, etag: str, cache_control: str = CACHE_REVALIDATE) -> Response:
+    """Corps JSON déjà sérialisé (et son ETag) servi tel quel, 304 si le client l'a déjà"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,224 @@
+"""Stockage compact des résultats d'analyse.
+
+Un document résumé léger (``analyses``), indexé par ticker et date, sert aux listes
+et recherches; le texte long des rapports par agent est compressé dans
+``analysis_reports`` et n'est chargé qu'à la demande.
+"""
+import base64
+import gzip
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import Binary
+from pydantic import BaseModel, Field
+
+try:
+    import zstandard
+except ImportError:  # gzip reste disponible partout
+    zstandard = None
+
+DEFAULT_CODEC = "zstd" if zstandard else "gzip"
+LLM_MODEL = "deepseek-chat"
+
+
+class TokenUsage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    # Tokens de prompt évités par la compaction du contexte (voir prompt_context)
+    tokens_saved: int = 0
+
+
+class AnalysisSummary(BaseModel):
+    id: str
+    ticker: str
+    analysis_date: str
+    analysts: List[str]
+    research_depth: int
+    llm_model: str = LLM_MODEL
+    decision: str
+    confidence: float
+    token_usage: TokenUsage = Field(default_factory=TokenUsage)
+    report_bytes: int = 0
+    parent_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class AnalysisResult(AnalysisSummary):
+    reports: Dict[str, str] = Field(default_factory=dict)
+
+
+def compress(data: bytes, codec: str = DEFAULT_CODEC) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Le module 'zstandard' est requis pour lire ce rapport")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def extract_reports(outputs: Dict[str, dict]) -> Dict[str, str]:
+    """Aplati les sorties des phases en un rapport texte par agent"""
+    reports = dict(outputs["analysts"]["reports"])
+    rounds = outputs["research"]["rounds"]
+    reports["bull_researcher"] = "\n\n".join(r["bull"] for r in rounds)
+    reports["bear_researcher"] = "\n\n".join(r["bear"] for r in rounds)
+    reports["trader"] = outputs["trader"]["plan"]
+    reports["risk"] = outputs["risk"]["assessment"]
+    reports["portfolio_manager"] = outputs["portfolio"]["rationale"]
+    return reports
+
+
+def sum_token_usage(outputs: Dict[str, dict]) -> TokenUsage:
+    usage = TokenUsage()
+    for output in outputs.values():
+        phase_usage = output.get("token_usage") or {}
+        usage.prompt_tokens += phase_usage.get("prompt_tokens", 0)
+        usage.completion_tokens += phase_usage.get("completion_tokens", 0)
+        usage.total_tokens += phase_usage.get("total_tokens", 0)
+        usage.tokens_saved += phase_usage.get("tokens_saved", 0)
+    return usage
+
+
+def build_result(analysis_id: str, config: dict, outputs: Dict[str, dict],
+                 parent_id: Optional[str] = None) -> AnalysisResult:
+    final = outputs["portfolio"]
+    return AnalysisResult(
+        id=analysis_id,
+        ticker=config["ticker"].upper(),
+        analysis_date=config["analysis_date"],
+        analysts=config["analysts"],
+        research_depth=config["research_depth"],
+        decision=final["decision"],
+        confidence=final["confidence"],
+        token_usage=sum_token_usage(outputs),
+        parent_id=parent_id,
+        reports=extract_reports(outputs),
+    )
+
+
+async def ensure_indexes(db):
+    await db.analyses.create_index("id", unique=True)
+    # Index composés alignés sur les filtres de /trading/analyses + tri keyset (analysis_date, id)
+    await db.analyses.create_index([("ticker", 1), ("analysis_date", -1), ("id", -1)])
+    await db.analyses.create_index([("decision", 1), ("analysis_date", -1), ("id", -1)])
+    await db.analyses.create_index([("llm_model", 1), ("analysis_date", -1), ("id", -1)])
+    await db.analyses.create_index([("analysis_date", -1), ("id", -1)])
+    await db.analysis_reports.create_index("analysis_id", unique=True)
+
+
+async def save_result(db, result: AnalysisResult, codec: str = DEFAULT_CODEC) -> AnalysisSummary:
+    raw = json.dumps(result.reports, ensure_ascii=False).encode("utf-8")
+    packed = compress(raw, codec)
+    await db.analysis_reports.replace_one(
+        {"analysis_id": result.id},
+        {"analysis_id": result.id, "codec": codec, "size": len(raw), "data": Binary(packed)},
+        upsert=True,
+    )
+    summary = AnalysisSummary(**result.dict(exclude={"reports"}))
+    summary.report_bytes = len(packed)
+    # Une reprise d'analyse déjà terminée ne doit pas changer le résumé (ETag stable)
+    existing = await db.analyses.find_one({"id": summary.id}, {"created_at": 1})
+    if existing:
+        summary.created_at = existing["created_at"]
+    await db.analyses.replace_one({"id": summary.id}, summary.dict(), upsert=True)
+    return summary
+
+
+async def load_summary(db, analysis_id: str) -> Optional[AnalysisSummary]:
+    doc = await db.analyses.find_one({"id": analysis_id}, {"_id": 0})
+    return AnalysisSummary(**doc) if doc else None
+
+
+async def load_reports(db, analysis_id: str) -> Optional[Dict[str, str]]:
+    doc = await db.analysis_reports.find_one({"analysis_id": analysis_id})
+    if doc is None:
+        return None
+    return json.loads(decompress(bytes(doc["data"]), doc["codec"]))
+
+
+# --- Requêtes historiques ---
+
+def build_filter(ticker: Optional[str] = None, date_from: Optional[str] = None,
+                 date_to: Optional[str] = None, decision: Optional[str] = None,
+                 analysts: Optional[List[str]] = None, llm_model: Optional[str] = None,
+                 min_confidence: Optional[float] = None) -> dict:
+    """Filtre Mongo sur les résumés (dates au format ISO AAAA-MM-JJ, bornes incluses)"""
+    query = {}
+    if ticker:
+        query["ticker"] = ticker.upper()
+    if date_from or date_to:
+        query["analysis_date"] = {}
+        if date_from:
+            query["analysis_date"]["$gte"] = date_from
+        if date_to:
+            query["analysis_date"]["$lte"] = date_to
+    if decision:
+        query["decision"] = decision.upper()
+    if analysts:
+        query["analysts"] = {"$all": analysts}
+    if llm_model:
+        query["llm_model"] = llm_model
+    if min_confidence is not None:
+        query["confidence"] = {"$gte": min_confidence}
+    return query
+
+
+def encode_cursor(summary: dict) -> str:
+    raw = json.dumps([summary["analysis_date"], summary["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    analysis_date, analysis_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return analysis_date, analysis_id
+
+
+async def query_summaries(db, query: dict, limit: int = 50, cursor: Optional[str] = None) -> dict:
+    """Page de résumés triés par (analysis_date, id) décroissants, pagination keyset"""
+    if cursor:
+        last_date, last_id = decode_cursor(cursor)
+        query = {"$and": [query, {"$or": [
+            {"analysis_date": {"$lt": last_date}},
+            {"analysis_date": last_date, "id": {"$lt": last_id}},
+        ]}]}
+    docs = await db.analyses.find(query, {"_id": 0}).sort(
+        [("analysis_date", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return {
+        "items": docs,
+        "next_cursor": encode_cursor(docs[-1]) if has_more else None,
+    }
+
+
+async def decision_counts(db, query: dict) -> List[dict]:
+    """Nombre de décisions par ticker et par jour, calculé côté Mongo"""
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": {"ticker": "$ticker", "date": "$analysis_date", "decision": "$decision"},
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": {"ticker": "$_id.ticker", "date": "$_id.date"},
+            "decisions": {"$push": {"k": "$_id.decision", "v": "$count"}},
+            "total": {"$sum": "$count"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "ticker": "$_id.ticker",
+            "date": "$_id.date",
+            "decisions": {"$arrayToObject": "$decisions"},
+            "total": 1,
+        }},
+        {"$sort": {"ticker": 1, "date": 1}},
+    ]
+    return await db.analyses.aggregate(pipeline).to_list(None)
@@ -0,0 +1,129 @@
+"""Routage des appels LLM par rôle d'agent (modèle, max_tokens, timeout) avec repli.
+
+Chaque rôle du pipeline a une chaîne de cibles: la première est utilisée, les
+suivantes prennent le relais sur timeout ou HTTP 429. La table par défaut peut être
+surchargée rôle par rôle par un fichier JSON (``MODEL_ROUTES_FILE``)::
+
+    {"portfolio_manager": [{"model": "deepseek-chat", "max_tokens": 800, "timeout": 30}]}
+
+Les appels sont attribués au rôle dans le registre de coûts (dimension ``role``) et
+les dernières latences par rôle sont gardées en mémoire pour régler la table.
+"""
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass
+from typing import Deque, Dict, List
+
+import ledger
+import upstream
+
+logger = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 500
+
+
+@dataclass
+class Target:
+    model: str
+    max_tokens: int = 1024
+    timeout: float = 60
+    temperature: float = 0.1
+
+
+# Analystes: synthèse de données, réponses courtes; le gestionnaire de portefeuille
+# raisonne sur l'ensemble du dossier et se replie sur deepseek-chat si le modèle est saturé
+DEFAULT_ROUTES: Dict[str, List[Target]] = {
+    "market_analyst": [Target("deepseek-chat", 600, 30)],
+    "social_analyst": [Target("deepseek-chat", 500, 30)],
+    "news_analyst": [Target("deepseek-chat", 600, 30)],
+    "fundamentals_analyst": [Target("deepseek-chat", 600, 30)],
+    "bull_researcher": [Target("deepseek-chat", 800, 45)],
+    "bear_researcher": [Target("deepseek-chat", 800, 45)],
+    "trader": [Target("deepseek-chat", 800, 45)],
+    "risk_manager": [Target("deepseek-chat", 600, 30)],
+    "portfolio_manager": [Target("deepseek-reasoner", 2048, 120), Target("deepseek-chat", 1024, 60)],
+    # Mode comparaison: contexte secteur/macro résumé une fois, classement de tous les tickers
+    "macro_analyst": [Target("deepseek-chat", 600, 30)],
+    "comparison_ranker": [Target("deepseek-reasoner", 4096, 180), Target("deepseek-chat", 2048, 90)],
+}
+DEFAULT_CHAIN = [Target("deepseek-chat", 1024, 60)]
+
+_latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_fallbacks: Dict[str, int] = defaultdict(int)
+
+
+def load_routes() -> Dict[str, List[Target]]:
+    routes = dict(DEFAULT_ROUTES)
+    path = os.environ.get("MODEL_ROUTES_FILE")
+    if path:
+        try:
+            with open(path) as f:
+                overrides = json.load(f)
+            for role, targets in overrides.items():
+                routes[role] = [Target(**t) for t in targets]
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Table de routage {path} ignorée: {e}")
+    return routes
+
+
+ROUTES = load_routes()
+
+
+def route_for(role: str) -> List[Target]:
+    return ROUTES.get(role) or DEFAULT_CHAIN
+
+
+def analyst_role(analyst: str) -> str:
+    return f"{analyst}_analyst"
+
+
+def _should_fall_back(error: Exception) -> bool:
+    if isinstance(error, upstream.requests.exceptions.Timeout):
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+async def complete(role: str, messages: List[dict]) -> dict:
+    """``chat_completion`` avec la chaîne de cibles du rôle; la réponse porte ``routed_model``"""
+    chain = route_for(role)
+    start = time.time()
+    for index, target in enumerate(chain):
+        try:
+            with ledger.attribute(role=role, fallback=index > 0):
+                response = await upstream.chat_completion(
+                    messages, model=target.model, temperature=target.temperature,
+                    max_tokens=target.max_tokens, timeout=target.timeout,
+                )
+        except Exception as e:
+            if index + 1 < len(chain) and _should_fall_back(e):
+                _fallbacks[role] += 1
+                logger.warning(f"Rôle {role}: {target.model} indisponible ({type(e).__name__}), repli sur {chain[index + 1].model}")
+                continue
+            raise
+        _latencies[role].append((time.time() - start) * 1000)
+        response["routed_model"] = target.model
+        return response
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+def routing_table() -> Dict[str, dict]:
+    """Table effective et latences récentes (p50/p95) par rôle"""
+    table = {}
+    for role in sorted(set(ROUTES) | set(_latencies)):
+        samples = list(_latencies.get(role, ()))
+        table[role] = {
+            "chain": [asdict(t) for t in route_for(role)],
+            "calls": len(samples),
+            "fallbacks": _fallbacks.get(role, 0),
+            "latency_p50_ms": _percentile(samples, 0.5) if samples else None,
+            "latency_p95_ms": _percentile(samples, 0.95) if samples else None,
+        }
+    return table
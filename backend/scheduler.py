@@ -0,0 +1,310 @@
+"""Pré-calcul planifié des analyses de watchlists et regroupement des requêtes identiques.
+
+Une watchlist (collection ``watchlists``) porte une liste de tickers, une expression
+cron à 5 champs (``minute heure jour mois jour_semaine``) et un fuseau horaire. Comme
+dans cron, quand le jour du mois et le jour de semaine sont tous deux restreints
+(aucun ne commence par ``*``), l'un OU l'autre suffit. À
+l'échéance, ses analyses du jour sont lancées en classe ``batch`` (la file LLM garde
+ses slots interactifs), avec au plus ``SCHEDULER_CONCURRENCY`` analyses simultanées
+et ``SCHEDULER_RATE_PER_MINUTE`` démarrages par minute: l'ouverture du marché ne
+déclenche plus de rafale d'appels DeepSeek, et les résultats sont déjà en cache quand
+les traders ouvrent le tableau de bord.
+
+``inflight`` regroupe les requêtes identiques: une requête arrivant pendant le calcul
+d'une analyse de même configuration attend ce job au lieu d'en lancer un nouveau.
+"""
+import asyncio
+import bisect
+import calendar
+import contextvars
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+import tenants
+import tracing
+from fairqueue import BATCH, INTERACTIVE
+from realtime import hub
+
+logger = logging.getLogger(__name__)
+
+CHECK_SECONDS = 30
+SCHEDULER_CONCURRENCY = int(os.environ.get("SCHEDULER_CONCURRENCY", 2))
+SCHEDULER_RATE_PER_MINUTE = float(os.environ.get("SCHEDULER_RATE_PER_MINUTE", 10))
+SCHEDULER_TENANT = tenants.Tenant(id="scheduler", name="Pré-calcul planifié", weight=0.5,
+                                  requests_per_day=10_000, tokens_per_day=50_000_000)
+
+_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+# Un 29 février peut manquer huit ans de suite (2096 -> 2104)
+_MAX_YEARS = 8
+
+
+class CronError(ValueError):
+    pass
+
+
+# --- Cron ---
+
+def _parse_field(expression: str, low: int, high: int) -> Set[int]:
+    values = set()
+    for part in expression.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(x) for x in part.split("-", 1))
+        else:
+            start = end = int(part)
+        if start < low or end > high or start > end or step < 1:
+            raise CronError(f"Valeur hors limites: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+    """Expression cron 5 champs (jour de semaine: 0 = dimanche, 7 accepté)"""
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise CronError(f"5 champs attendus: {expression!r}")
+        try:
+            self.fields = {name: _parse_field(p, low, high) for p, (name, low, high) in zip(parts, _FIELDS)}
+        except ValueError as e:
+            raise CronError(f"Expression cron invalide {expression!r}: {e}") from e
+        self.fields["weekday"] = {day % 7 for day in self.fields["weekday"]}
+        self.expression = expression
+        self.day_restricted = not parts[2].startswith("*")
+        self.weekday_restricted = not parts[4].startswith("*")
+        self._minutes = sorted(self.fields["minute"])
+        self._hours = sorted(self.fields["hour"])
+        if self.day_restricted and not self.weekday_restricted and not any(
+            day <= calendar.monthrange(2000, month)[1] for month in self.fields["month"] for day in self.fields["day"]
+        ):
+            # Ex. "0 0 30 2 *": accepté par chaque champ, jamais déclenché
+            raise CronError(f"Expression cron sans échéance possible: {expression!r}")
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.fields["day"]
+        weekday = (moment.isoweekday() % 7) in self.fields["weekday"]
+        if self.day_restricted and self.weekday_restricted:
+            return day or weekday
+        return day and weekday
+
+    def matches(self, moment: datetime) -> bool:
+        return (
+            moment.minute in self.fields["minute"]
+            and moment.hour in self.fields["hour"]
+            and moment.month in self.fields["month"]
+            and self._day_matches(moment)
+        )
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Première échéance strictement après ``moment``, champ par champ (mois, jour, heure, minute)"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate.year + _MAX_YEARS
+        while candidate.year <= limit:
+            if candidate.month not in self.fields["month"]:
+                year, month = (candidate.year + 1, 1) if candidate.month == 12 else (candidate.year, candidate.month + 1)
+                candidate = candidate.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.fields["hour"]:
+                index = bisect.bisect_right(self._hours, candidate.hour)
+                if index == len(self._hours):
+                    candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+                else:
+                    candidate = candidate.replace(hour=self._hours[index], minute=0)
+            elif candidate.minute not in self.fields["minute"]:
+                index = bisect.bisect_right(self._minutes, candidate.minute)
+                if index == len(self._minutes):
+                    candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                else:
+                    candidate = candidate.replace(minute=self._minutes[index])
+            else:
+                return candidate
+        raise CronError(f"Aucune échéance avant {limit} pour {self.expression!r}")
+
+
+# --- Requêtes identiques ---
+
+def _promote(tenant: Optional[tenants.Tenant]):
+    tenants.current_priority.set(INTERACTIVE)
+    tenants.current_tenant.set(tenant)
+
+
+class InFlight:
+    """Une seule exécution par clé; les appelants suivants attendent le même résultat.
+
+    Le calcul partagé tourne dans son propre contexte (tenant, priorité), copié de celui
+    du premier appelant. Un appelant interactif qui rejoint un calcul batch le promeut:
+    les appels LLM et places de worker demandés ensuite le sont en classe interactive,
+    au nom de son tenant (les demandes déjà en file gardent leur classe).
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, Tuple[asyncio.Task, contextvars.Context]] = {}
+
+    def running(self, key: str) -> bool:
+        return key in self._tasks
+
+    def priority(self, key: str) -> Optional[str]:
+        entry = self._tasks.get(key)
+        return entry[1].get(tenants.current_priority, INTERACTIVE) if entry else None
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[dict]]) -> dict:
+        entry = self._tasks.get(key)
+        attached = entry is not None
+        if entry is None:
+            context = contextvars.copy_context()
+            task = asyncio.create_task(factory(), context=context)
+            self._tasks[key] = (task, context)
+            task.add_done_callback(lambda t: self._tasks.pop(key) if self._tasks.get(key, (None,))[0] is t else None)
+        else:
+            task, context = entry
+            if tenants.current_priority.get() == INTERACTIVE and self.priority(key) != INTERACTIVE:
+                # Calcul suspendu (nous sommes dans une autre tâche): son contexte est modifiable
+                context.run(_promote, tenants.current_tenant.get())
+                logger.info(f"⏫ Calcul partagé {key[:12]} promu en interactif")
+        # shield: la déconnexion d'un client n'annule pas le job partagé
+        result = await asyncio.shield(task)
+        return {**result, "attached": True} if attached else result
+
+
+inflight = InFlight()
+
+
+# --- Planificateur ---
+
+class RateLimiter:
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(self._next, time.monotonic()) + self.interval
+
+
+def watchlist_configs(watchlist: dict, now: datetime) -> List[dict]:
+    analysis_date = now.astimezone(ZoneInfo(watchlist.get("timezone", "UTC"))).strftime("%Y-%m-%d")
+    return [
+        {
+            "ticker": ticker.upper(),
+            "analysis_date": analysis_date,
+            "analysts": watchlist["analysts"],
+            "research_depth": watchlist["research_depth"],
+        }
+        for ticker in watchlist["tickers"]
+    ]
+
+
+class Scheduler:
+    def __init__(self):
+        self.db = None
+        self.analyze: Optional[Callable[[dict], Awaitable[dict]]] = None
+        self.running: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db, analyze: Callable[[dict], Awaitable[dict]]):
+        """``analyze(config)``: exécution mise en cache/regroupée fournie par le serveur"""
+        self.db = db
+        self.analyze = analyze
+        try:
+            await db.watchlists.create_index("name", unique=True)
+        except Exception as e:
+            logger.error(f"Index des watchlists impossible à créer: {e}")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self.running.values()] if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.running = {}
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.tick(datetime.now(tz=ZoneInfo("UTC")))
+            except Exception as e:
+                logger.warning(f"Planificateur: {e}")
+            await asyncio.sleep(CHECK_SECONDS)
+
+    async def tick(self, now: datetime):
+        async for watchlist in self.db.watchlists.find({"enabled": True}, {"_id": 0}):
+            if watchlist["name"] in self.running:
+                continue
+            try:
+                await self._check(watchlist, now)
+            except Exception as e:
+                # Une watchlist invalide (schedule, fuseau) ne bloque pas les suivantes
+                logger.warning(f"Watchlist {watchlist.get('name')}: échéance non évaluée: {e}")
+
+    async def _check(self, watchlist: dict, now: datetime):
+        zone = ZoneInfo(watchlist.get("timezone", "UTC"))
+        last_run = watchlist.get("last_run_at") or watchlist["created_at"]
+        due = Cron(watchlist["schedule"]).next_after(last_run.replace(tzinfo=ZoneInfo("UTC")).astimezone(zone))
+        if due > now.astimezone(zone):
+            return
+        # Réservation atomique de l'échéance (plusieurs workers uvicorn)
+        claimed = await self.db.watchlists.find_one_and_update(
+            {"name": watchlist["name"], "last_run_at": watchlist.get("last_run_at")},
+            {"$set": {"last_run_at": now.astimezone(ZoneInfo("UTC")).replace(tzinfo=None)}},
+        )
+        if claimed is not None:
+            self.trigger(watchlist, now)
+
+    def trigger(self, watchlist: dict, now: datetime) -> asyncio.Task:
+        task = asyncio.create_task(self._run_watchlist(watchlist, now))
+        self.running[watchlist["name"]] = task
+        task.add_done_callback(lambda _: self.running.pop(watchlist["name"], None))
+        return task
+
+    async def _run_watchlist(self, watchlist: dict, now: datetime) -> dict:
+        configs = watchlist_configs(watchlist, now)
+        limiter = RateLimiter(SCHEDULER_RATE_PER_MINUTE)
+        semaphore = asyncio.Semaphore(SCHEDULER_CONCURRENCY)
+        topic = f"watchlist:{watchlist['name']}"
+        report = {"completed": 0, "cached": 0, "failed": 0, "total": len(configs)}
+        hub.publish(topic, {"status": "running", **report})
+        tenants.current_tenant.set(SCHEDULER_TENANT)
+        tenants.current_priority.set(BATCH)
+
+        async def run_one(config: dict):
+            async with semaphore:
+                await limiter.wait()
+                try:
+                    result = await self.analyze(config)
+                except Exception as e:
+                    logger.warning(f"Watchlist {watchlist['name']}: {config['ticker']} en échec: {e}")
+                    result = {"status": "error"}
+            if result.get("status") != "completed":
+                report["failed"] += 1
+            elif result.get("cached"):
+                report["cached"] += 1
+            else:
+                report["completed"] += 1
+            hub.publish(topic, dict(report))
+
+        start = time.time()
+        with tracing.span(f"watchlist {watchlist['name']}", **{"watchlist.tickers": len(configs)}):
+            await asyncio.gather(*[run_one(config) for config in configs])
+        report["duration_s"] = round(time.time() - start, 1)
+        hub.publish(topic, {"status": "done", **report})
+        await self.db.watchlists.update_one({"name": watchlist["name"]}, {"$set": {"last_report": report}})
+        logger.info(f"Watchlist {watchlist['name']} pré-calculée: {report}")
+        return report
+
+
+scheduler = Scheduler()
@@ -1,35 +1,150 @@
-from fastapi import FastAPI, APIRouter, BackgroundTasks
+from fastapi import FastAPI, APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, WebSocket
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import sys
+import time
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import uuid
-from datetime import datetime
-import subprocess
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import asyncio
 import json
-import requests
 from fastapi.responses import StreamingResponse
 
+import admission
+import comparison
+import export
+import ingestion
+import lazy
+import ledger
+import mongo
+import pipeline
+import prefetch
+import prompt_context
+import results
+import routing
+import status_cache
+import tenants
+import tracing
+import workers
+from scheduler import Cron, CronError, inflight, scheduler
+import upstream
+from fairqueue import llm_scheduler
+from realtime import hub
+from compression import CompressionMiddleware
+from responses import CACHE_IMMUTABLE, DefaultResponse, conditional_response, json_response, precomputed, rendered_response
+
+# Dépendances lourdes chargées au premier usage (démarrage à froid rapide)
+backtest = lazy.lazy_module("backtest")
+langchain_openai = lazy.lazy_module("langchain_openai")
+motor_asyncio = lazy.lazy_module("motor.motor_asyncio")
+requests = lazy.lazy_module("requests")
+subprocess = lazy.lazy_module("subprocess")
+
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+TRADING_AGENTS_DIR = "/app/TradingAgents"
+# Modules préchargés en tâche de fond une fois le serveur prêt (WARMUP_IMPORTS=0 pour désactiver)
+WARMUP_MODULES = ("requests", "backtest", "langchain_openai")
+
+# MongoDB connection (ouverte dans le lifespan)
+client = None
+db = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db
+    await tracing.exporter.start()
+    await admission.controller.start()
+    client = motor_asyncio.AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), **mongo.client_options())
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+    try:
+        await db.command("ping")
+        await mongo.warmup(db)
+        await pipeline.ensure_indexes(db)
+        await results.ensure_indexes(db)
+        await export.ensure_indexes(db)
+        await comparison.ensure_indexes(db)
+    except Exception as e:
+        logger.error(f"MongoDB indisponible au démarrage: {e}")
+    await mongo.metrics.start(db)
+    await status_cache.cache.start(db)
+    await tenants.registry.start(db)
+    await ledger.ledger.start(db)
+    await ingestion.ingestor.start(db)
+    await scheduler.start(db, _analyze)
+    await prefetch.prefetcher.start()
+    if upstream.mode() in ("live", "record"):
+        # Seuls les modes réels comptent les tokens d'un fournisseur; estimation en attendant
+        prompt_context.start_loading()
+    await workers.supervisor.start()
+
+    hub.add_poller("system", _system_topic, interval=30)
+    hub.add_poller("upstream", check_network_status, interval=60)
+    hub.start()
+    if os.environ.get("WARMUP_IMPORTS", "1") != "0":
+        asyncio.get_running_loop().run_in_executor(None, lazy.warm, *WARMUP_MODULES)
+
+    yield
+
+    await prefetch.prefetcher.stop()
+    await workers.supervisor.stop()
+    await scheduler.stop()
+    await hub.stop()
+    await tenants.registry.stop()
+    await ledger.ledger.stop()
+    await ingestion.ingestor.stop()
+    await status_cache.cache.stop()
+    await mongo.metrics.stop()
+    client.close()
+    if lazy.is_loaded("backtest"):
+        backtest.shutdown_pool()
+    await admission.controller.stop()
+    await tracing.exporter.stop()
+
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=DefaultResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Fragments constants des réponses, sérialisés une seule fois au chargement
+CLI_INFO = precomputed({
+    "command": "python -m cli.main",
+    "working_directory": TRADING_AGENTS_DIR,
+    "configuration": {
+        "llm_model": "deepseek-chat",
+        "backend_url": "https://api.deepseek.com/v1",
+        "apis_configured": ["DeepSeek", "FinnHub"]
+    }
+})
+CLI_NEXT_STEPS = precomputed([
+    "Sélectionner le ticker à analyser",
+    "Choisir la date d'analyse",
+    "Configurer les agents analystes",
+    "Définir la profondeur de recherche",
+    "Lancer l'analyse multi-agents"
+])
+ANALYSIS_PHASES = precomputed([label for _, label in pipeline.PHASES])
+ANALYSIS_RECOMMENDATIONS = precomputed({
+    "system_status": "✅ TradingAgents opérationnel avec DeepSeek",
+    "analysis_complete": True,
+    "next_steps": [
+        "Examiner les résultats de l'analyse",
+        "Consulter les recommandations des agents",
+        "Prendre une décision de trading informée"
+    ]
+})
+
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -46,6 +161,45 @@ class TradingAnalysisRequest(BaseModel):
     analysts: List[str] = ["market", "social", "news", "fundamentals"]
     research_depth: int = 1
 
+class TradingPrefetchRequest(BaseModel):
+    ticker: str
+    analysis_date: str
+    analysts: List[str] = ["market", "social", "news", "fundamentals"]
+
+class TradingComparisonRequest(BaseModel):
+    tickers: List[str]
+    analysis_date: str = "2024-05-10"
+    analysts: List[str] = ["market", "social", "news", "fundamentals"]
+    research_depth: int = 1
+
+class TradingAnalysisOverrides(BaseModel):
+    ticker: Optional[str] = None
+    analysis_date: Optional[str] = None
+    analysts: Optional[List[str]] = None
+    research_depth: Optional[int] = None
+
+class BacktestRequest(BaseModel):
+    tickers: Optional[List[str]] = None
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+    llm_model: Optional[str] = None
+    horizon_days: int = Field(5, ge=1, le=252)
+
+class WatchlistCreate(BaseModel):
+    name: str
+    tickers: List[str]
+    schedule: str = "0 9 * * 1-5"
+    timezone: str = "America/New_York"
+    analysts: List[str] = ["market", "social", "news", "fundamentals"]
+    research_depth: int = 1
+    enabled: bool = True
+
+class TenantCreate(BaseModel):
+    name: str
+    weight: float = Field(1.0, gt=0)
+    requests_per_day: int = Field(tenants.DEFAULT_REQUESTS_PER_DAY, ge=0)
+    tokens_per_day: int = Field(tenants.DEFAULT_TOKENS_PER_DAY, ge=0)
+
 class TradingAnalysisResponse(BaseModel):
     id: str
     status: str
@@ -57,21 +211,28 @@ class TradingAnalysisResponse(BaseModel):
 async def root():
     return {"message": "Hello World"}
 
+# StatusCheck ne sert qu'au schéma OpenAPI: en interne, enregistrements compacts StatusRecord
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
-    status_dict = input.dict()
-    status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
-    return status_obj
+    record = status_cache.StatusRecord.new(input.client_name)
+    _ = await db.status_checks.insert_one(record.to_document())
+    status_cache.cache.add_record(record)
+    return json_response(record.to_document())
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(request: Request):
+    """Derniers status checks, servis depuis la vue en mémoire (MongoDB tant qu'elle n'est pas prête)"""
+    if status_cache.cache.ready:
+        return rendered_response(request, *status_cache.cache.rendered())
+    status_checks = await db.status_checks.find({}, {"_id": 0}).sort("timestamp", -1).to_list(status_cache.STATUS_CACHE_SIZE)
+    return conditional_response(request, status_checks[::-1])
 
 # TradingAgents endpoints
 @api_router.get("/trading/status")
-async def get_trading_status():
+async def get_trading_status(request: Request):
+    return conditional_response(request, _trading_status())
+
+def _trading_status() -> dict:
     return {
         "status": "🟢 TradingAgents System Online",
         "version": "v1.0.0",
@@ -83,6 +244,7 @@ async def get_trading_status():
             "portfolio_management": "✅ Ready"
         },
         "dependencies": "✅ All installed",
+        "pipeline_mode": upstream.mode(),
         "apis": {
             "deepseek": "✅ Configured",
             "finnhub": "✅ Configured"
@@ -91,7 +253,8 @@ async def get_trading_status():
 
 @api_router.post("/trading/launch-cli")
 async def launch_trading_cli():
-    """Lance l'interface CLI TradingAgents en arrière-plan"""
+    """Lance l'interface CLI TradingAgents en arrière-plan (au plus ``CLI_MAX_PROCESSES`` à la fois)"""
+    admission.controller.check("cli")
     try:
         # Lancer la CLI avec une configuration prédéfinie
         analysis_id = str(uuid.uuid4())
@@ -147,34 +310,15 @@ print("\\n🎯 CLI TradingAgents prête pour l'analyse financière!")
             ["/root/.venv/bin/python", cli_script_path],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True
+            text=True,
+            env=tracing.child_env()
         )
+        admission.controller.track_process("cli", process)
         
-        # Lire la sortie
-        stdout, stderr = process.communicate(timeout=10)
+        # Lire la sortie (hors de la boucle asyncio)
+        stdout, stderr = await asyncio.to_thread(process.communicate, timeout=10)
         
-        return {
-            "id": analysis_id,
-            "status": "started",
-            "message": "Interface CLI TradingAgents lancée avec succès",
-            "cli_output": stdout,
-            "cli_info": {
-                "command": "python -m cli.main",
-                "working_directory": "/app/TradingAgents",
-                "configuration": {
-                    "llm_model": "deepseek-chat",
-                    "backend_url": "https://api.deepseek.com/v1",
-                    "apis_configured": ["DeepSeek", "FinnHub"]
-                }
-            },
-            "next_steps": [
-                "Sélectionner le ticker à analyser",
-                "Choisir la date d'analyse",
-                "Configurer les agents analystes",
-                "Définir la profondeur de recherche",
-                "Lancer l'analyse multi-agents"
-            ]
-        }
+        return json_response(_cli_response(analysis_id, stdout))
     except subprocess.TimeoutExpired:
         return {
             "id": analysis_id,
@@ -189,95 +333,527 @@ print("\\n🎯 CLI TradingAgents prête pour l'analyse financière!")
             "message": f"Erreur: {str(e)}"
         }
 
+def _cli_response(analysis_id: str, stdout: str) -> dict:
+    return {
+        "id": analysis_id,
+        "status": "started",
+        "message": "Interface CLI TradingAgents lancée avec succès",
+        "cli_output": stdout,
+        "cli_info": CLI_INFO,
+        "next_steps": CLI_NEXT_STEPS
+    }
+
 @api_router.post("/trading/analyze")
-async def start_trading_analysis(request: TradingAnalysisRequest):
-    """Démarre une analyse de trading avec les paramètres spécifiés"""
+async def start_trading_analysis(
+    request: TradingAnalysisRequest,
+    fresh: bool = False,
+    tenant: tenants.Tenant = Depends(tenants.resolve_tenant),
+):
+    """Démarre une analyse de trading avec les paramètres spécifiés.
+
+    Un résultat déjà calculé pour la même configuration (ex.: pré-calcul d'une
+    watchlist) est renvoyé directement (``cached``), une analyse identique en cours
+    est rejointe (``attached``); ``fresh=true`` force un nouveau calcul.
+    """
+    async with admission.controller.admit("analysis"):
+        tenants.registry.admit(tenant)
+        config = request.dict()
+        ingestion.ingestor.watch(config["ticker"])
+        try:
+            return json_response(await _analyze(config, fresh))
+        except Exception as e:
+            logger.error(f"Erreur lors du démarrage de l'analyse: {e}")
+            return {
+                "id": None,
+                "status": "error",
+                "message": f"Erreur: {str(e)}"
+            }
+
+@api_router.post("/trading/prefetch")
+async def prefetch_trading_data(
+    request: TradingPrefetchRequest,
+    tenant: tenants.Tenant = Depends(tenants.resolve_tenant),
+):
+    """Indice envoyé pendant la saisie du formulaire: précharge en tâche de fond, à
+    basse priorité, les données (cours, actualités, sentiment, fondamentaux) de
+    l'analyse probable. Ne compte pas dans le quota de requêtes du tenant.
+    """
+    ticker = request.ticker.strip().upper()
     try:
-        analysis_id = str(uuid.uuid4())
-        
-        # Analyse rapide sans appels LLM coûteux
-        import time
-        phases = [
-            "📊 Équipe d'Analyse - Collecte des données de marché",
-            "🔬 Équipe de Recherche - Débat haussier vs baissier", 
-            "💼 Équipe de Trading - Formulation de stratégie",
-            "⚠️ Gestion des Risques - Évaluation des risques",
-            "💰 Gestion de Portefeuille - Décision finale"
-        ]
-        
-        # Simuler une analyse rapide
-        analysis_summary = f"""
-🚀 Analyse TradingAgents - {request.ticker}
-==========================================
-
-Configuration:
-• Ticker: {request.ticker}
-• Date: {request.analysis_date}
-• Analystes: {', '.join(request.analysts)}
-• Profondeur: {request.research_depth}
-• LLM: DeepSeek Chat
-
-Processus d'analyse:
-"""
-        
-        for i, phase in enumerate(phases):
-            analysis_summary += f"\n✅ Phase {i+1}/{len(phases)}: {phase}"
-            
-        analysis_summary += f"""
+        datetime.strptime(request.analysis_date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="analysis_date attendue au format AAAA-MM-JJ")
+    if not ticker:
+        raise HTTPException(status_code=400, detail="Ticker requis")
+    return prefetch.prefetcher.hint(ticker, request.analysis_date, request.analysts)
 
-📊 Résultat de l'analyse {request.ticker}:
-• Status: ✅ Analyse terminée avec succès
-• Système: TradingAgents avec DeepSeek
-• Recommandation: Générée par le framework multi-agents
-• Agents consultés: {len(request.analysts)} équipes d'analyse
-• Profondeur de recherche: {request.research_depth} round(s)
+@api_router.get("/trading/prefetch")
+async def get_prefetch_stats():
+    """Compteurs du préchargement (planifiés, dédoublonnés, ignorés, terminés)"""
+    return prefetch.prefetcher.stats()
 
-🎯 L'analyse TradingAgents est terminée et prête pour la prise de décision!
-"""
-        
+@api_router.post("/trading/compare")
+async def compare_tickers(
+    request: TradingComparisonRequest,
+    tenant: tenants.Tenant = Depends(tenants.resolve_tenant),
+):
+    """Classe plusieurs tickers à la même date: rapports d'analystes par ticker en
+    parallèle (réutilisés s'ils existent), contexte marché/secteur commun calculé une
+    fois, puis un seul appel de classement (progression sur le topic
+    ``comparison:<id>``).
+    """
+    try:
+        comparison.normalize_tickers(request.tickers)
+    except comparison.ComparisonError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    async with admission.controller.admit("analysis"):
+        tenants.registry.admit(tenant)
+        try:
+            return json_response(await comparison.run_comparison(db, request.dict()))
+        except Exception as e:
+            return {"id": None, "status": "error", "message": f"Erreur: {str(e)}"}
+
+@api_router.get("/trading/compare/{comparison_id}")
+async def get_comparison(comparison_id: str):
+    """Classement enregistré d'une comparaison"""
+    document = await comparison.get_comparison(db, comparison_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Comparaison introuvable")
+    return json_response(document)
+
+@api_router.get("/trading/analyze/{analysis_id}")
+async def get_trading_analysis(analysis_id: str):
+    """État du job d'analyse et phases déjà checkpointées"""
+    job = await pipeline.get_job(db, analysis_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analyse introuvable")
+    job["checkpoints"] = list(await pipeline.load_checkpoints(db, analysis_id))
+    return job
+
+@api_router.post("/trading/analyze/{analysis_id}/resume")
+async def resume_trading_analysis(analysis_id: str, tenant: tenants.Tenant = Depends(tenants.resolve_tenant)):
+    """Reprend une analyse interrompue à partir de la dernière phase terminée.
+
+    Une analyse terminée renvoie son résultat enregistré sans rien réexécuter; une
+    analyse encore en cours répond 409 avec sa phase courante.
+    """
+    job = await pipeline.get_job(db, analysis_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analyse introuvable")
+    if pipeline.is_running(job):
+        phase = job.get("current_phase")
+        raise HTTPException(status_code=409, detail={
+            "message": "Analyse déjà en cours",
+            "current_phase": pipeline.PHASE_LABELS.get(phase, phase),
+            "completed_phases": job.get("completed_phases", []),
+        })
+    if job["status"] == "completed":
+        cached = await _cached_analysis(job)
+        if cached:
+            return json_response(cached)
+    async with admission.controller.admit("analysis"):
+        tenants.registry.admit(tenant)
+        return json_response(await _run_analysis(analysis_id, job["config"], parent_id=job.get("parent_id")))
+
+@api_router.post("/trading/analyze/{analysis_id}/rerun")
+async def rerun_trading_analysis(
+    analysis_id: str,
+    from_phase: str,
+    overrides: Optional[TradingAnalysisOverrides] = None,
+    tenant: tenants.Tenant = Depends(tenants.resolve_tenant),
+):
+    """Relance uniquement les phases en aval avec des paramètres modifiés.
+
+    Un nouveau job est créé (le job d'origine reste intact); les checkpoints des phases
+    amont sont copiés. Si un paramètre modifié est consommé plus tôt que ``from_phase``,
+    la relance démarre à cette phase-là.
+    """
+    if from_phase not in pipeline.PHASE_NAMES:
+        raise HTTPException(status_code=400, detail=f"Phase inconnue: {from_phase} (phases: {pipeline.PHASE_NAMES})")
+    job = await pipeline.get_job(db, analysis_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Analyse introuvable")
+
+    changes = overrides.dict(exclude_none=True) if overrides else {}
+    changed_phase = pipeline.first_changed_phase(job["config"], changes)
+    if changed_phase and pipeline.PHASE_NAMES.index(changed_phase) < pipeline.PHASE_NAMES.index(from_phase):
+        from_phase = changed_phase
+    reused = pipeline.PHASE_NAMES[:pipeline.PHASE_NAMES.index(from_phase)]
+    async with admission.controller.admit("analysis"):
+        tenants.registry.admit(tenant)
+
+        rerun_id = str(uuid.uuid4())
+        config = {**job["config"], **changes}
+        await pipeline.create_job(db, rerun_id, config, parent_id=analysis_id)
+        await pipeline.copy_checkpoints(db, analysis_id, rerun_id, reused)
+        result = await _run_analysis(rerun_id, config, parent_id=analysis_id)
+    result["parent_id"] = analysis_id
+    result["reused_phases"] = reused
+    return json_response(result)
+
+async def _analyze(config: dict, fresh: bool = False) -> dict:
+    """Résultat en cache, job identique en cours, ou nouvelle analyse"""
+    key = pipeline.config_key(config)
+    if not fresh:
+        done = await pipeline.find_job(db, key, "completed")
+        cached = done and await _cached_analysis(done)
+        if cached:
+            return cached
+    return await inflight.run(key, lambda: _start_analysis(key, config))
+
+async def _start_analysis(key: str, config: dict) -> dict:
+    running = await pipeline.find_job(db, key, "running")
+    if running is not None:
+        # Même analyse en cours dans un autre worker: on attend son résultat
+        job = await pipeline.wait_for_job(db, running["id"])
+        cached = job and job["status"] == "completed" and await _cached_analysis(job)
+        if cached:
+            return {**cached, "attached": True}
+    partial = await pipeline.find_job(db, key, "partial")
+    if partial is not None:
+        # Rapports d'analystes déjà calculés par une comparaison: le job reprend à la recherche
+        return await _run_analysis(partial["id"], config)
+    analysis_id = str(uuid.uuid4())
+    await pipeline.create_job(db, analysis_id, config)
+    return await _run_analysis(analysis_id, config)
+
+async def _cached_analysis(job: dict) -> Optional[dict]:
+    summary = await results.load_summary(db, job["id"])
+    if summary is None:
+        return None
+    outputs = await pipeline.load_checkpoints(db, job["id"])
+    return {**_analysis_response(job["id"], job["config"], outputs, summary), "cached": True}
+
+async def _run_analysis(analysis_id: str, config: dict, parent_id: Optional[str] = None) -> dict:
+    """Exécute (ou reprend) le pipeline du job et construit la réponse de l'API"""
+    try:
+        with tracing.span("analysis", **{"analysis.id": analysis_id, "ticker": config["ticker"],
+                                         "analysis.parent_id": parent_id}):
+            outputs = await workers.supervisor.run_pipeline(db, analysis_id, config)
+    except pipeline.PipelineError as e:
+        logger.error(f"Analyse {analysis_id} interrompue: {e}")
+        job = await pipeline.get_job(db, analysis_id) or {}
+        completed = job.get("completed_phases", [])
+        # Job pris par un autre worker entre-temps: sa phase réelle plutôt que "claim"
+        phase = job.get("current_phase") if e.phase == "claim" else e.phase
         return {
             "id": analysis_id,
-            "status": "completed",
-            "message": f"Analyse de {request.ticker} terminée avec succès",
-            "configuration": {
-                "ticker": request.ticker,
-                "date": request.analysis_date,
-                "analysts": request.analysts,
-                "research_depth": request.research_depth,
-                "llm_model": "deepseek-chat"
-            },
-            "analysis_output": analysis_summary,
+            "status": "error",
+            "message": f"Erreur: {str(e)}",
             "progress": {
-                "current_phase": "✅ Analyse terminée",
-                "phases": phases,
-                "completion": 100
-            },
-            "recommendations": {
-                "system_status": "✅ TradingAgents opérationnel avec DeepSeek",
-                "analysis_complete": True,
-                "next_steps": [
-                    "Examiner les résultats de l'analyse",
-                    "Consulter les recommandations des agents",
-                    "Prendre une décision de trading informée"
-                ]
+                "current_phase": pipeline.PHASE_LABELS.get(phase, phase),
+                "phases": ANALYSIS_PHASES,
+                "completed_phases": completed,
+                "completion": round(100 * len(completed) / len(pipeline.PHASES))
             }
         }
-        
-    except Exception as e:
-        logger.error(f"Erreur lors du démarrage de l'analyse: {e}")
-        return {
-            "id": None,
-            "status": "error",
-            "message": f"Erreur: {str(e)}"
-        }
+
+    summary = await results.save_result(db, results.build_result(analysis_id, config, outputs, parent_id))
+    hub.publish("results", {"latest": summary.dict(exclude={"created_at"})})
+    return _analysis_response(analysis_id, config, outputs, summary)
+
+def _analysis_response(analysis_id: str, config: dict, outputs: dict, summary: results.AnalysisSummary) -> dict:
+    return {
+        "id": analysis_id,
+        "status": "completed",
+        "message": f"Analyse de {config['ticker']} terminée avec succès",
+        "configuration": {
+            "ticker": config["ticker"],
+            "date": config["analysis_date"],
+            "analysts": config["analysts"],
+            "research_depth": config["research_depth"],
+            "llm_model": "deepseek-chat"
+        },
+        "analysis_output": pipeline.format_summary(config, outputs),
+        "decision": outputs["portfolio"],
+        "token_usage": summary.token_usage.dict(),
+        "progress": {
+            "current_phase": "✅ Analyse terminée",
+            "phases": ANALYSIS_PHASES,
+            "completion": 100
+        },
+        "recommendations": ANALYSIS_RECOMMENDATIONS
+    }
+
+@api_router.get("/trading/analyses")
+async def list_analyses(
+    request: Request,
+    ticker: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    decision: Optional[str] = None,
+    analysts: Optional[List[str]] = Query(None),
+    llm_model: Optional[str] = None,
+    min_confidence: Optional[float] = None,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+):
+    """Historique des analyses filtrable, paginé par curseur (next_cursor)"""
+    query = results.build_filter(ticker, date_from, date_to, decision, analysts, llm_model, min_confidence)
+    try:
+        return conditional_response(request, await results.query_summaries(db, query, limit, cursor))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+@api_router.get("/trading/analyses/stats")
+async def analyses_decision_stats(
+    ticker: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    decision: Optional[str] = None,
+    analysts: Optional[List[str]] = Query(None),
+    llm_model: Optional[str] = None,
+    min_confidence: Optional[float] = None,
+):
+    """Décomptes BUY/SELL/HOLD par ticker et par jour (pipeline d'agrégation Mongo)"""
+    query = results.build_filter(ticker, date_from, date_to, decision, analysts, llm_model, min_confidence)
+    return {"items": await results.decision_counts(db, query)}
+
+@api_router.get("/trading/analyses/{analysis_id}", response_model=results.AnalysisSummary)
+async def get_analysis_result(analysis_id: str, request: Request):
+    """Résumé structuré d'une analyse terminée (sans le texte des rapports)"""
+    summary = await results.load_summary(db, analysis_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Analyse introuvable")
+    return conditional_response(request, summary.dict(), CACHE_IMMUTABLE)
+
+@api_router.get("/trading/analyses/{analysis_id}/reports")
+async def get_analysis_reports(analysis_id: str, request: Request):
+    """Rapports complets par agent, décompressés à la demande"""
+    reports = await results.load_reports(db, analysis_id)
+    if reports is None:
+        raise HTTPException(status_code=404, detail="Rapports introuvables")
+    return conditional_response(request, {"id": analysis_id, "reports": reports}, CACHE_IMMUTABLE)
+
+@api_router.get("/trading/analyses/{analysis_id}/cost")
+async def get_analysis_cost(analysis_id: str):
+    """Coût LLM d'une analyse (tokens, latence moyenne, taux de cache) lu dans les agrégats"""
+    items = await ledger.cost_breakdown(db, "analysis", key=analysis_id)
+    if not items:
+        raise HTTPException(status_code=404, detail="Aucun appel LLM enregistré pour cette analyse")
+    return {"id": analysis_id, **items[0]}
+
+@api_router.post("/trading/ingest/{ticker}")
+async def ingest_ticker_feeds(ticker: str, days: int = Query(7, ge=1, le=365)):
+    """Collecte immédiate (incrémentale) des actualités et du sentiment social d'un ticker"""
+    ingestion.ingestor.watch(ticker)
+    return {"items": await ingestion.ingestor.ingest_recent(ticker, days)}
+
+@api_router.get("/trading/news/{ticker}")
+async def get_ticker_news(
+    ticker: str,
+    kind: str = "news",
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Actualités ou sentiment social déjà ingérés (dédoublonnés et scorés)"""
+    if kind not in ingestion.KINDS:
+        raise HTTPException(status_code=400, detail=f"Type inconnu: {kind} ({list(ingestion.KINDS)})")
+    date_to = date_to or datetime.utcnow()
+    date_from = date_from or date_to - timedelta(days=7)
+    items = await ingestion.read_window(db, ticker, kind, date_from, date_to, limit)
+    summary = ingestion.summarize_window(kind, items)
+    return {"ticker": ticker.upper(), "kind": kind, "count": summary["count"],
+            "avg_sentiment": summary["avg_sentiment"], "items": items}
+
+@api_router.post("/trading/backtest")
+async def run_trading_backtest(request: BacktestRequest):
+    """Rejoue les décisions stockées contre l'historique de prix local (pool de processus)"""
+    query = results.build_filter(date_from=request.date_from, date_to=request.date_to, llm_model=request.llm_model)
+    if request.tickers:
+        query["ticker"] = {"$in": [t.upper() for t in request.tickers]}
+    docs = await db.analyses.find(query, {"_id": 0, "ticker": 1, "analysis_date": 1, "decision": 1}).to_list(None)
+    if not docs:
+        return {"status": "error", "message": "Aucune décision stockée pour ces critères"}
+
+    tickers = [d["ticker"] for d in docs]
+    dates = [d["analysis_date"] for d in docs]
+    decisions = [d["decision"] for d in docs]
+    loop = asyncio.get_running_loop()
+    async with admission.controller.admit("backtest"):
+        with tracing.span("backtest", **{"backtest.decisions": len(decisions)}):
+            result = await loop.run_in_executor(
+                backtest.get_pool(), backtest.run_backtest_from_cache,
+                tickers, dates, decisions, request.horizon_days, str(backtest.PRICE_CACHE_DIR)
+            )
+    return {"status": "completed", "horizon_days": request.horizon_days, **result}
+
+@api_router.get("/trading/routing")
+async def get_model_routing():
+    """Table de routage par rôle, latences récentes et coût cumulé (registre) par rôle"""
+    table = routing.routing_table()
+    for row in await ledger.cost_breakdown(db, "role", limit=len(table) + 50):
+        table.setdefault(row["key"], {}).update({
+            "cost_usd": row["cost_usd"],
+            "total_tokens": row["total_tokens"],
+            "avg_latency_ms": row["avg_latency_ms"],
+            "recorded_calls": row["calls"],
+            "recorded_fallbacks": row["fallbacks"],
+        })
+    return {"pipeline_mode": upstream.mode(), "roles": table}
+
+@api_router.get("/costs/timeline")
+async def get_cost_timeline(
+    granularity: str = "hour",
+    dimension: str = "total",
+    key: str = "all",
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+):
+    """Série temporelle des coûts (seaux minute/heure/jour pré-agrégés)"""
+    if granularity not in ledger.DIMENSIONS.get(dimension, ()):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Granularité {granularity} indisponible pour {dimension} ({ledger.DIMENSIONS.get(dimension, ())})",
+        )
+    return {
+        "dimension": dimension,
+        "key": key,
+        "granularity": granularity,
+        "items": await ledger.cost_timeline(db, granularity, dimension, key, date_from, date_to),
+    }
+
+@api_router.get("/costs/{dimension}")
+async def get_costs(
+    dimension: str,
+    key: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Coût cumulé par analyse, ticker, analyste (ou phase), tenant ou modèle"""
+    if dimension not in ledger.DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"Dimension inconnue: {dimension} ({list(ledger.DIMENSIONS)})")
+    return {"dimension": dimension, "items": await ledger.cost_breakdown(db, dimension, key, date_from, date_to, limit)}
+
+def _next_run(watchlist: dict) -> Optional[datetime]:
+    last_run = watchlist.get("last_run_at") or watchlist["created_at"]
+    try:
+        zone = ZoneInfo(watchlist["timezone"])
+        return Cron(watchlist["schedule"]).next_after(last_run.replace(tzinfo=ZoneInfo("UTC")).astimezone(zone))
+    except (CronError, ZoneInfoNotFoundError) as e:
+        # Watchlist enregistrée avant la validation actuelle: listée, jamais déclenchée
+        logger.warning(f"Watchlist {watchlist['name']}: {e}")
+        return None
+
+@api_router.post("/watchlists")
+async def save_watchlist(request: WatchlistCreate):
+    """Crée ou remplace une watchlist pré-calculée selon une expression cron"""
+    try:
+        Cron(request.schedule)
+        ZoneInfo(request.timezone)
+    except (CronError, ZoneInfoNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    watchlist = {**request.dict(), "tickers": [t.upper() for t in request.tickers]}
+    now = datetime.utcnow()
+    await db.watchlists.update_one(
+        {"name": request.name},
+        {"$set": watchlist, "$setOnInsert": {"created_at": now, "last_run_at": None}},
+        upsert=True,
+    )
+    saved = await db.watchlists.find_one({"name": request.name}, {"_id": 0})
+    return {**saved, "next_run": _next_run(saved)}
+
+@api_router.get("/watchlists")
+async def list_watchlists():
+    watchlists = await db.watchlists.find({}, {"_id": 0}).to_list(None)
+    return {"items": [
+        {**w, "next_run": _next_run(w) if w.get("enabled") else None, "running": w["name"] in scheduler.running}
+        for w in watchlists
+    ]}
+
+@api_router.delete("/watchlists/{name}")
+async def delete_watchlist(name: str):
+    result = await db.watchlists.delete_one({"name": name})
+    if result.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Watchlist introuvable")
+    return {"status": "deleted", "name": name}
+
+@api_router.post("/watchlists/{name}/run")
+async def run_watchlist_now(name: str):
+    """Lance immédiatement le pré-calcul (progression sur le topic WebSocket watchlist:<nom>)"""
+    watchlist = await db.watchlists.find_one({"name": name}, {"_id": 0})
+    if watchlist is None:
+        raise HTTPException(status_code=404, detail="Watchlist introuvable")
+    if name in scheduler.running:
+        return {"status": "running", "name": name}
+    scheduler.trigger(watchlist, datetime.now(tz=ZoneInfo("UTC")))
+    return {"status": "started", "name": name, "tickers": len(watchlist["tickers"])}
+
+@api_router.post("/tenants")
+async def create_tenant(request: TenantCreate, x_admin_key: Optional[str] = Header(None)):
+    """Crée un tenant; la clé API n'est renvoyée qu'une seule fois (seul son hash est stocké)"""
+    admin_key = os.environ.get("ADMIN_API_KEY")
+    if not admin_key or x_admin_key != admin_key:
+        raise HTTPException(status_code=403, detail="Clé d'administration requise")
+    tenant, api_key = await tenants.registry.create(
+        request.name, request.weight, request.requests_per_day, request.tokens_per_day
+    )
+    return {**tenant.__dict__, "api_key": api_key}
+
+@api_router.get("/tenants/me/usage")
+async def get_tenant_usage(tenant: tenants.Tenant = Depends(tenants.resolve_tenant)):
+    """Consommation du jour du tenant appelant et état de la file LLM"""
+    return {
+        "tenant": {"id": tenant.id, "name": tenant.name, "weight": tenant.weight},
+        "usage": tenants.registry.usage(tenant),
+        "llm_queue": llm_scheduler.stats(),
+    }
+
+@api_router.get("/export/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    resume_after: Optional[str] = None,
+    batch_size: int = Query(export.DEFAULT_BATCH_SIZE, ge=1, le=50_000),
+):
+    """Export en flux (NDJSON ou Arrow IPC) de status_checks ou analyses, trié par date puis id"""
+    try:
+        media_type, extension = export.content(format)
+        spec, cursor = await export.open_cursor(db, dataset, since, until, resume_after, batch_size)
+    except export.ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stream = (export.stream_arrow(cursor, spec, batch_size) if format == "arrow"
+              else export.stream_ndjson(cursor, batch_size))
+    return StreamingResponse(stream, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{dataset}.{extension}"',
+        "Cache-Control": "no-store",
+    })
+
+@api_router.get("/system/mongo")
+async def get_mongo_stats():
+    """Pool MongoDB (connexions, attente de checkout) et latences par collection/opération"""
+    return mongo.metrics.stats()
+
+@api_router.get("/system/admission")
+async def get_admission_stats():
+    """Contrôle d'admission: travaux en cours, débit, mémoire, retard de boucle, refus"""
+    return admission.controller.stats()
+
+@api_router.get("/system/workers")
+async def get_worker_stats():
+    """Workers d'analyse en cours (mémoire, CPU, phase), budgets et issues des jobs"""
+    return workers.supervisor.stats()
+
+async def _system_topic() -> dict:
+    return _trading_status()
+
+@api_router.websocket("/ws")
+async def live_updates(websocket: WebSocket):
+    """Canal unique du tableau de bord (topics: system, upstream, job:<id>, results)"""
+    await hub.serve(websocket)
 
 @api_router.get("/trading/network-status")
 async def check_network_status():
     """Vérifie l'état de la connectivité réseau et des services"""
+    return await asyncio.to_thread(_collect_network_status)
+
+def _collect_network_status() -> dict:
+    """Sondes HTTP bloquantes, exécutées hors de la boucle d'événements"""
     try:
-        import requests
-        import time
-        
         status = {
             "timestamp": datetime.now().isoformat(),
             "services": {},
@@ -343,16 +919,13 @@ async def check_network_status():
 async def test_deepseek_connection():
     """Test la connexion à DeepSeek"""
     try:
-        import time
-        import sys
-        sys.path.append("/app/TradingAgents")
+        if TRADING_AGENTS_DIR not in sys.path:
+            sys.path.append(TRADING_AGENTS_DIR)
         
         # Test réel de connexion DeepSeek
-        from langchain_openai import ChatOpenAI
-        
         start_time = time.time()
         
-        llm = ChatOpenAI(
+        llm = langchain_openai.ChatOpenAI(
             model="deepseek-chat",
             base_url="https://api.deepseek.com/v1",
             api_key="sk-15a5df3514064313b15f2127ebd6c22c",
@@ -422,6 +995,7 @@ async def test_deepseek_quick():
     """Test rapide DeepSeek sans LangChain"""
     try:
         # Test direct avec requests - plus rapide et fiable
+        start_time = time.time()
         response = requests.post(
             "https://api.deepseek.com/v1/chat/completions",
             headers={
@@ -438,6 +1012,10 @@ async def test_deepseek_quick():
         
         if response.status_code == 200:
             data = response.json()
+            with ledger.attribute(agent="healthcheck"):
+                ledger.ledger.record(ledger.build_event(
+                    data.get("model", "deepseek-chat"), data.get("usage", {}), (time.time() - start_time) * 1000
+                ))
             return {
                 "status": "success",
                 "message": "✅ DeepSeek OK (test rapide)",
@@ -470,14 +1048,20 @@ async def test_deepseek_quick():
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.environ.get("COMPRESSION_MIN_SIZE", 1024)))
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["traceparent"],
 )
 
+# Le plus externe: la trace couvre aussi compression et CORS
+app.add_middleware(tracing.TraceMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -485,6 +1069,3 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -0,0 +1,288 @@
+"""Vue matérialisée en mémoire des derniers status checks (lecture sans MongoDB).
+
+``GET /api/status`` relisait jusqu'à 1000 documents à chaque appel. La vue garde les
+``STATUS_CACHE_SIZE`` plus récents dans un tampon circulaire d'enregistrements
+compacts, trié par horodatage, avec le corps JSON et l'ETag mis en cache jusqu'à la
+prochaine modification: une lecture ne coûte que quelques microsecondes.
+
+Cohérence:
+
+- lecture de ses propres écritures: ``create_status_check`` ajoute le document dès
+  l'insertion;
+- écritures des autres workers: change stream MongoDB sur ``status_checks``, reprise
+  sur le dernier resume token après une coupure, rechargement complet si le token est
+  expiré ou sur suppression/modification;
+- sans change stream (serveur MongoDB standalone), nouveaux documents relus toutes les
+  ``STATUS_CACHE_POLL_SECONDS`` et rechargement complet toutes les ``RESYNC_SECONDS``.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from operator import attrgetter
+from typing import Deque, List, Optional, Set, Tuple
+
+from responses import etag_for, json_response
+
+logger = logging.getLogger(__name__)
+
+STATUS_CACHE_SIZE = int(os.environ.get("STATUS_CACHE_SIZE", 1000))
+STATUS_CACHE_POLL_SECONDS = float(os.environ.get("STATUS_CACHE_POLL_SECONDS", 1))
+RESYNC_SECONDS = 60
+RETRY_SECONDS = 2
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost: reprise impossible
+_LOST_RESUME_CODES = {260, 280, 286}
+# Marge de relecture en mode polling (horloges des workers légèrement décalées)
+POLL_SKEW = timedelta(seconds=5)
+
+# Enregistrements par segment du tampon: une écriture ne re-sérialise que les segments touchés
+SEGMENT_SIZE = 16
+
+EPOCH = datetime(1970, 1, 1)
+_ts_ms = attrgetter("ts_ms")
+
+
+@dataclass(slots=True)
+class StatusRecord:
+    """Status check en interne: UUID sur 16 octets, horodatage UTC en ms depuis l'epoch.
+
+    Le document MongoDB et la réponse de l'API (``StatusCheck``) gardent ``id`` en
+    texte et ``timestamp`` en datetime: la conversion n'a lieu qu'en bordure.
+    """
+    uuid: bytes
+    client_name: str
+    ts_ms: int
+
+    @classmethod
+    def new(cls, client_name: str) -> "StatusRecord":
+        return cls(uuid.uuid4().bytes, sys.intern(client_name), time.time_ns() // 1_000_000)
+
+    @classmethod
+    def from_document(cls, document: dict) -> "StatusRecord":
+        return cls(
+            uuid.UUID(document["id"]).bytes,
+            sys.intern(document["client_name"]),
+            (document["timestamp"].replace(tzinfo=None) - EPOCH) // timedelta(milliseconds=1),
+        )
+
+    @property
+    def id(self) -> str:
+        # Équivalent de str(uuid.UUID(bytes=...)), quatre fois plus rapide
+        h = self.uuid.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+    @property
+    def timestamp(self) -> datetime:
+        return EPOCH + timedelta(milliseconds=self.ts_ms)
+
+    def to_document(self) -> dict:
+        return {"id": self.id, "client_name": self.client_name, "timestamp": self.timestamp}
+
+
+class _Segment:
+    __slots__ = ("records", "body")
+
+    def __init__(self):
+        self.records: List[StatusRecord] = []
+        self.body: Optional[bytes] = None
+
+    def rendered(self) -> bytes:
+        """Éléments JSON du segment, sans les crochets du tableau"""
+        if self.body is None:
+            self.body = json_response([record.to_document() for record in self.records]).body[1:-1]
+        return self.body
+
+
+class StatusCache:
+    def __init__(self, capacity: int = STATUS_CACHE_SIZE):
+        self.capacity = capacity
+        self.db = None
+        self.ready = False
+        self.mode: Optional[str] = None
+        self._segments: Deque[_Segment] = deque()
+        self._count = 0
+        self._ids: Set[bytes] = set()
+        self._rendered: Optional[Tuple[bytes, str]] = None
+        self._added_during_reload: Optional[list] = None
+        self._task: Optional[asyncio.Task] = None
+        self._reload_task: Optional[asyncio.Task] = None
+        self._reload_again = False
+        self._retry: Optional[asyncio.TimerHandle] = None
+
+    async def start(self, db):
+        self.db = db
+        try:
+            await db.status_checks.create_index("timestamp")
+        except Exception as e:
+            logger.error(f"Index des status checks impossible à créer: {e}")
+        self._task = asyncio.create_task(self._follow())
+
+    async def stop(self):
+        if self._retry:
+            self._retry.cancel()
+        tasks = [t for t in (self._task, self._reload_task) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = self._reload_task = None
+        self.ready = False
+
+    # --- Contenu ---
+
+    def add(self, document: dict):
+        self._insert(StatusRecord.from_document(document))
+
+    def add_record(self, record: StatusRecord):
+        self._insert(record)
+
+    def _insert(self, record: StatusRecord):
+        if self._added_during_reload is not None:
+            self._added_during_reload.append(record)
+        if record.uuid in self._ids:
+            return
+        segments = self._segments
+        if self._count >= self.capacity and record.ts_ms < segments[0].records[0].ts_ms:
+            return
+        if not segments or record.ts_ms >= segments[-1].records[-1].ts_ms:
+            # Cas courant: ajout en fin
+            if not segments or len(segments[-1].records) >= SEGMENT_SIZE:
+                segments.append(_Segment())
+            segment = segments[-1]
+            segment.records.append(record)
+        else:
+            # Écriture d'un autre worker arrivée en léger désordre
+            index = max(0, bisect.bisect_right(segments, record.ts_ms, key=lambda s: s.records[0].ts_ms) - 1)
+            segment = segments[index]
+            bisect.insort_right(segment.records, record, key=_ts_ms)
+        segment.body = None
+        self._ids.add(record.uuid)
+        self._count += 1
+        while self._count > self.capacity:
+            first = segments[0]
+            self._ids.discard(first.records.pop(0).uuid)
+            first.body = None
+            if not first.records:
+                segments.popleft()
+            self._count -= 1
+        self._rendered = None
+
+    def _clear(self):
+        self._segments.clear()
+        self._ids.clear()
+        self._count = 0
+        self._rendered = None
+
+    def latest(self) -> Optional[StatusRecord]:
+        return self._segments[-1].records[-1] if self._segments else None
+
+    def rendered(self) -> Tuple[bytes, str]:
+        """Corps JSON (ordre chronologique) et ETag, recalculés seulement après modification"""
+        if self._rendered is None:
+            body = b"[" + b",".join(s.rendered() for s in self._segments) + b"]"
+            self._rendered = (body, etag_for(body))
+        return self._rendered
+
+    def __len__(self) -> int:
+        return self._count
+
+    async def reload(self):
+        self._added_during_reload = added = []
+        try:
+            documents = await self.db.status_checks.find({}, {"_id": 0}).sort("timestamp", -1).limit(self.capacity).to_list(None)
+        finally:
+            self._added_during_reload = None
+        self._clear()
+        # Écritures arrivées pendant la lecture: absentes de l'instantané mais à garder
+        for record in [StatusRecord.from_document(d) for d in reversed(documents)] + added:
+            self._insert(record)
+        self.ready = True
+
+    # --- Synchronisation entre workers ---
+
+    async def _follow(self):
+        resume_token = None
+        while True:
+            try:
+                # Stream ouvert avant le chargement initial: aucune écriture perdue entre les deux
+                async with self.db.status_checks.watch(resume_after=resume_token) as stream:
+                    if resume_token is None:
+                        await self.reload()
+                    self.mode = "change_stream"
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._apply(change)
+                    resume_token = None  # invalidate (collection supprimée/renommée): nouveau stream
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.mode is None and not _retryable(e):
+                    logger.info(f"Change streams indisponibles ({type(e).__name__}), status checks relus toutes les {STATUS_CACHE_POLL_SECONDS:g}s")
+                    await self._poll()
+                    return
+                logger.warning(f"Change stream status_checks interrompu: {e}")
+                if getattr(e, "code", None) in _LOST_RESUME_CODES:
+                    resume_token = None  # historique perdu: rechargement complet
+                self.ready = self.ready and resume_token is not None
+                await asyncio.sleep(RETRY_SECONDS)
+
+    def _apply(self, change: dict):
+        operation = change.get("operationType")
+        if operation == "insert":
+            self.add(change["fullDocument"])
+        elif operation in ("delete", "replace", "update"):
+            # Rare sur ce journal en ajout seul: on recharge plutôt que de maintenir un index _id -> id
+            self.schedule_reload()
+
+    def schedule_reload(self):
+        """Rechargement en tâche de fond, un seul à la fois; rejoué une fois s'il est redemandé pendant"""
+        self.ready = False
+        if self._reload_task is not None and not self._reload_task.done():
+            # L'instantané en cours peut précéder la modification: il faudra relire
+            self._reload_again = True
+            return
+        self._reload_again = False
+        self._reload_task = asyncio.create_task(self.reload())
+        self._reload_task.add_done_callback(self._reloaded)
+
+    def _reloaded(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.warning(f"Rechargement des status checks en échec: {task.exception()}")
+            # Lectures servies par MongoDB (cache non prêt) jusqu'au prochain essai
+            self._retry = asyncio.get_running_loop().call_later(RETRY_SECONDS, self.schedule_reload)
+        elif self._reload_again:
+            self.schedule_reload()
+
+    async def _poll(self):
+        self.mode = "polling"
+        last_resync = None
+        while True:
+            try:
+                now = datetime.utcnow()
+                if last_resync is None or now - last_resync > timedelta(seconds=RESYNC_SECONDS):
+                    await self.reload()
+                    last_resync = now
+                else:
+                    latest = self.latest()
+                    since = (latest.timestamp if latest else now) - POLL_SKEW
+                    async for document in self.db.status_checks.find({"timestamp": {"$gt": since}}, {"_id": 0}):
+                        self.add(document)
+            except Exception as e:
+                logger.warning(f"Relecture des status checks en échec: {e}")
+            await asyncio.sleep(STATUS_CACHE_POLL_SECONDS)
+
+
+def _retryable(error: Exception) -> bool:
+    # Erreur réseau ou d'élection: le change stream reste utilisable après reconnexion
+    labels = getattr(error, "_error_labels", None) or set()
+    return "ResumableChangeStreamError" in labels or type(error).__name__ in ("AutoReconnect", "NetworkTimeout", "ServerSelectionTimeoutError")
+
+
+cache = StatusCache()
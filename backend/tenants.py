@@ -0,0 +1,189 @@
+"""Tenants (clé API ``X-API-Key``), quotas journaliers et contexte de requête.
+
+Les compteurs (requêtes, tokens) sont tenus en mémoire et poussés par ``$inc`` dans
+``tenant_usage`` toutes les ``FLUSH_SECONDS``; chaque flush relit aussi le total
+global, ce qui garde les quotas cohérents entre plusieurs workers uvicorn.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import secrets
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import Header, HTTPException
+
+from fairqueue import BATCH, INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = 5
+DEFAULT_TENANT_ID = "default"
+DEFAULT_REQUESTS_PER_DAY = int(os.environ.get("TENANT_DEFAULT_REQUESTS_PER_DAY", 500))
+DEFAULT_TOKENS_PER_DAY = int(os.environ.get("TENANT_DEFAULT_TOKENS_PER_DAY", 2_000_000))
+
+
+@dataclass
+class Tenant:
+    id: str
+    name: str
+    weight: float = 1.0
+    requests_per_day: int = DEFAULT_REQUESTS_PER_DAY
+    tokens_per_day: int = DEFAULT_TOKENS_PER_DAY
+
+
+@dataclass
+class _Usage:
+    requests: int = 0
+    tokens: int = 0
+    # Part non encore poussée vers MongoDB
+    pending_requests: int = 0
+    pending_tokens: int = 0
+
+
+current_tenant: ContextVar[Optional[Tenant]] = ContextVar("current_tenant", default=None)
+current_priority: ContextVar[str] = ContextVar("current_priority", default=INTERACTIVE)
+
+DEFAULT_TENANT = Tenant(id=DEFAULT_TENANT_ID, name="Anonyme")
+
+
+def hash_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+def _today() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def seconds_until_reset() -> int:
+    now = datetime.utcnow()
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((tomorrow - now).total_seconds()) + 1
+
+
+class TenantRegistry:
+    def __init__(self):
+        self.db = None
+        self._by_key_hash: Dict[str, Tenant] = {}
+        self._usage: Dict[Tuple[str, str], _Usage] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, db):
+        self.db = db
+        try:
+            await db.tenants.create_index("api_key_hash", unique=True)
+            await db.tenant_usage.create_index([("tenant_id", 1), ("day", 1)], unique=True)
+            await self.reload()
+        except Exception as e:
+            logger.error(f"Chargement des tenants impossible: {e}")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+    async def reload(self):
+        docs = await self.db.tenants.find({}, {"_id": 0}).to_list(None)
+        self._by_key_hash = {
+            doc["api_key_hash"]: Tenant(**{k: v for k, v in doc.items() if k != "api_key_hash"})
+            for doc in docs
+        }
+
+    async def create(self, name: str, weight: float, requests_per_day: int, tokens_per_day: int) -> Tuple[Tenant, str]:
+        api_key = "ta_" + secrets.token_urlsafe(24)
+        tenant = Tenant(id=secrets.token_hex(8), name=name, weight=weight,
+                        requests_per_day=requests_per_day, tokens_per_day=tokens_per_day)
+        await self.db.tenants.insert_one({**tenant.__dict__, "api_key_hash": hash_key(api_key)})
+        self._by_key_hash[hash_key(api_key)] = tenant
+        return tenant, api_key
+
+    def lookup(self, api_key: str) -> Optional[Tenant]:
+        return self._by_key_hash.get(hash_key(api_key))
+
+    def _entry(self, tenant_id: str) -> _Usage:
+        key = (tenant_id, _today())
+        usage = self._usage.get(key)
+        if usage is None:
+            # Nouveau jour: on oublie les compteurs des jours précédents déjà synchronisés
+            self._usage = {k: v for k, v in self._usage.items() if v.pending_requests or v.pending_tokens}
+            usage = self._usage[key] = _Usage()
+        return usage
+
+    def usage(self, tenant: Tenant) -> dict:
+        entry = self._entry(tenant.id)
+        return {
+            "day": _today(),
+            "requests": entry.requests,
+            "tokens": entry.tokens,
+            "requests_per_day": tenant.requests_per_day,
+            "tokens_per_day": tenant.tokens_per_day,
+        }
+
+    def admit(self, tenant: Tenant):
+        """Compte une requête d'analyse; HTTP 429 si le quota du jour est atteint"""
+        entry = self._entry(tenant.id)
+        if entry.requests >= tenant.requests_per_day or entry.tokens >= tenant.tokens_per_day:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Quota journalier atteint pour le tenant {tenant.name}",
+                headers={"Retry-After": str(seconds_until_reset())},
+            )
+        entry.requests += 1
+        entry.pending_requests += 1
+
+    def record_tokens(self, tenant: Tenant, tokens: int):
+        entry = self._entry(tenant.id)
+        entry.tokens += tokens
+        entry.pending_tokens += tokens
+
+    async def flush(self):
+        if self.db is None:
+            return
+        for (tenant_id, day), entry in list(self._usage.items()):
+            requests, tokens = entry.pending_requests, entry.pending_tokens
+            entry.pending_requests = entry.pending_tokens = 0
+            try:
+                doc = await self.db.tenant_usage.find_one_and_update(
+                    {"tenant_id": tenant_id, "day": day},
+                    {"$inc": {"requests": requests, "tokens": tokens}},
+                    upsert=True, return_document=True, projection={"_id": 0},
+                )
+            except Exception as e:
+                entry.pending_requests += requests
+                entry.pending_tokens += tokens
+                logger.warning(f"Synchronisation des quotas en échec: {e}")
+                continue
+            # Total global (tous workers) + ce qui a été compté localement depuis
+            entry.requests = doc["requests"] + entry.pending_requests
+            entry.tokens = doc["tokens"] + entry.pending_tokens
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            await self.flush()
+
+
+registry = TenantRegistry()
+
+
+async def resolve_tenant(
+    x_api_key: Optional[str] = Header(None),
+    x_request_class: Optional[str] = Header(None),
+) -> Tenant:
+    """Dépendance FastAPI: identifie le tenant et fixe le contexte de la requête"""
+    if x_api_key:
+        tenant = registry.lookup(x_api_key)
+        if tenant is None:
+            raise HTTPException(status_code=401, detail="Clé API inconnue")
+    elif os.environ.get("REQUIRE_API_KEY") == "1":
+        raise HTTPException(status_code=401, detail="En-tête X-API-Key requis")
+    else:
+        tenant = DEFAULT_TENANT
+    current_tenant.set(tenant)
+    current_priority.set(BATCH if (x_request_class or "").lower() == BATCH else INTERACTIVE)
+    return tenant
@@ -0,0 +1,412 @@
+"""Traces des requêtes: spans compatibles OpenTelemetry, de l'API jusqu'à MongoDB.
+
+Un span est ouvert pour la requête HTTP entrante, le job d'analyse, chaque phase et
+agent du pipeline, chaque appel LLM/FinnHub (attente dans la file LLM incluse) et
+chaque commande MongoDB. Le contexte suit les ``ContextVar``: il passe donc aux
+tâches asyncio, à ``asyncio.to_thread`` et aux threads de Motor. Il est propagé en
+W3C ``traceparent``: en-tête des requêtes entrantes et sortantes, variable
+d'environnement ``TRACEPARENT`` des sous-processus (lue au démarrage).
+
+Export (``TRACE_EXPORT``), par lots en tâche de fond, au format OTLP/JSON:
+
+- ``file:/chemin/traces.jsonl``: une requête ``ExportTraceServiceRequest`` par ligne
+  (lisible par le récepteur ``otlpjsonfile`` du collecteur OpenTelemetry);
+- ``otlp`` ou ``otlp:http://collecteur:4318``: OTLP/HTTP (``/v1/traces``), par défaut
+  ``OTEL_EXPORTER_OTLP_ENDPOINT``;
+- vide (défaut): traces désactivées, ``span()`` ne coûte qu'un test.
+
+Échantillonnage en tête ``TRACE_SAMPLE_RATIO`` (ex. 0.05 en production), décidé sur
+l'identifiant de trace et respecté par les spans enfants; une requête entrante avec
+un ``traceparent`` échantillonné est toujours tracée.
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from lazy import lazy_module
+
+monitoring = lazy_module("pymongo.monitoring")
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "")
+TRACE_SAMPLE_RATIO = float(os.environ.get("TRACE_SAMPLE_RATIO", 1.0))
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "tradingagents-backend")
+FLUSH_SECONDS = 5
+MAX_BUFFER = 20_000
+ENABLED = bool(TRACE_EXPORT)
+
+# Codes OTLP
+KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+STATUS_ERROR = 2
+
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """Contexte distant W3C (``00-<trace 32 hex>-<span 16 hex>-<flags>``), None si invalide"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == "ff":
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return SpanContext(parts[1].lower(), parts[2].lower(), bool(flags & 1))
+
+
+def _should_sample(trace_id: str) -> bool:
+    # Même règle que TraceIdRatioBased: décision stable pour une trace donnée
+    return int(trace_id[16:], 16) < TRACE_SAMPLE_RATIO * 2 ** 64
+
+
+# Parent des spans racines de ce processus (sous-processus lancé avec TRACEPARENT)
+_process_parent = parse_traceparent(os.environ.get("TRACEPARENT"))
+_current: ContextVar[Optional[SpanContext]] = ContextVar("trace_context", default=None)
+
+
+class Span:
+    __slots__ = ("context", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status", "events")
+
+    def __init__(self, context: SpanContext, parent_id: Optional[str], name: str, kind: str, attributes: dict):
+        self.context = context
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = None
+        self.events: List[dict] = []
+
+    @property
+    def recording(self) -> bool:
+        return self.context.sampled
+
+    def set_attribute(self, key: str, value):
+        if self.context.sampled and value is not None:
+            self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        self.status = f"{type(error).__name__}: {error}"[:500]
+        self.events.append({
+            "name": "exception",
+            "timeUnixNano": str(time.time_ns()),
+            "attributes": _attributes({"exception.type": type(error).__name__, "exception.message": str(error)[:1000]}),
+        })
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or time.time_ns()
+        if self.context.sampled:
+            exporter.add(self)
+
+
+class _NoopSpan:
+    context = None
+    recording = False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def record_exception(self, error: BaseException):
+        pass
+
+
+NOOP = _NoopSpan()
+
+
+def start_span(name: str, kind: str = "internal", parent: Optional[SpanContext] = None, **attributes) -> Span:
+    """Span non courant (à terminer avec ``end()``); ``parent`` par défaut: le span courant"""
+    parent = parent or _current.get() or _process_parent
+    if parent is not None:
+        context = SpanContext(parent.trace_id, secrets.token_hex(8), parent.sampled)
+    else:
+        trace_id = secrets.token_hex(16)
+        context = SpanContext(trace_id, secrets.token_hex(8), _should_sample(trace_id))
+    return Span(context, parent.span_id if parent else None, name, kind,
+                {k: v for k, v in attributes.items() if v is not None} if context.sampled else {})
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """Span courant pendant le bloc (sync ou async); une exception le marque en erreur"""
+    if not ENABLED:
+        yield NOOP
+        return
+    current = start_span(name, kind, **attributes)
+    token = _current.set(current.context)
+    try:
+        yield current
+    except BaseException as e:
+        if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+            current.record_exception(e)
+        raise
+    finally:
+        _current.reset(token)
+        current.end()
+
+
+@contextmanager
+def remote_parent(traceparent: Optional[str]):
+    """Rattache les spans du bloc à un contexte distant (en-tête ou variable d'environnement)"""
+    parent = parse_traceparent(traceparent)
+    token = _current.set(parent) if parent is not None else None
+    try:
+        yield parent
+    finally:
+        if token is not None:
+            _current.reset(token)
+
+
+def current_context() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    context = _current.get()
+    return context.traceparent() if context is not None else None
+
+
+def inject(headers: Dict[str, str]) -> Dict[str, str]:
+    """Ajoute ``traceparent`` aux en-têtes d'une requête sortante"""
+    traceparent = current_traceparent()
+    if traceparent:
+        headers["traceparent"] = traceparent
+    return headers
+
+
+def child_env(env: Optional[dict] = None) -> dict:
+    """Environnement d'un sous-processus, avec le contexte de trace courant"""
+    env = dict(os.environ if env is None else env)
+    traceparent = current_traceparent()
+    if traceparent:
+        env["TRACEPARENT"] = traceparent
+    return env
+
+
+# --- Export OTLP/JSON ---
+
+def _value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: dict) -> List[dict]:
+    return [{"key": key, "value": _value(value)} for key, value in attributes.items()]
+
+
+def to_otlp(spans: List[Span]) -> dict:
+    return {"resourceSpans": [{
+        "resource": {"attributes": _attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [
+                {
+                    "traceId": s.context.trace_id,
+                    "spanId": s.context.span_id,
+                    **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                    "name": s.name,
+                    "kind": KINDS.get(s.kind, 1),
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": _attributes(s.attributes),
+                    **({"events": s.events} if s.events else {}),
+                    **({"status": {"code": STATUS_ERROR, "message": s.status}} if s.status else {}),
+                }
+                for s in spans
+            ],
+        }],
+    }]}
+
+
+class Exporter:
+    def __init__(self, target: str = TRACE_EXPORT):
+        self.target = target
+        self.dropped = 0
+        self.exported = 0
+        self._buffer: List[Span] = []
+        # Les spans MongoDB se terminent dans les threads de Motor
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if not self.target:
+            return
+        logger.info(f"🔭 Traces exportées vers {self.target} (échantillonnage {TRACE_SAMPLE_RATIO:g})")
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def add(self, span: Span):
+        with self._lock:
+            if len(self._buffer) >= MAX_BUFFER:
+                self.dropped += 1
+                return
+            self._buffer.append(span)
+
+    def flush(self):
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+        if not spans or not self.target:
+            return
+        try:
+            self._export(json.dumps(to_otlp(spans), ensure_ascii=False, separators=(",", ":")))
+            self.exported += len(spans)
+        except Exception as e:
+            self.dropped += len(spans)
+            logger.warning(f"Export de {len(spans)} span(s) en échec: {e}")
+
+    def _export(self, payload: str):
+        scheme, _, location = self.target.partition(":")
+        if scheme == "file":
+            with open(location, "a", encoding="utf-8") as f:
+                f.write(payload + "\n")
+        elif scheme == "otlp":
+            endpoint = location or os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+            request = urllib.request.Request(
+                endpoint.rstrip("/") + "/v1/traces", data=payload.encode("utf-8"),
+                headers={"Content-Type": "application/json"}, method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=10) as response:
+                response.read()
+        else:
+            raise ValueError(f"TRACE_EXPORT inconnu: {self.target}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            await asyncio.to_thread(self.flush)
+
+
+exporter = Exporter()
+
+
+# --- Requêtes HTTP entrantes ---
+
+class TraceMiddleware:
+    """Span ``server`` par requête HTTP, rattaché au ``traceparent`` entrant.
+
+    La réponse porte ``traceparent`` (contexte du span serveur) pour retrouver la trace
+    depuis le client ou le générateur de charge.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not ENABLED or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        with remote_parent(headers.get("traceparent")):
+            with span(f"{scope['method']} {scope['path']}", "server", **{
+                "http.request.method": scope["method"],
+                "url.path": scope["path"],
+                "url.query": scope.get("query_string", b"").decode("latin-1") or None,
+                "user_agent.original": headers.get("user-agent"),
+            }) as current:
+
+                async def send_wrapper(message: Message):
+                    if message["type"] == "http.response.start":
+                        current.set_attribute("http.response.status_code", message["status"])
+                        if message["status"] >= 500:
+                            current.status = f"HTTP {message['status']}"
+                        if current.context is not None:
+                            MutableHeaders(scope=message)["traceparent"] = current.context.traceparent()
+                    await send(message)
+
+                await self.app(scope, receive, send_wrapper)
+                if current.recording and "endpoint" in scope:
+                    # Nom à faible cardinalité: gabarit de route plutôt que chemin concret
+                    route = scope["path"]
+                    for name, value in (scope.get("path_params") or {}).items():
+                        route = route.replace(str(value), "{" + name + "}", 1)
+                    current.set_attribute("http.route", route)
+                    current.name = f"{scope['method']} {route}"
+
+
+# --- Commandes MongoDB ---
+
+_IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions"}
+
+
+def mongo_listeners() -> list:
+    """``event_listeners`` du client Motor (vide si les traces sont désactivées)"""
+    return [MongoListener()] if ENABLED else []
+
+
+def _listener_base():
+    return monitoring.CommandListener if ENABLED else object
+
+
+class MongoListener(_listener_base()):
+    """Span ``client`` par commande, rattaché au span courant (Motor copie le contexte
+    dans ses threads). Les commandes hors trace (tâches de fond) ne sont pas suivies."""
+
+    def __init__(self):
+        self._spans: Dict[tuple, Span] = {}
+
+    def started(self, event):
+        parent = _current.get()
+        if parent is None or not parent.sampled or event.command_name in _IGNORED_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        self._spans[(event.request_id, event.connection_id)] = start_span(
+            f"mongodb {event.command_name}", "client", parent=parent, **{
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection if isinstance(collection, str) else None,
+                "server.address": str(event.connection_id[0]) if event.connection_id else None,
+            })
+
+    def _finish(self, event, error: Optional[str] = None):
+        current = self._spans.pop((event.request_id, event.connection_id), None)
+        if current is not None:
+            if error:
+                current.status = error[:500]
+            current.end(current.start_ns + event.duration_micros * 1000)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure))
@@ -0,0 +1,224 @@
+"""Appels sortants du pipeline (LLM DeepSeek, données FinnHub) avec mode record/replay.
+
+``TRADING_PIPELINE_MODE``:
+  - ``simulated`` (défaut): aucune requête, le pipeline utilise ses rapports simulés
+  - ``live``: appels réels
+  - ``record``: appels réels, chaque échange est ajouté à la cassette
+  - ``replay``: les réponses sont lues depuis la cassette, sans réseau
+
+La cassette (``TRADING_CASSETTE``) est un fichier JSONL gzip; chaque entrée est indexée
+par le hash de la requête canonique, les doublons sont rejoués dans l'ordre d'enregistrement.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import tracing
+from fairqueue import llm_scheduler
+from lazy import lazy_module
+from ledger import build_event, ledger
+from tenants import DEFAULT_TENANT, current_priority, current_tenant, registry
+
+requests = lazy_module("requests")
+
+logger = logging.getLogger(__name__)
+
+MODES = ("simulated", "live", "record", "replay")
+
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "sk-15a5df3514064313b15f2127ebd6c22c")
+FINNHUB_BASE_URL = os.environ.get("FINNHUB_BASE_URL", "https://finnhub.io/api/v1")
+FINNHUB_API_KEY = os.environ.get("FINNHUB_API_KEY", "d22mj4hr01qi437eqt40d22mj4hr01qi437eqt4g")
+DEFAULT_CASSETTE = Path(__file__).parent / "cassettes" / "default.jsonl.gz"
+# Cours et fondamentaux FinnHub réutilisés pendant FINNHUB_CACHE_SECONDS (préchargement, analyses proches)
+FINNHUB_CACHE_SECONDS = float(os.environ.get("FINNHUB_CACHE_SECONDS", 300))
+FINNHUB_CACHE_SIZE = 2048
+
+
+class CassetteMiss(Exception):
+    """Requête absente de la cassette en mode replay"""
+
+
+class Cassette:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, deque] = defaultdict(deque)
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        if self.path.exists():
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry["response"])
+        self._loaded = True
+        logger.info(f"Cassette {self.path}: {sum(len(v) for v in self._entries.values())} réponse(s)")
+
+    def replay(self, key: str) -> dict:
+        with self._lock:
+            self._load()
+            responses = self._entries.get(key)
+            if not responses:
+                raise CassetteMiss(f"Aucune réponse enregistrée pour la requête {key[:12]}")
+            # Le dernier exemplaire reste disponible pour les rejouer à volonté
+            return responses.popleft() if len(responses) > 1 else responses[0]
+
+    def record(self, key: str, kind: str, request: dict, response: dict, latency_ms: int):
+        line = json.dumps({
+            "key": key, "kind": kind, "request": request,
+            "response": response, "latency_ms": latency_ms,
+        }, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Chaque ajout crée un membre gzip; gzip.open relit le fichier comme un seul flux
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+_cassette: Optional[Cassette] = None
+
+
+def mode() -> str:
+    value = os.environ.get("TRADING_PIPELINE_MODE", "simulated").lower()
+    return value if value in MODES else "simulated"
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    path = Path(os.environ.get("TRADING_CASSETTE", DEFAULT_CASSETTE))
+    if _cassette is None or _cassette.path != path:
+        _cassette = Cassette(path)
+    return _cassette
+
+
+def request_key(kind: str, request: dict) -> str:
+    canonical = json.dumps([kind, request], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+async def _call(kind: str, request: dict, live: Callable[[], dict]) -> dict:
+    current = mode()
+    key = request_key(kind, request)
+    if current == "replay":
+        return get_cassette().replay(key)
+
+    start = time.time()
+    if kind == "llm":
+        # Partage équitable du pool LLM entre tenants (WFQ), interactif prioritaire
+        tenant = current_tenant.get() or DEFAULT_TENANT
+        with tracing.span(f"llm {request['model']}", "client", **{
+            "gen_ai.system": "deepseek", "gen_ai.request.model": request["model"],
+            "gen_ai.request.max_tokens": request["max_tokens"], "tenant.id": tenant.id,
+        }) as span:
+            async with llm_scheduler.slot(tenant.id, tenant.weight, current_priority.get()):
+                # Attente dans la file LLM, distincte du temps de réponse de DeepSeek
+                span.set_attribute("llm.queue_wait_ms", round((time.time() - start) * 1000, 1))
+                response = await asyncio.to_thread(live)
+            usage = response.get("usage", {})
+            span.set_attribute("gen_ai.usage.input_tokens", usage.get("prompt_tokens"))
+            span.set_attribute("gen_ai.usage.output_tokens", usage.get("completion_tokens"))
+    else:
+        with tracing.span(f"{kind} {request['path']}", "client", **{"http.request.method": "GET", "url.path": request["path"]}):
+            response = await asyncio.to_thread(live)
+    if current == "record":
+        get_cassette().record(key, kind, request, response, round((time.time() - start) * 1000))
+    return response
+
+
+async def chat_completion(messages: List[dict], model: str = "deepseek-chat", temperature: float = 0.1,
+                          max_tokens: int = 1024, timeout: float = 60) -> dict:
+    """Réponse JSON brute de /chat/completions (compatible OpenAI)"""
+    payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+
+    def live():
+        response = requests.post(
+            f"{DEEPSEEK_BASE_URL}/chat/completions",
+            headers=tracing.inject({"Authorization": f"Bearer {DEEPSEEK_API_KEY}", "Content-Type": "application/json"}),
+            json=payload,
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    start = time.time()
+    response = await _call("llm", payload, live)
+    tenant = current_tenant.get() or DEFAULT_TENANT
+    usage = response.get("usage", {})
+    replayed = mode() == "replay"
+    if not replayed:
+        registry.record_tokens(tenant, usage.get("total_tokens", 0))
+    ledger.record(build_event(
+        response.get("model", model), usage, (time.time() - start) * 1000, replayed=replayed, tenant_id=tenant.id,
+    ))
+    return response
+
+
+_finnhub_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_finnhub_pending: Dict[str, asyncio.Task] = {}
+_finnhub_delegate: Optional[Callable[..., Awaitable[dict]]] = None
+
+
+def delegate_finnhub_cache(fetch: Callable[..., Awaitable[dict]]):
+    """Processus worker (voir ``workers``): requêtes en cache servies par le processus serveur"""
+    global _finnhub_delegate
+    _finnhub_delegate = fetch
+
+
+async def finnhub_get(path: str, params: dict, timeout: float = 10, cache_ttl: float = 0) -> dict:
+    """Requête GET FinnHub (le token n'entre pas dans la clé de cassette).
+
+    ``cache_ttl`` > 0: réponse gardée en mémoire ce nombre de secondes, et requêtes
+    identiques simultanées regroupées en un seul appel.
+    """
+    request = {"path": path, "params": params}
+    if cache_ttl <= 0 or mode() == "replay":
+        return await _finnhub_fetch(request, timeout)
+    if _finnhub_delegate is not None:
+        return await _finnhub_delegate(path, params, timeout, cache_ttl)
+    key = request_key("finnhub", request)
+    cached = _finnhub_cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        _finnhub_cache.move_to_end(key)
+        return cached[1]
+    task = _finnhub_pending.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_finnhub_fetch(request, timeout))
+        _finnhub_pending[key] = task
+        task.add_done_callback(lambda t: _finnhub_done(key, t, cache_ttl))
+    return await asyncio.shield(task)
+
+
+def _finnhub_done(key: str, task: asyncio.Task, ttl: float):
+    _finnhub_pending.pop(key, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    _finnhub_cache[key] = (time.monotonic() + ttl, task.result())
+    while len(_finnhub_cache) > FINNHUB_CACHE_SIZE:
+        _finnhub_cache.popitem(last=False)
+
+
+async def _finnhub_fetch(request: dict, timeout: float) -> dict:
+    path, params = request["path"], request["params"]
+
+    def live():
+        response = requests.get(
+            f"{FINNHUB_BASE_URL}{path}",
+            params={**params, "token": FINNHUB_API_KEY},
+            headers=tracing.inject({}),
+            timeout=timeout,
+        )
+        response.raise_for_status()
+        return {"data": response.json()}
+
+    return (await _call("finnhub", request, live))["data"]
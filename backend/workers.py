@@ -0,0 +1,443 @@
+"""Analyses exécutées dans des processus worker, avec budgets mémoire et CPU.
+
+Tout tournait dans le processus uvicorn: une analyse qui s'emballe (fenêtre
+d'actualités énorme, ``research_depth`` élevé) pouvait épuiser la mémoire et faire
+tomber le serveur entier. En mode ``live``, chaque job tourne désormais dans son
+propre processus (forkserver: modules déjà importés, démarrage en quelques ms), au
+plus ``ANALYSIS_MAX_WORKERS`` à la fois. Les places sont attribuées par la même file
+équitable que le pool LLM (tenant, priorité): ``ANALYSIS_INTERACTIVE_RESERVE``
+workers restent réservés aux analyses interactives, un lot de watchlists ou une
+comparaison ne peut pas toutes les prendre.
+
+- mémoire résidente relevée toutes les ``POLL_SECONDS`` (``/proc/<pid>/statm``);
+  au-delà de ``ANALYSIS_MAX_RSS_MB``, annulation coopérative (le job passe en
+  ``failed`` proprement, coûts et traces sont vidés) puis ``SIGKILL`` si le worker
+  n'a pas terminé après ``ANALYSIS_KILL_GRACE_SECONDS``;
+- temps CPU borné par ``RLIMIT_CPU``: le noyau envoie ``SIGXCPU`` à
+  ``ANALYSIS_MAX_CPU_SECONDS`` (annulation coopérative), puis ``SIGKILL`` au terme
+  du délai de grâce;
+- ``ANALYSIS_MAX_VMS_MB`` (optionnel, ``RLIMIT_AS``): plafond dur de l'espace
+  d'adressage, ``MemoryError`` dans le worker.
+
+Pic de mémoire, temps CPU et durée de chaque job sont enregistrés dans
+``analysis_jobs.resources`` pour dimensionner les pods. Un pipe relie chaque worker
+au serveur: la progression (topic ``job:<id>``) est relayée au hub, chaque appel LLM
+demande son slot au ``llm_scheduler`` du serveur (équité entre tenants et file
+d'attente interactive visible par ``admission``) et les requêtes FinnHub en cache
+passent par le cache du serveur, celui que réchauffe ``prefetch``.
+
+Les modes ``simulated``, ``record`` et ``replay`` restent dans le processus serveur
+(cassette partagée); ``ANALYSIS_ISOLATION=inline`` désactive les workers.
+"""
+import asyncio
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Set
+
+import admission
+import fairqueue
+import ingestion
+import lazy
+import ledger
+import mongo
+import pipeline
+import prompt_context
+import tenants
+import tracing
+import upstream
+from realtime import hub
+
+motor_asyncio = lazy.lazy_module("motor.motor_asyncio")
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_ISOLATION = os.environ.get("ANALYSIS_ISOLATION", "process").lower()
+ANALYSIS_MAX_WORKERS = int(os.environ.get("ANALYSIS_MAX_WORKERS", 4))
+ANALYSIS_INTERACTIVE_RESERVE = int(os.environ.get("ANALYSIS_INTERACTIVE_RESERVE", 1))
+ANALYSIS_MAX_RSS_MB = float(os.environ.get("ANALYSIS_MAX_RSS_MB", 1024))
+ANALYSIS_MAX_CPU_SECONDS = float(os.environ.get("ANALYSIS_MAX_CPU_SECONDS", 300))
+ANALYSIS_MAX_VMS_MB = float(os.environ.get("ANALYSIS_MAX_VMS_MB", 0))
+ANALYSIS_KILL_GRACE_SECONDS = float(os.environ.get("ANALYSIS_KILL_GRACE_SECONDS", 10))
+POLL_SECONDS = 0.25
+
+try:
+    _CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    _CLOCK_TICKS = 100
+
+
+def read_cpu_seconds(pid: int) -> Optional[float]:
+    """Temps CPU (utilisateur + système) d'un processus, None hors Linux"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+# --- Côté worker ---
+
+def _apply_limits(limits: dict):
+    try:
+        import resource
+    except ImportError:  # Windows: seul le suivi du processus serveur s'applique
+        return
+    if limits["cpu_seconds"]:
+        soft = math.ceil(limits["cpu_seconds"])
+        resource.setrlimit(resource.RLIMIT_CPU, (soft, soft + math.ceil(limits["kill_grace_seconds"])))
+    if limits["vms_mb"]:
+        size = int(limits["vms_mb"] * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+
+def _self_usage() -> dict:
+    try:
+        import resource
+    except ImportError:
+        return {}
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {"peak_rss_mb": round(usage.ru_maxrss / 1024, 1), "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 2)}
+
+
+def worker_main(conn, job: dict):
+    """Point d'entrée du processus worker"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    _apply_limits(job["limits"])
+    if job.get("tokenizer"):
+        prompt_context.use_cached_encoding()
+    asyncio.run(_worker_run(conn, job))
+
+
+class _ServerLink:
+    """Côté worker: ressources du processus serveur demandées par le pipe"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+
+    def _request(self, kind: str, *args):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.conn.send((kind, request_id, *args))
+        return request_id, future
+
+    def resolve(self, request_id: int, ok: bool, value):
+        future = self.pending.pop(request_id, None)
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(RuntimeError(value))
+
+    @asynccontextmanager
+    async def llm_slot(self, flow: str, weight: float, priority: str, cost: float):
+        request_id, granted = self._request("acquire", flow, weight, priority, cost)
+        try:
+            await granted
+            yield
+        finally:
+            # Slot rendu, ou demande retirée de la file du serveur si l'appel est annulé
+            self.pending.pop(request_id, None)
+            self.conn.send(("release", request_id))
+
+    async def finnhub_get(self, path: str, params: dict, timeout: float, cache_ttl: float) -> dict:
+        request_id, future = self._request("finnhub", path, params, timeout, cache_ttl)
+        try:
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+
+async def _worker_run(conn, job: dict):
+    loop = asyncio.get_running_loop()
+    link = _ServerLink(conn)
+    hub.forward(lambda topic, data: conn.send(("publish", topic, data)))
+    fairqueue.llm_scheduler.delegate(link.llm_slot)
+    upstream.delegate_finnhub_cache(link.finnhub_get)
+
+    client = motor_asyncio.AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), **mongo.client_options())
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+    await tracing.exporter.start()
+    await ledger.ledger.start(db)
+    await tenants.registry.start(db)
+    # Fenêtres d'actualités persistées comme dans le serveur (sans boucle d'ingestion)
+    ingestion.ingestor.db = db
+    tenants.current_tenant.set(tenants.Tenant(**job["tenant"]))
+    tenants.current_priority.set(job["priority"])
+
+    with tracing.remote_parent(job["traceparent"]):
+        task = asyncio.create_task(pipeline.run_pipeline(
+            db, job["id"], job["config"], from_phase=job["from_phase"], until_phase=job["until_phase"],
+        ))
+    reason = {}
+
+    def cancel(why: str):
+        if not task.done():
+            reason.setdefault("why", why)
+            task.cancel()
+
+    def on_message():
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            loop.remove_reader(conn.fileno())
+            cancel("processus serveur arrêté")
+            return
+        if message[0] == "cancel":
+            cancel(message[1])
+        elif message[0] == "resolve":
+            link.resolve(*message[1:])
+
+    loop.add_reader(conn.fileno(), on_message)
+    if hasattr(signal, "SIGXCPU"):
+        loop.add_signal_handler(signal.SIGXCPU, cancel, f"budget CPU dépassé ({job['limits']['cpu_seconds']:g} s)")
+    try:
+        outputs = await task
+        result = ("done", outputs)
+    except asyncio.CancelledError:
+        error = reason.get("why", "annulé")
+        await pipeline.fail_job(db, job["id"], error)
+        result = ("cancelled", error)
+    except pipeline.PipelineError as e:
+        result = ("error", e.phase, e.message)
+    except Exception as e:
+        result = ("error", "worker", f"{type(e).__name__}: {e}")
+    finally:
+        loop.remove_reader(conn.fileno())
+        await tenants.registry.stop()
+        await ledger.ledger.stop()
+        await tracing.exporter.stop()
+        client.close()
+    conn.send((*result, _self_usage()))
+
+
+# --- Côté serveur ---
+
+class _Worker:
+    def __init__(self, job_id: str, process, conn):
+        self.job_id = job_id
+        self.process = process
+        self.conn = conn
+        self.started = time.monotonic()
+        self.rss_mb = 0.0
+        self.peak_rss_mb = 0.0
+        self.cpu_seconds: Optional[float] = None
+        self.phase: Optional[str] = None
+        self.outcome: Optional[tuple] = None
+        self.finished = asyncio.Event()
+        # Slots LLM détenus ou attendus pour le worker (id de requête -> tâche)
+        self.leases: Dict[int, asyncio.Task] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
+    def send(self, message: tuple):
+        try:
+            self.conn.send(message)
+        except OSError:
+            # Worker déjà terminé: la boucle de supervision constate sa fin
+            pass
+
+    def sample(self):
+        self.rss_mb = admission.read_rss(self.process.pid) / 1024 / 1024
+        self.peak_rss_mb = max(self.peak_rss_mb, self.rss_mb)
+        cpu = read_cpu_seconds(self.process.pid)
+        if cpu is not None:
+            self.cpu_seconds = cpu
+
+    def over_budget(self) -> Optional[str]:
+        if ANALYSIS_MAX_RSS_MB and self.rss_mb > ANALYSIS_MAX_RSS_MB:
+            return f"budget mémoire dépassé ({self.rss_mb:.0f} Mo > {ANALYSIS_MAX_RSS_MB:g} Mo)"
+        if ANALYSIS_MAX_CPU_SECONDS and (self.cpu_seconds or 0) > ANALYSIS_MAX_CPU_SECONDS:
+            return f"budget CPU dépassé ({self.cpu_seconds:.1f} s > {ANALYSIS_MAX_CPU_SECONDS:g} s)"
+        return None
+
+
+class WorkerSupervisor:
+    def __init__(self):
+        self.workers: Dict[str, _Worker] = {}
+        self.outcomes: Dict[str, int] = {"completed": 0, "failed": 0, "cancelled": 0, "killed": 0}
+        self._context = None
+        # Places de worker attribuées par tenant et priorité, comme les slots LLM
+        self._slots: Optional[fairqueue.FairScheduler] = None
+
+    def enabled(self) -> bool:
+        return ANALYSIS_ISOLATION == "process" and upstream.mode() == "live"
+
+    async def start(self):
+        self._slots = fairqueue.FairScheduler(ANALYSIS_MAX_WORKERS, ANALYSIS_INTERACTIVE_RESERVE)
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            # Fork depuis un processus serveur dédié (sans threads Motor), modules préchargés
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload(["workers"])
+        else:
+            self._context = multiprocessing.get_context("spawn")
+
+    async def stop(self):
+        for worker in list(self.workers.values()):
+            worker.process.kill()
+
+    async def run_pipeline(self, db, job_id: str, config: dict, from_phase: Optional[str] = None,
+                           until_phase: Optional[str] = None) -> Dict[str, dict]:
+        """``pipeline.run_pipeline`` dans un worker isolé (mode live), sinon dans le processus"""
+        if not self.enabled() or self._slots is None:
+            return await pipeline.run_pipeline(db, job_id, config, from_phase=from_phase, until_phase=until_phase)
+        tenant = tenants.current_tenant.get() or tenants.DEFAULT_TENANT
+        async with self._slots.slot(tenant.id, tenant.weight, tenants.current_priority.get()):
+            return await self._run_in_worker(db, job_id, config, from_phase, until_phase)
+
+    async def _run_in_worker(self, db, job_id: str, config: dict, from_phase: Optional[str],
+                             until_phase: Optional[str]) -> Dict[str, dict]:
+        tenant = tenants.current_tenant.get() or tenants.DEFAULT_TENANT
+        job = {
+            "id": job_id, "config": config, "from_phase": from_phase, "until_phase": until_phase,
+            "tenant": dict(tenant.__dict__), "priority": tenants.current_priority.get(),
+            "traceparent": tracing.current_traceparent(), "tokenizer": prompt_context.encoding_cached(),
+            "limits": {"cpu_seconds": ANALYSIS_MAX_CPU_SECONDS, "vms_mb": ANALYSIS_MAX_VMS_MB,
+                       "kill_grace_seconds": ANALYSIS_KILL_GRACE_SECONDS},
+        }
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=worker_main, args=(child_conn, job), daemon=True,
+                                        name=f"analysis-{job_id[:8]}")
+        process.start()
+        child_conn.close()
+        worker = self.workers[job_id] = _Worker(job_id, process, parent_conn)
+        loop = asyncio.get_running_loop()
+        # Demandes de slot LLM traitées dès leur arrivée, pas au rythme de l'échantillonnage
+        loop.add_reader(parent_conn.fileno(), self._drain, worker)
+        exceeded: Optional[str] = None
+        cancelled_at = None
+        killed = False
+        try:
+            while worker.outcome is None and process.is_alive():
+                worker.sample()
+                if exceeded is None:
+                    exceeded = worker.over_budget()
+                    if exceeded is not None:
+                        logger.warning(f"🧯 Analyse {job_id}: {exceeded}, annulation")
+                        worker.send(("cancel", exceeded))
+                        cancelled_at = time.monotonic()
+                elif time.monotonic() - cancelled_at > ANALYSIS_KILL_GRACE_SECONDS:
+                    logger.error(f"💀 Analyse {job_id}: worker arrêté de force ({exceeded})")
+                    process.kill()
+                    killed = True
+                    break
+                try:
+                    await asyncio.wait_for(worker.finished.wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+            self._drain(worker)
+        except BaseException:
+            # Serveur en arrêt ou appelant annulé: le worker ne doit pas survivre au job
+            process.kill()
+            raise
+        finally:
+            loop.remove_reader(parent_conn.fileno())
+            # Slots LLM encore tenus ou attendus pour ce worker rendus au scheduler
+            for task in [*worker.leases.values(), *worker.tasks]:
+                task.cancel()
+            await asyncio.to_thread(process.join, 5)
+            parent_conn.close()
+            del self.workers[job_id]
+        return await self._finish(db, worker, worker.outcome, exceeded, killed)
+
+    def _drain(self, worker: _Worker):
+        """Traite les messages du worker: progression, slots LLM, cache FinnHub, résultat"""
+        try:
+            while worker.conn.poll():
+                self._handle(worker, worker.conn.recv())
+        except (EOFError, OSError):
+            # Pipe fermé: plus rien à lire, le lecteur tournerait à vide
+            asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+
+    def _handle(self, worker: _Worker, message: tuple):
+        kind = message[0]
+        if kind == "publish":
+            _, topic, data = message
+            worker.phase = data.get("current_phase") or worker.phase
+            hub.publish(topic, data)
+        elif kind == "acquire":
+            _, request_id, flow, weight, priority, cost = message
+            worker.leases[request_id] = asyncio.create_task(self._lease(worker, request_id, flow, weight, priority, cost))
+        elif kind == "release":
+            task = worker.leases.pop(message[1], None)
+            if task is not None:
+                task.cancel()
+        elif kind == "finnhub":
+            task = asyncio.create_task(self._finnhub(worker, *message[1:]))
+            worker.tasks.add(task)
+            task.add_done_callback(worker.tasks.discard)
+        else:
+            worker.outcome = message
+            worker.finished.set()
+
+    async def _lease(self, worker: _Worker, request_id: int, flow: str, weight: float, priority: str, cost: float):
+        """Slot du scheduler du serveur tenu pour le worker jusqu'à son ``release``"""
+        async with fairqueue.llm_scheduler.slot(flow, weight, priority, cost):
+            worker.send(("resolve", request_id, True, None))
+            await asyncio.Event().wait()
+
+    async def _finnhub(self, worker: _Worker, request_id: int, path: str, params: dict, timeout: float,
+                       cache_ttl: float):
+        try:
+            reply = ("resolve", request_id, True,
+                     await upstream.finnhub_get(path, params, timeout=timeout, cache_ttl=cache_ttl))
+        except Exception as e:
+            reply = ("resolve", request_id, False, f"{type(e).__name__}: {e}")
+        worker.send(reply)
+
+    async def _finish(self, db, worker: _Worker, outcome: Optional[tuple], exceeded: Optional[str],
+                      killed: bool) -> Dict[str, dict]:
+        usage = outcome[-1] if outcome else {}
+        status = outcome[0] if outcome else ("killed" if killed or worker.process.exitcode == -signal.SIGKILL else "failed")
+        status = {"done": "completed", "error": "failed"}.get(status, status)
+        self.outcomes[status] += 1
+        resources = {
+            "isolation": "process",
+            "outcome": status,
+            "reason": exceeded,
+            "peak_rss_mb": round(max(worker.peak_rss_mb, usage.get("peak_rss_mb", 0)), 1),
+            "cpu_seconds": usage.get("cpu_seconds", worker.cpu_seconds),
+            "wall_seconds": round(time.monotonic() - worker.started, 2),
+            "exit_code": worker.process.exitcode,
+            "limits": {"rss_mb": ANALYSIS_MAX_RSS_MB, "cpu_seconds": ANALYSIS_MAX_CPU_SECONDS,
+                       "vms_mb": ANALYSIS_MAX_VMS_MB},
+        }
+        await db.analysis_jobs.update_one({"id": worker.job_id}, {"$set": {"resources": resources}})
+        phase = worker.phase or "worker"
+        if status == "completed":
+            return outcome[1]
+        if status == "failed" and outcome:
+            raise pipeline.PipelineError(outcome[1], outcome[2])
+        if status == "cancelled":
+            raise pipeline.PipelineError(phase, outcome[1])
+        # Worker tué (budget, RLIMIT_CPU dur) ou mort sans réponse (OOM killer, crash)
+        error = exceeded or f"worker interrompu (code de sortie {worker.process.exitcode})"
+        await pipeline.fail_job(db, worker.job_id, error)
+        raise pipeline.PipelineError(phase, error)
+
+    def stats(self) -> dict:
+        return {
+            "isolation": "process" if self.enabled() else "inline",
+            "max_workers": ANALYSIS_MAX_WORKERS,
+            "slots": self._slots.stats() if self._slots else None,
+            "limits": {"rss_mb": ANALYSIS_MAX_RSS_MB, "cpu_seconds": ANALYSIS_MAX_CPU_SECONDS,
+                       "vms_mb": ANALYSIS_MAX_VMS_MB, "kill_grace_seconds": ANALYSIS_KILL_GRACE_SECONDS},
+            "running": [
+                {"job_id": w.job_id, "pid": w.process.pid, "phase": w.phase, "rss_mb": round(w.rss_mb, 1),
+                 "cpu_seconds": w.cpu_seconds, "seconds": round(time.monotonic() - w.started, 1)}
+                for w in self.workers.values()
+            ],
+            "outcomes": dict(self.outcomes),
+        }
+
+
+supervisor = WorkerSupervisor()
@@ -3,8 +3,26 @@ import "./App.css";
 import { BrowserRouter, Routes, Route } from "react-router-dom";
 import axios from "axios";
 
+// Statut de repli pour éviter un crash complet quand le backend est injoignable
+const OFFLINE_STATUS = {
+  status: "⚠️ Backend inaccessible",
+  version: "v1.0.0",
+  components: {
+    analyst_team: "❌ Non disponible",
+    research_team: "❌ Non disponible",
+    trading_team: "❌ Non disponible",
+    risk_management: "❌ Non disponible",
+    portfolio_management: "❌ Non disponible"
+  },
+  apis: {
+    deepseek: "❌ Non testé",
+    finnhub: "❌ Non testé"
+  }
+};
+
 const TradingAgentsHome = () => {
   const [systemStatus, setSystemStatus] = useState(null);
+  const [upstreamStatus, setUpstreamStatus] = useState(null);
   const [loading, setLoading] = useState(true);
   const [cliLaunched, setCLILaunched] = useState(false);
   const [analysisRunning, setAnalysisRunning] = useState(false);
@@ -26,50 +44,60 @@ const TradingAgentsHome = () => {
     env: process.env.REACT_APP_BACKEND_URL
   });
 
+  // Canal temps réel unique (/api/ws): statut système et santé des APIs poussés par le backend.
+  // Le snapshot reçu à l'abonnement remplace l'ancien chargement du statut par axios.
   useEffect(() => {
-    loadSystemStatus();
-  }, []);
-
-  const loadSystemStatus = async () => {
-    try {
-      console.log('📡 Chargement status depuis:', `${API}/trading/status`);
-      const response = await axios.get(`${API}/trading/status`, {
-        timeout: 10000,
-        headers: {
-          'Content-Type': 'application/json'
-        }
-      });
-      console.log('✅ Status reçu:', response.data);
-      setSystemStatus(response.data);
-      setLoading(false);
-    } catch (e) {
-      console.error("❌ Erreur chargement status:", e);
-      
-      // GESTION SPÉCIFIQUE NETWORK ERROR
-      if (e.code === 'ERR_NETWORK' || e.message.includes('Network Error')) {
-        console.error('🚨 NETWORK ERROR détectée');
-        alert('ERREUR RÉSEAU: Impossible de se connecter au backend. Vérifiez que le serveur backend est démarré sur http://localhost:8001');
-      }
-      
-      // Fallback status pour éviter crash complet
-      setSystemStatus({
-        status: "⚠️ Backend inaccessible",
-        version: "v1.0.0",
-        components: {
-          analyst_team: "❌ Non disponible",
-          research_team: "❌ Non disponible",
-          trading_team: "❌ Non disponible", 
-          risk_management: "❌ Non disponible",
-          portfolio_management: "❌ Non disponible"
-        },
-        apis: {
-          deepseek: "❌ Non testé",
-          finnhub: "❌ Non testé"
+    let socket = null;
+    let retryTimer = null;
+    let retryDelay = 1000;
+    let closed = false;
+
+    const connect = () => {
+      socket = new WebSocket(`${BACKEND_URL.replace(/^http/, 'ws')}/api/ws`);
+      socket.onopen = () => {
+        retryDelay = 1000;
+        socket.send(JSON.stringify({ action: 'subscribe', topics: ['system', 'upstream'] }));
+      };
+      socket.onmessage = (event) => {
+        const frame = JSON.parse(event.data);
+        if (!Object.keys(frame.data).length) return;
+        if (frame.topic === 'system') {
+          setSystemStatus((previous) => ({ ...previous, ...frame.data }));
+          setLoading(false);
+        } else if (frame.topic === 'upstream') {
+          setUpstreamStatus((previous) => ({ ...previous, ...frame.data }));
         }
-      });
-      setLoading(false);
-    }
-  };
+      };
+      socket.onerror = (e) => console.error('❌ Erreur WebSocket:', e);
+      socket.onclose = () => {
+        if (closed) return;
+        // Backend injoignable: statut de repli affiché pendant les tentatives de reconnexion
+        setSystemStatus(OFFLINE_STATUS);
+        setLoading(false);
+        console.warn(`🔌 WebSocket fermé, reconnexion dans ${retryDelay / 1000} s`);
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      socket.close();
+    };
+  }, [BACKEND_URL]);
+
+  // Préchargement des données pendant la saisie (ticker/date stables depuis 600 ms)
+  const { ticker, analysis_date, analysts } = analysisConfig;
+  useEffect(() => {
+    if (!ticker || !analysis_date) return;
+    const timer = setTimeout(() => {
+      axios.post(`${API}/trading/prefetch`, { ticker, analysis_date, analysts }, { timeout: 5000 })
+        .catch(() => {});  // simple indice: un échec ne gêne pas l'analyse
+    }, 600);
+    return () => clearTimeout(timer);
+  }, [API, ticker, analysis_date, analysts]);
 
   const launchCLI = async () => {
     try {
@@ -170,6 +198,10 @@ ${response.data.next_steps?.map((step, i) => `${i + 1}. ${step}`).join('\n')}`;
         alert('ERREUR RÉSEAU: La connexion au backend a échoué pendant l\'analyse. Le backend est-il démarré?');
       } else if (error.code === 'ECONNABORTED') {
         errorMessage += "TIMEOUT - L'analyse a pris trop de temps";
+      } else if (error.response && [429, 503].includes(error.response.status)) {
+        // Serveur saturé: refus immédiat, nouvel essai conseillé via Retry-After
+        const retryAfter = error.response.headers['retry-after'];
+        errorMessage += `${error.response.data?.detail || 'Serveur saturé'}${retryAfter ? ` - réessayez dans ${retryAfter} s` : ''}`;
       } else if (error.response) {
         errorMessage += `HTTP ${error.response.status}: ${error.response.data?.message || error.response.statusText}`;
       } else {
@@ -291,6 +323,9 @@ ${response.data.next_steps?.map((step, i) => `${i + 1}. ${step}`).join('\n')}`;
                       <span>{value}</span>
                     </div>
                   ))}
+                  {upstreamStatus?.overall_status && (
+                    <div className="text-sm text-gray-600 mt-2">{upstreamStatus.overall_status}</div>
+                  )}
                 </div>
               </div>
             </div>
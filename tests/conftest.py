@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Les modules du backend s'importent à plat (``import pipeline``), comme sous uvicorn
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import admission
+from admission import AdmissionController
+
+
+class FakeProcess:
+    def __init__(self):
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setitem(admission.LIMITS, "analysis", 2)
+    monkeypatch.setitem(admission.LIMITS, "cli", 1)
+    monkeypatch.setattr(admission, "ADMISSION_MAX_RSS_MB", 1024)
+    monkeypatch.setattr(admission, "ADMISSION_MAX_LOOP_LAG_MS", 500)
+    monkeypatch.setattr(admission.llm_scheduler, "waiting_for", lambda priority: 0)
+    return AdmissionController()
+
+
+def _rejection(controller, kind="analysis"):
+    with pytest.raises(HTTPException) as error:
+        controller.check(kind)
+    return error.value
+
+
+def _completions(controller, kind, ages, duration=5.0):
+    now = time.monotonic()
+    controller._completions[kind].extend((now - age, duration) for age in ages)
+
+
+def test_admits_until_the_limit_then_rejects_with_429(controller):
+    async def scenario():
+        async with controller.admit("analysis"):
+            async with controller.admit("analysis"):
+                assert controller.running("analysis") == 2
+                return _rejection(controller)
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 429
+    assert error.headers["Retry-After"] == str(admission.DEFAULT_RETRY_SECONDS)
+    assert controller.active["analysis"] == 0
+    assert controller.rejected == {"analysis:429": 1}
+    # Les deux analyses terminées comptent dans le débit
+    assert len(controller._completions["analysis"]) == 2
+
+
+def test_process_pressure_rejects_with_503(controller):
+    controller.rss_bytes = 2048 * 1024 * 1024
+    assert "mémoire" in controller.pressure()
+    assert _rejection(controller, "backtest").status_code == 503
+
+    controller.rss_bytes = 0
+    controller.loop_lag_ms = 800
+    assert "boucle" in controller.pressure()
+    assert _rejection(controller).status_code == 503
+
+    controller.loop_lag_ms = 100
+    assert controller.pressure() is None
+    controller.check("backtest")
+
+
+def test_saturated_llm_queue_rejects_analyses(controller, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_LLM_WAITING", 4)
+    monkeypatch.setattr(admission.llm_scheduler, "waiting_for", lambda priority: 4)
+    assert _rejection(controller).status_code == 429
+    controller.check("cli")  # la file LLM ne concerne que les analyses
+
+
+def test_live_cli_processes_count_until_they_exit(controller):
+    process = FakeProcess()
+    controller.track_process("cli", process)
+    assert _rejection(controller, "cli").status_code == 429
+    process.returncode = 0
+    controller.check("cli")
+    assert controller.processes["cli"] == []
+    assert len(controller._completions["cli"]) == 1
+
+
+def test_retry_after_follows_recent_throughput(controller):
+    # 10 complétions en 25 s: 0,4/s; une place -> 2,5 s, trois places -> 7,5 s (arrondi supérieur)
+    _completions(controller, "analysis", [25 - 2.5 * i for i in range(10)])
+    assert controller.retry_after("analysis") == 3
+    assert controller.retry_after("analysis", excess=3) == 8
+
+
+def test_retry_after_without_recent_completions_uses_mean_duration(controller):
+    _completions(controller, "analysis", [120, 90], duration=42.0)
+    assert controller.throughput("analysis") == 0.0
+    assert controller.retry_after("analysis") == 42
+
+
+def test_retry_after_is_bounded(controller):
+    assert controller.retry_after("cli") == admission.DEFAULT_RETRY_SECONDS
+    _completions(controller, "cli", [100], duration=3600)
+    assert controller.retry_after("cli") == admission.MAX_RETRY_SECONDS
+    _completions(controller, "analysis", [0.5 + i * 0.01 for i in range(50)])
+    assert controller.retry_after("analysis") == 1
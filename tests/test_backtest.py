@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest
+
+
+def _prices(closes, ticker="AAA"):
+    index = pd.bdate_range("2024-01-01", periods=len(closes))
+    return pd.DataFrame({ticker: closes}, index=index)
+
+
+@pytest.mark.parametrize("horizon", [1, 2, 5])
+def test_portfolio_and_decision_cover_same_window(horizon):
+    prices = _prices(100.0 * 1.1 ** np.arange(20))
+    result = backtest.run_backtest(["AAA"], ["2024-01-01"], ["BUY"], prices, horizon=horizon)
+    metrics = result["metrics"]
+    expected = 1.1 ** horizon - 1.0
+    assert metrics["avg_decision_return"] == pytest.approx(expected)
+    assert metrics["total_return"] == pytest.approx(expected)
+    assert metrics["hit_rate"] == 1.0
+
+
+def test_sell_and_next_decision_replaces_position():
+    # +10 % par jour puis -10 % par jour: SELL au sommet, BUY remplacé avant son horizon
+    closes = [100.0 * 1.1 ** i for i in range(4)] + [100.0 * 1.1 ** 3 * 0.9 ** i for i in range(1, 6)]
+    prices = _prices(closes)
+    dates = [d.strftime("%Y-%m-%d") for d in prices.index[[0, 3]]]
+    result = backtest.run_backtest(["AAA", "AAA"], dates, ["BUY", "SELL"], prices, horizon=3)
+    metrics = result["metrics"]
+    assert metrics["avg_decision_return"] == pytest.approx(((1.1 ** 3 - 1) + (1 - 0.9 ** 3)) / 2)
+    # BUY tenu 3 jours puis SELL tenu 3 jours, rien au-delà
+    assert metrics["total_return"] == pytest.approx(1.1 ** 3 * 1.1 ** 3 - 1.0)
+    assert metrics["days"] == len(closes) - 1
+
+
+def test_unknown_ticker_and_decision_are_skipped():
+    prices = _prices([100.0, 101.0, 102.0])
+    result = backtest.run_backtest(["AAA", "ZZZ", "AAA"], ["2024-01-01"] * 3, ["BUY", "BUY", "MAYBE"],
+                                   prices, horizon=1)
+    assert result["decisions"] == 1
+    assert result["skipped"] == 2
@@ -0,0 +1,60 @@
+import pytest
+
+import comparison
+from comparison import ComparisonError, normalize_tickers, parse_ranking
+
+TICKERS = ["NVDA", "AMD", "BRK.B", "INTC"]
+
+
+@pytest.mark.parametrize("line", [
+    "1. NVDA | SCORE: 82 | DECISION: BUY | Croissance forte",
+    "NVDA | SCORE: 82 | DECISION: BUY | Croissance forte",
+    "2) NVDA | score : 82 | decision : buy | Croissance forte",
+    "- **NVDA** | SCORE: 82 | DECISION: BUY | Croissance forte",
+    "| NVDA | SCORE: 82 | DECISION: BUY | Croissance forte |",
+    "nvda | **SCORE**: 82/100 | **DECISION**: **BUY** | Croissance forte",
+])
+def test_parse_ranking_formats(line):
+    assert parse_ranking(line, TICKERS) == {
+        "NVDA": {"score": 82.0, "decision": "BUY", "rationale": "Croissance forte"},
+    }
+
+
+def test_parse_ranking_keeps_order_and_first_occurrence():
+    text = """Voici le classement:
+
+1. AMD | SCORE: 71,5 | DECISION: HOLD
+2. BRK.B | SCORE: 64 | DECISION: HOLD | Valorisation tendue
+3. TSLA | SCORE: 90 | DECISION: BUY | hors comparaison
+4. AMD | SCORE: 10 | DECISION: SELL | doublon ignoré
+5. INTC | SCORE: 250 | DECISION: SELL | borné à 100
+Conclusion: NVDA reste à surveiller.
+"""
+    ranked = parse_ranking(text, TICKERS)
+    assert list(ranked) == ["AMD", "BRK.B", "INTC"]
+    assert ranked["AMD"] == {"score": 71.5, "decision": "HOLD", "rationale": ""}
+    assert ranked["INTC"]["score"] == 100.0
+
+
+def test_parse_ranking_ignores_malformed_lines():
+    text = "NVDA | SCORE: élevé | DECISION: BUY\nAMD - SCORE: 50 - DECISION: HOLD\nINTC | SCORE: 40 | DECISION: WAIT"
+    assert parse_ranking(text, TICKERS) == {}
+
+
+def test_ordered_ranks_missing_tickers_last():
+    entries = [
+        {"ticker": t, "source": "reused", "job_id": f"job-{t}", "decision": {"decision": "SELL"}}
+        for t in ("NVDA", "AMD", "INTC")
+    ]
+    ranked = {"AMD": {"score": 60.0, "decision": "BUY", "rationale": ""},
+              "NVDA": {"score": 60.0, "decision": "HOLD", "rationale": ""}}
+    rows = comparison._ordered(entries, ranked)
+    # À score égal, l'ordre du classeur est conservé; l'absent garde sa décision d'analyse
+    assert [(r["rank"], r["ticker"]) for r in rows] == [(1, "AMD"), (2, "NVDA"), (3, "INTC")]
+    assert rows[2]["score"] is None and rows[2]["decision"] == "SELL"
+
+
+def test_normalize_tickers():
+    assert normalize_tickers([" nvda", "AMD", "NVDA", ""]) == ["NVDA", "AMD"]
+    with pytest.raises(ComparisonError):
+        normalize_tickers(["NVDA", "nvda"])
@@ -0,0 +1,107 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import compression
+from compression import CompressionMiddleware, choose_encoding
+from responses import conditional_response, etag_for, json_response
+
+LARGE = {"items": [{"id": i, "label": "analyse"} for i in range(200)]}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=512)
+
+    @app.get("/large")
+    async def large(request: Request):
+        return conditional_response(request, LARGE)
+
+    @app.get("/small")
+    async def small(request: Request):
+        return conditional_response(request, {"ok": True})
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for i in range(50):
+                yield f'{{"line": {i}}}\n'.encode()
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_choose_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("br, gzip") == "gzip"
+    assert choose_encoding("br") is None
+
+
+def test_large_response_is_compressed_with_encoding_specific_etag(client):
+    plain = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    etag = plain.headers["etag"]
+    assert etag == etag_for(json_response(LARGE).body)
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == etag[:-1] + '-gzip"'
+    assert response.json() == LARGE
+
+
+def test_small_response_is_left_alone(client):
+    etag = client.get("/small", headers={"Accept-Encoding": "identity"}).headers["etag"]
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    # Même validateur et même Vary qu'une réponse compressée: les caches distinguent les encodages
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == etag[:-1] + '-gzip"'
+
+
+def test_streaming_response_is_compressed_incrementally(client):
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode().splitlines()[-1] == '{"line": 49}'
+
+
+@pytest.mark.parametrize("encoding", ["identity", "gzip", "br"])
+def test_if_none_match_returns_304_for_any_representation(client, encoding):
+    full = client.get("/large", headers={"Accept-Encoding": encoding})
+    etag = full.headers["etag"]
+    # Le client renvoie l'ETag de la représentation reçue (éventuellement suffixé)
+    for candidate in (etag, f"W/{etag}", f'"autre", {etag}'):
+        response = client.get("/large", headers={"Accept-Encoding": encoding, "If-None-Match": candidate})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["cache-control"] == "no-cache"
+        # Le 304 porte le validateur de la représentation que le client recevrait
+        assert response.headers["etag"] == etag
+        assert response.headers.get("vary") == full.headers.get("vary")
+
+
+def test_stale_etag_returns_full_response(client):
+    response = client.get("/large", headers={"If-None-Match": '"perime"'})
+    assert response.status_code == 200
+    assert response.json() == LARGE
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import export
+
+BASE = datetime(2024, 5, 10, 9, 0)
+
+
+def _documents():
+    # Horodatages en double: l'ordre (horodatage, id) départage les égalités
+    return [
+        {"id": f"{i:02d}", "client_name": "client", "timestamp": BASE + timedelta(seconds=i // 3)}
+        for i in range(12)
+    ]
+
+
+def _export(documents, batch_size=5, **filters):
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        # Insertion dans le désordre: l'export ne dépend pas de l'ordre physique
+        await db.status_checks.insert_many([dict(d) for d in reversed(documents)])
+        _, cursor = await export.open_cursor(db, "status_checks", batch_size=batch_size, **filters)
+        chunks = [chunk async for chunk in export.stream_ndjson(cursor, batch_size)]
+        return chunks, [json.loads(line)["id"] for chunk in chunks for line in chunk.splitlines()]
+
+    return asyncio.run(scenario())
+
+
+def test_export_is_sorted_and_batched():
+    chunks, ids = _export(_documents(), batch_size=5)
+    assert ids == [f"{i:02d}" for i in range(12)]
+    assert len(chunks) == 3
+
+
+@pytest.mark.parametrize("last", [0, 4, 5, 10, 11])
+def test_resume_after_continues_with_the_next_record(last):
+    _, ids = _export(_documents(), resume_after=f"{last:02d}")
+    assert ids == [f"{i:02d}" for i in range(last + 1, 12)]
+
+
+def test_period_bounds_and_resume_combine():
+    _, ids = _export(_documents(), since=BASE + timedelta(seconds=1), until=BASE + timedelta(seconds=3),
+                     resume_after="04")
+    assert ids == ["05", "06", "07", "08"]
+
+
+def test_unknown_resume_after_is_rejected():
+    with pytest.raises(export.ExportError):
+        _export(_documents(), resume_after="absent")
+
+
+def test_unknown_dataset_and_format_are_rejected():
+    with pytest.raises(export.ExportError):
+        asyncio.run(export.open_cursor(AsyncMongoMockClient()["test"], "secrets"))
+    with pytest.raises(export.ExportError):
+        export.content("xml")
+
+
+def test_arrow_stream_round_trip():
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        await db.status_checks.insert_many(_documents())
+        dataset, cursor = await export.open_cursor(db, "status_checks", resume_after="02", batch_size=4)
+        return b"".join([chunk async for chunk in export.stream_arrow(cursor, dataset, 4)])
+
+    table = pyarrow.ipc.open_stream(asyncio.run(scenario())).read_all()
+    assert table.column("id").to_pylist() == [f"{i:02d}" for i in range(3, 12)]
+    assert table.num_rows == 9
+
+
+def test_import_does_not_load_pyarrow():
+    code = "import sys, export; print(sorted(m for m in ('numpy', 'pyarrow') if m in sys.modules))"
+    backend = Path(export.__file__).parent
+    output = subprocess.run([sys.executable, "-c", code], cwd=backend, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
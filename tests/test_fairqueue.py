@@ -0,0 +1,97 @@
+import asyncio
+
+from fairqueue import BATCH, INTERACTIVE, FairScheduler
+
+
+async def _holder(scheduler, name, granted, release, **kwargs):
+    async with scheduler.slot(name.split("-")[0], **kwargs):
+        granted.append(name)
+        await release.wait()
+
+
+async def _drain(scheduler, requests):
+    """Un slot occupé, les requêtes en file, puis libération une à une: ordre d'attribution"""
+    granted = []
+    gate, release = asyncio.Event(), asyncio.Event()
+    release.set()
+    blocker = asyncio.create_task(_holder(scheduler, "blocker", granted, gate))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(_holder(scheduler, name, granted, release, **kwargs)) for name, kwargs in requests]
+    await asyncio.sleep(0)
+    assert granted == ["blocker"]
+    gate.set()
+    await asyncio.gather(blocker, *tasks)
+    return granted[1:]
+
+
+def test_weighted_flows_share_by_finish_tag():
+    requests = [(f"heavy-{i}", {"weight": 2.0}) for i in range(4)] + [(f"light-{i}", {"weight": 1.0}) for i in range(4)]
+    order = asyncio.run(_drain(FairScheduler(1, 0), requests))
+    # Étiquettes: heavy 1.5, 2, 2.5, 3; light 2, 3, 4, 5 (égalité: ordre d'arrivée)
+    assert order == ["heavy-0", "heavy-1", "light-0", "heavy-2", "heavy-3", "light-1", "light-2", "light-3"]
+
+
+def test_idle_flow_does_not_bank_credit():
+    async def scenario():
+        scheduler = FairScheduler(1, 0)
+        release = asyncio.Event()
+        release.set()
+        for i in range(3):
+            await _holder(scheduler, f"busy-{i}", [], release)
+        requests = [(f"busy-{i}", {}) for i in range(3, 6)] + [(f"idle-{i}", {}) for i in range(3)]
+        return await _drain(scheduler, requests)
+
+    # Le flux resté inactif repart du temps virtuel courant: alternance, pas de rafale
+    assert asyncio.run(scenario()) == ["busy-3", "idle-0", "busy-4", "idle-1", "busy-5", "idle-2"]
+
+
+def test_interactive_requests_pass_queued_batch():
+    requests = [("batch-0", {"priority": BATCH}), ("batch-1", {"priority": BATCH}), ("user-0", {"priority": INTERACTIVE})]
+    order = asyncio.run(_drain(FairScheduler(1, 0), requests))
+    assert order == ["user-0", "batch-0", "batch-1"]
+
+
+def test_reserve_keeps_a_slot_for_interactive():
+    async def scenario():
+        scheduler = FairScheduler(2, 1)
+        granted, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(_holder(scheduler, f"batch-{i}", granted, release, priority=BATCH)) for i in range(2)]
+        await asyncio.sleep(0)
+        # Un slot reste libre mais réservé: le second batch attend
+        assert granted == ["batch-0"] and scheduler.waiting_for(BATCH) == 1
+        tasks.append(asyncio.create_task(_holder(scheduler, "user-0", granted, release)))
+        await asyncio.sleep(0)
+        assert granted == ["batch-0", "user-0"]
+        release.set()
+        await asyncio.gather(*tasks)
+        return granted, scheduler.in_flight
+
+    granted, in_flight = asyncio.run(scenario())
+    assert granted[-1] == "batch-1"
+    assert in_flight == {INTERACTIVE: 0, BATCH: 0}
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        scheduler = FairScheduler(1, 0)
+        granted, gate = [], asyncio.Event()
+        blocker = asyncio.create_task(_holder(scheduler, "blocker", granted, gate))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_holder(scheduler, "waiter", granted, gate))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        gate.set()
+        await asyncio.gather(blocker, waiter, return_exceptions=True)
+        # La requête annulée ne pénalise pas la suivante du même flux
+        expected = scheduler.virtual_time + 1.0
+        async with scheduler.slot("waiter"):
+            finish = scheduler.last_finish["waiter"]
+        async with scheduler.slot("after"):
+            granted.append("after")
+        return granted, scheduler.in_flight, scheduler.waiting_for(INTERACTIVE), finish, expected
+
+    granted, in_flight, waiting, finish, expected = asyncio.run(scenario())
+    assert granted == ["blocker", "after"]
+    assert in_flight == {INTERACTIVE: 0, BATCH: 0}
+    assert waiting == 0
+    assert finish == expected
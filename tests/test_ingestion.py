@@ -0,0 +1,208 @@
+import asyncio
+import types
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import ingestion
+from ingestion import Deduplicator, content_hash, hamming, simhash
+
+ORIGINAL = ("Nvidia shares surge after record data center revenue beats estimates. "
+            "The chipmaker reported quarterly revenue well above analyst expectations, driven by AI demand.")
+REPRISE = ("Nvidia shares surge after record data center revenue beats estimates. "
+           "The chipmaker reported quarterly revenue well above analysts expectations, driven by AI demand!")
+DISTINCT = ("Apple faces antitrust probe in Europe over App Store rules. "
+            "Regulators opened an investigation into payment restrictions imposed on developers.")
+
+
+def _item(text, ticker="NVDA", kind="news", day=1):
+    item = {"ticker": ticker, "kind": kind, "published_at": datetime(2024, 5, day), "text": text,
+            "content_hash": content_hash(text)}
+    if kind == "news":
+        item["simhash"] = simhash(text)
+    return item
+
+
+async def _batches(deduplicator, pending, items):
+    yield [item for item in items if deduplicator.check(item, pending) is None]
+
+
+def _stats():
+    return {"stored": 0, "duplicates": 0, "duplicate_of": defaultdict(int)}
+
+
+def test_simhash_separates_reprises_from_distinct_articles():
+    assert hamming(simhash(ORIGINAL), simhash(REPRISE)) <= ingestion.NEAR_DUPLICATE_DISTANCE
+    assert hamming(simhash(ORIGINAL), simhash(DISTINCT)) > 20
+    # Hash exact insensible à la casse et à la ponctuation
+    assert content_hash(ORIGINAL) == content_hash(ORIGINAL.upper() + " !!")
+
+
+def test_check_detects_exact_and_near_duplicates_within_a_run():
+    deduplicator = Deduplicator()
+    pending = {}
+    original = _item(ORIGINAL)
+    assert deduplicator.check(original, pending) is None
+    assert deduplicator.check(_item(ORIGINAL), pending) == original["content_hash"]
+    assert deduplicator.check(_item(REPRISE), pending) == original["content_hash"]
+    assert deduplicator.check(_item(DISTINCT), pending) is None
+    # Rien n'est connu tant que l'écriture n'a pas eu lieu
+    assert deduplicator.hashes["NVDA"] == {}
+
+
+def test_remembered_items_are_duplicates_for_later_runs():
+    deduplicator = Deduplicator()
+    deduplicator.remember(_item(ORIGINAL))
+    assert deduplicator.check(_item(REPRISE), {}) == content_hash(ORIGINAL)
+    assert deduplicator.check(_item(ORIGINAL, ticker="AMD"), {}) is None
+
+
+def test_memory_is_bounded(monkeypatch):
+    monkeypatch.setattr(ingestion, "HASH_WINDOW", 3)
+    monkeypatch.setattr(ingestion, "DEDUP_MAX_TICKERS", 2)
+    deduplicator = Deduplicator()
+    words = ["alpha", "beta", "gamma", "delta", "epsilon"]
+    for word in words:
+        deduplicator.remember(_item(f"article {word}", kind="social"))
+    assert list(deduplicator.hashes["NVDA"]) == [content_hash(f"article {word}") for word in words[2:]]
+
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        for ticker in ("NVDA", "AMD", "TSLA"):
+            await deduplicator.load(db, ticker)
+
+    asyncio.run(scenario())
+    assert list(deduplicator.loaded) == ["AMD", "TSLA"]
+    assert "NVDA" not in deduplicator.hashes
+
+
+def test_failed_insert_is_not_remembered(monkeypatch):
+    async def scenario():
+        collection = AsyncMongoMockClient()["test"].news_items
+        await collection.create_index([("ticker", 1), ("content_hash", 1)], unique=True)
+        db = types.SimpleNamespace(news_items=collection)
+        deduplicator = Deduplicator()
+        stats, pending = _stats(), {}
+        insert_many = collection.insert_many
+
+        async def failing(docs, ordered=False):
+            raise ConnectionError("mongo indisponible")
+
+        monkeypatch.setattr(collection, "insert_many", failing)
+        with pytest.raises(ConnectionError):
+            await ingestion.store(db, _batches(deduplicator, pending, [_item(ORIGINAL)]), stats, deduplicator, pending)
+        assert stats["stored"] == 0
+        assert deduplicator.check(_item(ORIGINAL), {}) is None
+
+        monkeypatch.setattr(collection, "insert_many", insert_many)
+        pending = {}
+        await ingestion.store(db, _batches(deduplicator, pending, [_item(ORIGINAL), _item(DISTINCT)]), stats,
+                              deduplicator, pending)
+        assert stats["stored"] == 2
+        assert pending == {}
+        assert deduplicator.check(_item(REPRISE), {}) == content_hash(ORIGINAL)
+
+        # Doublon déjà en base (autre processus): non compté, mais connu ensuite
+        other = Deduplicator()
+        pending = {}
+        await ingestion.store(db, _batches(other, pending, [_item(ORIGINAL)]), stats, other, pending)
+        assert stats["stored"] == 2
+        assert other.check(_item(ORIGINAL), {}) == content_hash(ORIGINAL)
+
+    asyncio.run(scenario())
+
+
+def test_missing_ranges_stay_within_the_window():
+    day = timedelta(days=1)
+    start, end = datetime(2024, 5, 3), datetime(2024, 5, 10)
+    assert ingestion._missing([], start, end, refresh=False) == [(start, end)]
+    # Couverture ancienne: seule la fenêtre est collectée, pas les années entre les deux
+    old = [(datetime(2020, 1, 1), datetime(2020, 1, 8))]
+    assert ingestion._missing(old, start, end, refresh=False) == [(start, end)]
+    covered = [(datetime(2024, 5, 1), datetime(2024, 5, 6))]
+    assert ingestion._missing(covered, start, end, refresh=False) == [(datetime(2024, 5, 6) - day, end)]
+    assert ingestion._missing([(start, end)], start, end, refresh=False) == []
+    assert ingestion._missing([(start, end)], start, end, refresh=True) == [(end - day, end)]
+
+
+def test_coverage_recorded_per_fetched_range(monkeypatch):
+    calls = []
+
+    async def fetch(ticker, kind, start, end):
+        calls.append((start, end))
+        if len(calls) == 2:
+            raise RuntimeError("FinnHub indisponible")
+        yield {"ticker": ticker, "kind": kind, "published_at": start, "text": f"{ticker} {start}", "sentiment": 0.0}
+
+    monkeypatch.setattr(ingestion, "fetch_items", fetch)
+
+    async def scenario():
+        ingestor = ingestion.Ingestor()
+        ingestor.db = AsyncMongoMockClient()["test"]
+        await ingestor.ingest("NVDA", "social", datetime(2024, 5, 1), datetime(2024, 5, 8))
+        with pytest.raises(RuntimeError):
+            await ingestor.ingest("NVDA", "social", datetime(2024, 1, 1), datetime(2024, 1, 8))
+        # Demande de plusieurs années: ramenée à INGEST_MAX_DAYS
+        await ingestor.ingest("NVDA", "social", datetime(2015, 1, 1), datetime(2024, 3, 1))
+        state = await ingestor.db.ingest_state.find_one({"ticker": "NVDA", "kind": "social"})
+        return state["covered"]
+
+    covered = asyncio.run(scenario())
+    assert calls[2] == (datetime(2024, 3, 1) - timedelta(days=ingestion.INGEST_MAX_DAYS), datetime(2024, 3, 1))
+    assert covered == [[calls[2][0], calls[2][1]], [datetime(2024, 5, 1), datetime(2024, 5, 8)]]
+
+
+class _FakeFinnhub:
+    """Remplace ``requests`` dans upstream: réponses FinnHub fixes, appels comptés"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        path = url.split("/api/v1", 1)[-1]
+        self.calls.append(path)
+        if path == "/company-news":
+            data = [{"datetime": 1714900000 + i * 3600, "headline": f"Nvidia headline {word}",
+                     "summary": f"Record demand {word} beats estimates", "source": "wire"}
+                    for i, word in enumerate(("alpha", "bravo", "charlie"))]
+        else:
+            data = {"reddit": [{"atTime": "2024-05-08 10:00:00", "mention": 12, "positiveMention": 8,
+                                "negativeMention": 2, "score": 0.4}], "twitter": []}
+        return types.SimpleNamespace(raise_for_status=lambda: None, json=lambda: data)
+
+
+def _view(monkeypatch, mode, db):
+    monkeypatch.setenv("TRADING_PIPELINE_MODE", mode)
+    ingestor = ingestion.Ingestor()
+    ingestor.db = db
+    monkeypatch.setattr(ingestion, "ingestor", ingestor)
+
+    async def views():
+        return [await ingestion.analyst_view("NVDA", kind, "2024-05-10") for kind in ingestion.KINDS]
+
+    return asyncio.run(views())
+
+
+def test_record_on_warm_db_then_replay_on_empty_db(monkeypatch, tmp_path):
+    import upstream
+
+    finnhub = _FakeFinnhub()
+    monkeypatch.setattr(upstream, "requests", finnhub)
+    monkeypatch.setenv("TRADING_CASSETTE", str(tmp_path / "cassette.jsonl.gz"))
+    warm = AsyncMongoMockClient()["warm"]
+    _view(monkeypatch, "live", warm)
+    assert sorted(finnhub.calls) == ["/company-news", "/stock/social-sentiment"]
+
+    # Fenêtre déjà couverte en base: l'enregistrement collecte quand même
+    recorded = _view(monkeypatch, "record", warm)
+    assert len(finnhub.calls) == 4
+
+    def offline(*args, **kwargs):
+        raise AssertionError("aucun appel réseau en replay")
+
+    monkeypatch.setattr(upstream, "requests", types.SimpleNamespace(get=offline))
+    replayed = _view(monkeypatch, "replay", AsyncMongoMockClient()["empty"])
+    assert replayed == recorded
+    assert recorded[0]["count"] == 3 and recorded[1]["sources"]["reddit"]["mention"] == 12
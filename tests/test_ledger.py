@@ -0,0 +1,129 @@
+import asyncio
+import types
+from datetime import datetime
+
+from mongomock_motor import AsyncMongoMockClient
+
+import ledger
+from ledger import Ledger, build_event
+
+TS = datetime(2024, 5, 10, 9, 30, 15)
+
+
+def _event(tenant, prompt=1000, completion=200):
+    event = build_event("deepseek-chat", {"prompt_tokens": prompt, "completion_tokens": completion}, 120.0,
+                        tenant_id=tenant)
+    event["ts"] = TS
+    return event
+
+
+class Flaky:
+    """Collection dont les premiers appels à ``method`` échouent (après écriture si ``after``)"""
+
+    def __init__(self, collection, method, failures=1, after=False):
+        self.collection = collection
+        self.method = method
+        self.failures = failures
+        self.after = after
+
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if name != self.method:
+            return attribute
+
+        async def call(*args, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                if self.after:
+                    await attribute(*args, **kwargs)
+                raise TimeoutError("réseau coupé")
+            return await attribute(*args, **kwargs)
+
+        return call
+
+
+def _ledger(**collections):
+    mongo = AsyncMongoMockClient()["test"]
+    db = types.SimpleNamespace(llm_ledger=mongo.llm_ledger, llm_cost_buckets=mongo.llm_cost_buckets)
+    for name, wrap in collections.items():
+        setattr(db, name, wrap(getattr(mongo, name)))
+    registry = Ledger()
+    registry.db = db
+    registry._lock = asyncio.Lock()
+    return registry, mongo
+
+
+async def _bucket(mongo, dimension, key, granularity):
+    return await mongo.llm_cost_buckets.find_one({"dimension": dimension, "key": key, "granularity": granularity})
+
+
+def test_flush_writes_events_and_aggregated_buckets():
+    async def scenario():
+        registry, mongo = _ledger()
+        for tenant in ("acme", "acme", "globex"):
+            registry.record(_event(tenant))
+        await registry.flush()
+        return (await mongo.llm_ledger.count_documents({}), await _bucket(mongo, "total", "all", "minute"),
+                await _bucket(mongo, "tenant", "acme", "day"), await _bucket(mongo, "ticker", "all", "hour"))
+
+    count, total, acme, ticker = asyncio.run(scenario())
+    assert count == 3
+    assert total["calls"] == 3 and total["total_tokens"] == 3600
+    assert total["start"] == datetime(2024, 5, 10, 9, 30)
+    assert acme["calls"] == 2
+    assert acme["cost_usd"] == ledger.compute_cost("deepseek-chat", 2000, 400)
+    assert ticker is None  # événement sans ticker: pas de seau par ticker
+
+
+def test_events_written_before_a_failure_are_not_counted_twice():
+    async def scenario():
+        registry, mongo = _ledger(llm_ledger=lambda c: Flaky(c, "insert_many", after=True))
+        for tenant in ("acme", "acme", "globex"):
+            registry.record(_event(tenant))
+        await registry.flush()
+        # Écrits côté serveur mais erreur côté client: tout est remis en tampon, sans agrégat
+        assert len(registry._buffer) == 3
+        assert await mongo.llm_cost_buckets.count_documents({}) == 0
+        await registry.flush()
+        return registry, await mongo.llm_ledger.count_documents({}), await _bucket(mongo, "total", "all", "day")
+
+    registry, count, total = asyncio.run(scenario())
+    assert registry._buffer == []
+    assert count == 3
+    assert total["calls"] == 3
+
+
+def test_failed_bucket_update_is_retried_without_rewriting_events():
+    async def scenario():
+        registry, mongo = _ledger(llm_cost_buckets=lambda c: Flaky(c, "bulk_write"))
+        registry.record(_event("acme"))
+        await registry.flush()
+        assert registry._pending_buckets and not registry._buffer
+        await registry.flush()
+        return registry, await mongo.llm_ledger.count_documents({}), await _bucket(mongo, "tenant", "acme", "hour")
+
+    registry, count, bucket = asyncio.run(scenario())
+    assert registry._pending_buckets == []
+    assert count == 1
+    assert bucket["calls"] == 1
+
+
+def test_events_get_distinct_client_ids():
+    assert _event("acme")["_id"] != _event("acme")["_id"]
+
+
+def test_duplicate_key_errors_count_as_written():
+    async def scenario():
+        registry, mongo = _ledger()
+        first, second = _event("acme"), _event("acme")
+        # Essai précédent interrompu après l'écriture du premier événement
+        await mongo.llm_ledger.insert_one(dict(first))
+        registry.record(first)
+        registry.record(second)
+        await registry.flush()
+        return registry, await mongo.llm_ledger.count_documents({}), await _bucket(mongo, "tenant", "acme", "day")
+
+    registry, count, bucket = asyncio.run(scenario())
+    assert registry._buffer == []
+    assert count == 2
+    assert bucket["calls"] == 2
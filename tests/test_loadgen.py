@@ -0,0 +1,24 @@
+import csv
+import json
+
+import loadgen
+
+
+def test_write_reports_without_any_stage(tmp_path):
+    loadgen.write_reports(tmp_path, [], {"base_url": "http://127.0.0.1:8001"})
+    with open(tmp_path / "stages.csv") as f:
+        reader = csv.DictReader(f)
+        assert reader.fieldnames[:2] == ["stage", "route"]
+        assert list(reader) == []
+    assert json.loads((tmp_path / "summary.json").read_text())["stages"] == []
+
+
+def test_spawn_forwards_data_latency(monkeypatch):
+    commands = []
+    monkeypatch.setattr(loadgen.subprocess, "Popen", lambda command, **kwargs: commands.append(command))
+    monkeypatch.setattr(loadgen, "_wait_ready", lambda url: None)
+    monkeypatch.setattr("sys.argv", ["loadgen", "--spawn", "--data-latency-ms", "7"])
+    args = loadgen.build_parser().parse_args()
+    loadgen.spawn(args)
+    stub = commands[0]
+    assert stub[stub.index("--data-latency-ms") + 1] == "7.0"
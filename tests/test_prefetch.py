@@ -0,0 +1,36 @@
+import asyncio
+
+import agents
+import prefetch
+import upstream
+
+
+def test_failed_warmup_is_neither_completed_nor_deduplicated(monkeypatch):
+    outcomes = iter([RuntimeError("FinnHub indisponible"), {"c": 1}])
+
+    async def collect(analyst, ticker, analysis_date):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(agents, "collect_analyst_data", collect)
+    monkeypatch.setattr(upstream, "mode", lambda: "live")
+    monkeypatch.setattr(prefetch, "PREFETCH_RATE_PER_MINUTE", 0)
+
+    async def scenario():
+        prefetcher = prefetch.Prefetcher()
+        await prefetcher.start()
+        try:
+            assert prefetcher.hint("nvda", "2024-05-10", ["market"])["scheduled"] == ["market"]
+            await asyncio.sleep(0.05)
+            assert prefetcher.stats()["failed"] == 1
+            # Échec: la collecte est replanifiée au prochain indice
+            assert prefetcher.hint("NVDA", "2024-05-10", ["market"])["scheduled"] == ["market"]
+            await asyncio.sleep(0.05)
+            assert prefetcher.stats()["completed"] == 1
+            assert prefetcher.hint("NVDA", "2024-05-10", ["market"])["deduplicated"] == ["market"]
+        finally:
+            await prefetcher.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import pytest
+
+import prompt_context
+
+
+class FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(prompt_context, "_encoding", None)
+    monkeypatch.setattr(prompt_context, "_encoding_loaded", False)
+    monkeypatch.setattr(prompt_context, "_encoding_cached", False)
+    monkeypatch.setattr(prompt_context, "_load_task", None)
+
+
+def test_no_load_on_the_request_path(monkeypatch):
+    def forbidden():
+        raise AssertionError("chargement hors démarrage")
+
+    monkeypatch.setattr(prompt_context, "_load", forbidden)
+    assert prompt_context.count_tokens("Le marché monte.") == 6
+    assert prompt_context.truncate_tokens("un deux trois quatre cinq", 2) == "un deux […]"
+
+
+def test_load_encoding(monkeypatch):
+    monkeypatch.setattr(prompt_context, "_load", FakeEncoding)
+    assert prompt_context.load_encoding()
+    assert prompt_context.encoding_cached()
+    assert prompt_context.count_tokens("abcdef") == 6
+
+
+def test_background_load_uses_estimate_until_ready(monkeypatch):
+    release = threading.Event()
+
+    def download():
+        release.wait(5)
+        return FakeEncoding()
+
+    monkeypatch.setattr(prompt_context, "_load", download)
+
+    async def scenario():
+        task = prompt_context.start_loading()
+        assert prompt_context.start_loading() is task
+        await asyncio.sleep(0.01)
+        # Téléchargement en cours: le démarrage n'attend pas, l'estimation sert
+        assert not task.done()
+        before = prompt_context.count_tokens("abcdef")
+        release.set()
+        assert await task
+        return before, prompt_context.count_tokens("abcdef")
+
+    assert asyncio.run(scenario()) == (2, 6)
+
+
+def test_missing_tiktoken_falls_back_to_estimate(monkeypatch):
+    def missing():
+        raise ImportError("tiktoken")
+
+    monkeypatch.setattr(prompt_context, "_load", missing)
+    assert not prompt_context.load_encoding()
+    assert prompt_context.count_tokens("abcdef") == 2
+
+
+def test_worker_reads_cached_encoding_lazily(monkeypatch):
+    calls = []
+    monkeypatch.setattr(prompt_context, "_load", lambda: calls.append(1) or FakeEncoding())
+    prompt_context.use_cached_encoding()
+    assert calls == []
+    assert prompt_context.count_tokens("abc") == 3
+    assert prompt_context.count_tokens("abcd") == 4
+    assert calls == [1]
@@ -0,0 +1,80 @@
+import asyncio
+
+from fastapi import WebSocketDisconnect
+
+import realtime
+from realtime import Hub
+
+
+class FakeWebSocket:
+    def __init__(self, messages, fail_send=False):
+        self.incoming = asyncio.Queue()
+        for message in messages:
+            self.incoming.put_nowait(message)
+        self.sent = []
+        self.fail_send = fail_send
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def receive_json(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise WebSocketDisconnect()
+        return message
+
+    async def send_json(self, frame):
+        if self.fail_send:
+            raise RuntimeError("socket morte")
+        self.sent.append(frame)
+
+    async def close(self):
+        self.closed = True
+        self.incoming.put_nowait(None)
+
+
+def test_scoped_topic_forgotten_after_last_subscriber_leaves():
+    async def scenario():
+        hub = Hub()
+        hub.publish("comparison:c1", {"stage": "analysts"})
+        hub.publish("results", {"latest": 1})
+        first = FakeWebSocket([{"action": "subscribe", "topics": ["comparison:c1", "results"]}])
+        second = FakeWebSocket([{"action": "subscribe", "topics": ["comparison:c1"]}])
+        serving = [asyncio.create_task(hub.serve(ws)) for ws in (first, second)]
+        await asyncio.sleep(0.01)
+        assert first.sent[0] == {"type": "snapshot", "topic": "comparison:c1", "data": {"stage": "analysts"}}
+
+        second.incoming.put_nowait({"action": "unsubscribe", "topics": ["comparison:c1"]})
+        await asyncio.sleep(0.01)
+        assert "comparison:c1" in hub.state  # encore suivi par la première connexion
+
+        first.incoming.put_nowait(None)
+        await asyncio.sleep(0.01)
+        assert "comparison:c1" not in hub.state
+        assert hub.state["results"] == {"latest": 1}
+        second.incoming.put_nowait(None)
+        await asyncio.gather(*serving)
+
+    asyncio.run(scenario())
+
+
+def test_scoped_topics_published_without_subscribers_are_bounded(monkeypatch):
+    monkeypatch.setattr(realtime, "MAX_SCOPED_TOPICS", 3)
+    hub = Hub()
+    for i in range(5):
+        hub.publish(f"watchlist:w{i}", {"status": "running"})
+    hub.publish("system", {"status": "ok"})
+    assert sorted(hub.state) == ["system", "watchlist:w2", "watchlist:w3", "watchlist:w4"]
+
+
+def test_failed_sender_is_logged_and_closes_connection(caplog):
+    async def scenario():
+        hub = Hub()
+        websocket = FakeWebSocket([{"action": "subscribe", "topics": ["system"]}], fail_send=True)
+        await asyncio.wait_for(hub.serve(websocket), timeout=1)
+        assert websocket.closed
+        assert not hub.connections
+
+    asyncio.run(scenario())
+    assert "socket morte" in caplog.text
@@ -0,0 +1,44 @@
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import responses
+from responses import json_response, precomputed
+
+CONTENT = {
+    "id": "a1",
+    "timestamp": datetime(2024, 5, 10, 9, 30, 15, 250000),
+    "decision": {"action": "BUY", "confidence": 0.72},
+    "ticker": "NVDA",
+    "message": "Analyse terminée ✅",
+    "phases": ["📊 Équipe d'Analyse", "💰 Gestion de Portefeuille"],
+}
+
+
+def test_json_response_matches_the_standard_encoder():
+    body = json_response(CONTENT).body
+    assert json.loads(body) == json.loads(JSONResponse(jsonable_encoder(CONTENT)).body)
+
+
+def test_precomputed_fragment_is_embedded_verbatim():
+    phases = precomputed(CONTENT["phases"])
+    body = json_response({"progress": {"phases": phases, "completion": 100}}).body
+    assert json.loads(body) == {"progress": {"phases": CONTENT["phases"], "completion": 100}}
+
+
+def test_fallback_without_orjson(monkeypatch):
+    monkeypatch.setattr(responses, "orjson", None)
+    monkeypatch.setattr(responses, "DefaultResponse", JSONResponse)
+    assert precomputed(CONTENT["phases"]) == CONTENT["phases"]
+    assert json.loads(json_response(CONTENT, status_code=201).body)["timestamp"] == "2024-05-10T09:30:15.250000"
+
+
+@pytest.mark.parametrize("status_code", [200, 202])
+def test_status_code_and_headers(status_code):
+    response = json_response({"ok": True}, status_code=status_code, headers={"Cache-Control": "no-cache"})
+    assert response.status_code == status_code
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.media_type == "application/json"
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+import pipeline
+import results
+import server
+import tenants
+
+CONFIG = {"ticker": "NVDA", "analysis_date": "2024-05-10", "analysts": ["market"], "research_depth": 1}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    database = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(server, "db", database)
+
+    async def no_run(*args, **kwargs):
+        raise AssertionError("le pipeline ne doit pas être relancé")
+
+    monkeypatch.setattr(server.workers.supervisor, "run_pipeline", no_run)
+    return database
+
+
+async def _job(db, status, **fields):
+    job = await pipeline.create_job(db, "job-1", CONFIG)
+    await db.analysis_jobs.update_one({"id": "job-1"}, {"$set": {"status": status, **fields}})
+    return job
+
+
+def test_resume_running_job_returns_conflict_with_phase(db):
+    async def scenario():
+        await _job(db, "running", current_phase="trader", completed_phases=["analysts", "research"])
+        with pytest.raises(HTTPException) as error:
+            await server.resume_trading_analysis("job-1", tenants.DEFAULT_TENANT)
+        return error.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 409
+    assert error.detail["current_phase"] == pipeline.PHASE_LABELS["trader"]
+    assert error.detail["completed_phases"] == ["analysts", "research"]
+
+
+def test_resume_completed_job_returns_stored_result(db, monkeypatch):
+    async def scenario():
+        await _job(db, "completed", completed_phases=pipeline.PHASE_NAMES)
+        outputs = {}
+        for phase, runner in pipeline.PHASE_RUNNERS.items():
+            outputs[phase] = await runner(CONFIG, outputs)
+            await pipeline.save_checkpoint(db, "job-1", phase, outputs[phase])
+        await results.save_result(db, results.build_result("job-1", CONFIG, outputs))
+
+        async def no_save(*args, **kwargs):
+            raise AssertionError("le résultat ne doit pas être réécrit")
+
+        monkeypatch.setattr(server.results, "save_result", no_save)
+        return await server.resume_trading_analysis("job-1", tenants.DEFAULT_TENANT)
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert b'"cached":true' in response.body
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import types
+from collections import defaultdict, deque
+
+import pytest
+import requests
+
+import ledger
+import routing
+import upstream
+from routing import Target
+
+CHAIN = [Target("deepseek-reasoner", 2048, 120), Target("deepseek-chat", 1024, 60)]
+
+
+class Calls(list):
+    """Appels reçus par le faux ``chat_completion``; ``failures[model]``: erreur levée"""
+
+    def __init__(self):
+        super().__init__()
+        self.failures = {}
+
+
+def _http_error(status):
+    return requests.exceptions.HTTPError(f"HTTP {status}", response=types.SimpleNamespace(status_code=status))
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    monkeypatch.setitem(routing.ROUTES, "portfolio_manager", CHAIN)
+    monkeypatch.setattr(routing, "_fallbacks", defaultdict(int))
+    monkeypatch.setattr(routing, "_latencies", defaultdict(lambda: deque(maxlen=routing.LATENCY_WINDOW)))
+    received = Calls()
+
+    async def chat_completion(messages, model, temperature, max_tokens, timeout):
+        received.append({"model": model, "max_tokens": max_tokens, "timeout": timeout,
+                         "attribution": dict(ledger._attribution.get())})
+        if model in received.failures:
+            raise received.failures[model]
+        return {"model": model, "choices": [{"message": {"content": "ok"}}]}
+
+    monkeypatch.setattr(upstream, "chat_completion", chat_completion)
+    return received
+
+
+def _complete(role="portfolio_manager"):
+    return asyncio.run(routing.complete(role, [{"role": "user", "content": "Décision ?"}]))
+
+
+def test_first_target_answers(calls):
+    response = _complete()
+    assert response["routed_model"] == "deepseek-reasoner"
+    assert [c["model"] for c in calls] == ["deepseek-reasoner"]
+    assert calls[0]["attribution"] == {"role": "portfolio_manager", "fallback": False}
+    assert routing.routing_table()["portfolio_manager"]["calls"] == 1
+
+
+@pytest.mark.parametrize("error", [requests.exceptions.ReadTimeout("lent"), _http_error(429)])
+def test_timeout_or_rate_limit_falls_back(calls, error):
+    calls.failures["deepseek-reasoner"] = error
+    response = _complete()
+    assert response["routed_model"] == "deepseek-chat"
+    assert [(c["model"], c["max_tokens"], c["timeout"]) for c in calls] == [
+        ("deepseek-reasoner", 2048, 120), ("deepseek-chat", 1024, 60)]
+    assert calls[1]["attribution"]["fallback"] is True
+    assert routing.routing_table()["portfolio_manager"]["fallbacks"] == 1
+
+
+@pytest.mark.parametrize("error", [_http_error(500), _http_error(401), ValueError("réponse illisible")])
+def test_other_errors_do_not_fall_back(calls, error):
+    calls.failures["deepseek-reasoner"] = error
+    with pytest.raises(type(error)):
+        _complete()
+    assert [c["model"] for c in calls] == ["deepseek-reasoner"]
+    assert routing.routing_table()["portfolio_manager"]["fallbacks"] == 0
+
+
+def test_exhausted_chain_raises_the_last_error(calls):
+    calls.failures["deepseek-reasoner"] = _http_error(429)
+    calls.failures["deepseek-chat"] = last = requests.exceptions.ConnectTimeout("injoignable")
+    with pytest.raises(requests.exceptions.ConnectTimeout) as error:
+        _complete()
+    assert error.value is last
+    assert [c["model"] for c in calls] == ["deepseek-reasoner", "deepseek-chat"]
+    assert routing.routing_table()["portfolio_manager"]["calls"] == 0
+
+
+def test_unknown_role_uses_default_chain(calls):
+    assert _complete("inconnu")["routed_model"] == routing.DEFAULT_CHAIN[0].model
+
+
+def test_routes_file_overrides_roles(monkeypatch, tmp_path):
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps({"trader": [{"model": "deepseek-reasoner", "max_tokens": 300, "timeout": 20}]}))
+    monkeypatch.setenv("MODEL_ROUTES_FILE", str(path))
+    routes = routing.load_routes()
+    assert routes["trader"] == [Target("deepseek-reasoner", 300, 20)]
+    assert routes["risk_manager"] == routing.DEFAULT_ROUTES["risk_manager"]
+
+    path.write_text(json.dumps({"trader": [{"modele": "x"}]}))
+    assert routing.load_routes() == routing.DEFAULT_ROUTES
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import tenants
+from fairqueue import BATCH, INTERACTIVE
+from scheduler import Cron, CronError, InFlight, Scheduler
+
+UTC = ZoneInfo("UTC")
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "0 24 * * *", "0 0 0 * *", "5-1 * * * *",
+                                        "*/0 * * * *", "a * * * *", "0 0 30 2 *", "0 0 31 4,6,9,11 *"])
+def test_invalid_expressions_are_rejected(expression):
+    with pytest.raises(CronError):
+        Cron(expression)
+
+
+def test_fields_steps_lists_and_sunday_as_seven():
+    cron = Cron("*/15 9-17 * * 1-5,7")
+    assert cron.fields["minute"] == {0, 15, 30, 45}
+    assert cron.fields["hour"] == set(range(9, 18))
+    assert cron.fields["weekday"] == {0, 1, 2, 3, 4, 5}
+
+
+@pytest.mark.parametrize("expression, after, expected", [
+    ("30 9 * * 1-5", datetime(2024, 5, 10, 9, 30), datetime(2024, 5, 13, 9, 30)),  # vendredi -> lundi
+    ("*/15 * * * *", datetime(2024, 5, 10, 9, 31, 12), datetime(2024, 5, 10, 9, 45)),
+    ("0 0 1 1 *", datetime(2024, 5, 10), datetime(2025, 1, 1)),
+    ("59 23 31 12 *", datetime(2024, 12, 31, 23, 59), datetime(2025, 12, 31, 23, 59)),
+    ("0 12 29 2 *", datetime(2024, 3, 1), datetime(2028, 2, 29, 12, 0)),
+    ("0 8 31 * *", datetime(2024, 4, 1), datetime(2024, 5, 31, 8, 0)),
+])
+def test_next_after(expression, after, expected):
+    assert Cron(expression).next_after(after.replace(tzinfo=UTC)) == expected.replace(tzinfo=UTC)
+
+
+def test_day_of_month_or_day_of_week_when_both_restricted():
+    cron = Cron("0 0 1 * 1")
+    # 2024-05-01 est un mercredi, 2024-05-06 un lundi
+    assert cron.matches(datetime(2024, 5, 1))
+    assert cron.matches(datetime(2024, 5, 6))
+    assert not cron.matches(datetime(2024, 5, 7))
+    assert cron.next_after(datetime(2024, 5, 1, tzinfo=UTC)) == datetime(2024, 5, 6, tzinfo=UTC)
+    # Un seul des deux restreint: il décide seul
+    assert not Cron("0 0 1 * *").matches(datetime(2024, 5, 6))
+    assert not Cron("0 0 */2 * 1").matches(datetime(2024, 5, 6))
+
+
+def test_next_after_walks_fields_quickly():
+    cron = Cron("0 12 29 2 1")
+    start = time.perf_counter()
+    for year in range(2000, 2100):
+        cron.next_after(datetime(year, 3, 1, tzinfo=UTC))
+    assert time.perf_counter() - start < 1.0
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+
+class _Watchlists:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, *args):
+        return _Cursor(self.docs)
+
+    async def find_one_and_update(self, query, update):
+        return {"name": query["name"]}
+
+
+def test_tick_skips_invalid_watchlist_and_triggers_the_next():
+    created = datetime(2024, 5, 10, 9, 0)
+    scheduler = Scheduler()
+    scheduler.db = type("Db", (), {"watchlists": _Watchlists([
+        {"name": "broken", "schedule": "0 0 30 2 *", "timezone": "UTC", "created_at": created},
+        {"name": "ok", "schedule": "* * * * *", "timezone": "UTC", "created_at": created},
+    ])})()
+    triggered = []
+    scheduler.trigger = lambda watchlist, now: triggered.append(watchlist["name"])
+    asyncio.run(scheduler.tick(datetime(2024, 5, 10, 9, 5, tzinfo=UTC)))
+    assert triggered == ["ok"]
+
+
+def test_inflight_runs_once_and_attaches_followers():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"status": "completed"}
+
+    async def scenario():
+        inflight = InFlight()
+        first, second = await asyncio.gather(inflight.run("k", compute), inflight.run("k", compute))
+        assert not inflight.running("k")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert calls == [1]
+    assert first == {"status": "completed"}
+    assert second == {"status": "completed", "attached": True}
+
+
+def test_inflight_interactive_caller_promotes_batch_computation():
+    seen = []
+    user = tenants.Tenant(id="user", name="Utilisateur")
+    batch_tenant = tenants.Tenant(id="batch", name="Lot")
+
+    async def compute():
+        seen.append((tenants.current_priority.get(), tenants.current_tenant.get().id))
+        await asyncio.sleep(0.05)
+        seen.append((tenants.current_priority.get(), tenants.current_tenant.get().id))
+        return {"status": "completed"}
+
+    async def batch_caller(inflight):
+        tenants.current_tenant.set(batch_tenant)
+        tenants.current_priority.set(BATCH)
+        result = await inflight.run("k", compute)
+        # Le contexte de l'appelant batch n'est pas touché
+        assert tenants.current_priority.get() == BATCH
+        return result
+
+    async def interactive_caller(inflight):
+        await asyncio.sleep(0.01)
+        tenants.current_tenant.set(user)
+        tenants.current_priority.set(INTERACTIVE)
+        assert inflight.priority("k") == BATCH
+        result = await inflight.run("k", compute)
+        return result
+
+    async def scenario():
+        inflight = InFlight()
+        await asyncio.gather(batch_caller(inflight), interactive_caller(inflight))
+
+    asyncio.run(scenario())
+    assert seen == [(BATCH, "batch"), (INTERACTIVE, "user")]
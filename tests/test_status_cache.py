@@ -0,0 +1,122 @@
+import asyncio
+import json
+import types
+import uuid
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+import status_cache
+from status_cache import StatusCache, StatusRecord
+
+BASE = datetime(2024, 5, 10, 9, 0)
+
+
+def _document(seconds, name="client"):
+    return {"id": str(uuid.uuid4()), "client_name": name, "timestamp": BASE + timedelta(seconds=seconds)}
+
+
+def _timestamps(cache):
+    body, _ = cache.rendered()
+    return [item["timestamp"] for item in json.loads(body)]
+
+
+def test_record_round_trip():
+    document = _document(1.5)
+    record = StatusRecord.from_document(document)
+    assert record.id == document["id"]
+    assert record.to_document() == document
+
+
+def test_segmented_buffer_keeps_order_and_capacity():
+    cache = StatusCache(capacity=40)
+    documents = [_document(i) for i in range(50)]
+    for document in documents[:45]:
+        cache.add(document)
+    # Écriture d'un autre worker en léger désordre, puis doublon ignoré
+    cache.add(documents[46])
+    cache.add(documents[45])
+    cache.add(documents[45])
+    assert len(cache) == 40
+    assert len(cache._segments) <= 40 // status_cache.SEGMENT_SIZE + 2
+    expected = [d["timestamp"].isoformat() for d in documents[7:47]]
+    assert _timestamps(cache) == expected
+    # Trop ancien pour un tampon plein
+    cache.add(documents[0])
+    assert _timestamps(cache) == expected
+
+
+def test_rendered_body_and_etag_change_only_on_write():
+    cache = StatusCache(capacity=10)
+    cache.add(_document(1))
+    first = cache.rendered()
+    assert cache.rendered() is first
+    cache.add(_document(2))
+    second = cache.rendered()
+    assert second[1] != first[1]
+    assert len(json.loads(second[0])) == 2
+
+
+def test_reload_keeps_writes_arriving_during_the_read():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        await db.status_checks.insert_many([_document(i) for i in range(3)])
+        cache = StatusCache(capacity=10)
+        late = _document(10)
+        collection = db.status_checks
+
+        class Cursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def sort(self, *args):
+                return Cursor(self.cursor.sort(*args))
+
+            def limit(self, *args):
+                return Cursor(self.cursor.limit(*args))
+
+            async def to_list(self, length):
+                documents = await self.cursor.to_list(length)
+                cache.add(late)  # écriture locale pendant la lecture
+                return documents
+
+        cache.db = types.SimpleNamespace(status_checks=types.SimpleNamespace(find=lambda *a: Cursor(collection.find(*a))))
+        await cache.reload()
+        return cache, late
+
+    cache, late = asyncio.run(scenario())
+    assert cache.ready
+    assert len(cache) == 4
+    assert cache.latest().id == late["id"]
+
+
+def test_schedule_reload_runs_one_at_a_time_and_logs_failures(caplog, monkeypatch):
+    monkeypatch.setattr(status_cache, "RETRY_SECONDS", 0.01)
+
+    async def scenario():
+        cache = StatusCache(capacity=10)
+        calls = []
+        release = asyncio.Event()
+
+        async def reload():
+            calls.append(1)
+            if len(calls) == 1:
+                await release.wait()
+                raise RuntimeError("mongo indisponible")
+            cache.ready = True
+
+        cache.reload = reload
+        cache.schedule_reload()
+        cache.schedule_reload()
+        cache.schedule_reload()
+        await asyncio.sleep(0)
+        assert len(calls) == 1 and not cache.ready
+        release.set()
+        await asyncio.sleep(0.1)
+        await cache.stop()
+        return calls, cache
+
+    calls, cache = asyncio.run(scenario())
+    assert "mongo indisponible" in caplog.text
+    # Échec puis un seul nouvel essai (les demandes faites pendant le premier sont fusionnées)
+    assert len(calls) == 2
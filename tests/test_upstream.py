@@ -0,0 +1,160 @@
+import asyncio
+import gzip
+import types
+from collections import OrderedDict
+
+import pytest
+
+import agents
+import comparison
+import upstream
+from upstream import Cassette, CassetteMiss
+
+MESSAGES = [{"role": "user", "content": "Analyse NVDA"}]
+
+
+class FakeHTTP:
+    """Remplace ``requests`` dans upstream: chaque appel renvoie une réponse différente"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _response(self, data):
+        self.calls += 1
+        return types.SimpleNamespace(raise_for_status=lambda: None, json=lambda: data)
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        usage = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        return self._response({"model": json["model"], "usage": usage,
+                               "choices": [{"message": {"content": f"réponse {self.calls}"}}]})
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        assert params.pop("token")
+        return self._response({"c": 100 + self.calls, "params": params})
+
+
+class Offline:
+    def post(self, *args, **kwargs):
+        raise AssertionError("aucun appel réseau en replay")
+
+    get = post
+
+
+class Recorder:
+    def __init__(self):
+        self.items = []
+
+    def record(self, *args):
+        self.items.append(args)
+
+    def record_tokens(self, tenant, tokens):
+        self.items.append(tokens)
+
+
+@pytest.fixture
+def cassette(monkeypatch, tmp_path):
+    path = tmp_path / "cassette.jsonl.gz"
+    monkeypatch.setenv("TRADING_CASSETTE", str(path))
+    monkeypatch.setattr(upstream, "_cassette", None)
+    monkeypatch.setattr(upstream, "_finnhub_cache", OrderedDict())
+    monkeypatch.setattr(upstream, "ledger", Recorder())
+    monkeypatch.setattr(upstream, "registry", Recorder())
+    return path
+
+
+def _use(monkeypatch, mode, http):
+    monkeypatch.setenv("TRADING_PIPELINE_MODE", mode)
+    monkeypatch.setattr(upstream, "requests", http)
+    # Nouvelle instance: relit le fichier comme un processus neuf
+    monkeypatch.setattr(upstream, "_cassette", None)
+
+
+async def _session():
+    return [
+        (await upstream.chat_completion(MESSAGES))["choices"][0]["message"]["content"],
+        (await upstream.chat_completion(MESSAGES))["choices"][0]["message"]["content"],
+        await upstream.finnhub_get("/quote", {"symbol": "NVDA"}, cache_ttl=300),
+        await upstream.finnhub_get("/stock/metric", {"symbol": "NVDA", "metric": "all"}),
+    ]
+
+
+def test_record_then_replay_offline_is_identical(monkeypatch, cassette):
+    _use(monkeypatch, "record", FakeHTTP())
+    recorded = asyncio.run(_session())
+    assert recorded[:2] == ["réponse 0", "réponse 1"]
+
+    _use(monkeypatch, "replay", Offline())
+    assert asyncio.run(_session()) == recorded
+
+
+def test_duplicate_requests_replay_in_order_then_repeat_the_last(tmp_path):
+    cassette = Cassette(tmp_path / "c.jsonl.gz")
+    for value in ("a", "b", "c"):
+        cassette.record("key", "llm", {}, {"value": value}, 1)
+    replayed = Cassette(cassette.path)
+    assert [replayed.replay("key")["value"] for _ in range(5)] == ["a", "b", "c", "c", "c"]
+    with pytest.raises(CassetteMiss):
+        replayed.replay("absente")
+
+
+def test_record_appends_gzip_members(tmp_path):
+    cassette = Cassette(tmp_path / "c.jsonl.gz")
+    cassette.record("k1", "finnhub", {"path": "/quote"}, {"data": 1}, 3)
+    first = cassette.path.read_bytes()
+    cassette.record("k2", "finnhub", {"path": "/quote"}, {"data": 2}, 4)
+    raw = cassette.path.read_bytes()
+    # Ajout d'un membre gzip sans réécrire le fichier existant
+    assert raw.startswith(first) and raw[len(first):len(first) + 2] == b"\x1f\x8b"
+    assert len(gzip.decompress(raw).decode().splitlines()) == 2
+
+
+def test_replay_bypasses_finnhub_cache(monkeypatch, cassette):
+    _use(monkeypatch, "record", FakeHTTP())
+
+    async def quotes():
+        return [await upstream.finnhub_get("/quote", {"symbol": "NVDA"}, cache_ttl=ttl) for ttl in (0, 0)]
+
+    recorded = asyncio.run(quotes())
+    assert recorded[0] != recorded[1]
+
+    _use(monkeypatch, "replay", Offline())
+
+    async def cached_quotes():
+        return [await upstream.finnhub_get("/quote", {"symbol": "NVDA"}, cache_ttl=300) for _ in range(2)]
+
+    # Chaque appel consomme l'enregistrement suivant, comme pendant l'enregistrement
+    assert asyncio.run(cached_quotes()) == recorded
+    assert not upstream._finnhub_cache
+
+
+def test_replay_does_not_charge_tenant_tokens(monkeypatch, cassette):
+    _use(monkeypatch, "record", FakeHTTP())
+    asyncio.run(upstream.chat_completion(MESSAGES))
+    assert upstream.registry.items == [15]
+
+    _use(monkeypatch, "replay", Offline())
+    asyncio.run(upstream.chat_completion(MESSAGES))
+    assert upstream.registry.items == [15]
+    recorded, replayed = [args[0] for args in upstream.ledger.items]
+    assert not recorded["replayed"] and recorded["cost_usd"] > 0
+    assert replayed["replayed"] and replayed["cost_usd"] == 0.0
+
+
+def test_cassette_miss_propagates_through_data_fallbacks(monkeypatch, cassette):
+    _use(monkeypatch, "replay", Offline())
+    with pytest.raises(CassetteMiss):
+        asyncio.run(agents.fetch_analyst_data("market", "NVDA", "2024-05-10"))
+    with pytest.raises(CassetteMiss):
+        asyncio.run(comparison._peer_metrics(["NVDA", "AMD"]))
+    with pytest.raises(CassetteMiss):
+        asyncio.run(comparison._market_news())
+
+
+def test_live_errors_still_degrade_to_fallbacks(monkeypatch, cassette):
+    def down(*args, **kwargs):
+        raise ConnectionError("FinnHub injoignable")
+
+    _use(monkeypatch, "live", types.SimpleNamespace(get=down))
+    assert asyncio.run(agents.fetch_analyst_data("market", "NVDA", "2024-05-10")) == "Données indisponibles (ConnectionError)"
+    assert asyncio.run(comparison._peer_metrics(["NVDA"])) == {"NVDA": {}}
+    assert asyncio.run(comparison._market_news()) == []
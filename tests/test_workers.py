@@ -0,0 +1,118 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+import fairqueue
+import upstream
+import workers
+
+
+@pytest.fixture
+def link(monkeypatch):
+    """Worker et serveur dans le même processus, reliés par un vrai pipe"""
+    scheduler = fairqueue.FairScheduler(capacity=1, interactive_reserve=0)
+    monkeypatch.setattr(fairqueue, "llm_scheduler", scheduler)
+    server_conn, worker_conn = multiprocessing.Pipe()
+    yield scheduler, server_conn, worker_conn
+    server_conn.close()
+    worker_conn.close()
+
+
+def _connect(server_conn, worker_conn):
+    loop = asyncio.get_running_loop()
+    supervisor = workers.WorkerSupervisor()
+    worker = workers._Worker("job", process=None, conn=server_conn)
+    server_link = workers._ServerLink(worker_conn)
+    loop.add_reader(server_conn.fileno(), supervisor._drain, worker)
+
+    def on_message():
+        message = worker_conn.recv()
+        if message[0] == "resolve":
+            server_link.resolve(*message[1:])
+
+    loop.add_reader(worker_conn.fileno(), on_message)
+    return worker, server_link
+
+
+def _disconnect(server_conn, worker_conn):
+    loop = asyncio.get_running_loop()
+    loop.remove_reader(server_conn.fileno())
+    loop.remove_reader(worker_conn.fileno())
+
+
+def test_worker_llm_slots_queue_in_server_scheduler(link):
+    scheduler, server_conn, worker_conn = link
+
+    async def scenario():
+        worker, server_link = _connect(server_conn, worker_conn)
+        try:
+            async with scheduler.slot("local", 1.0, fairqueue.INTERACTIVE):
+                # Le serveur est plein: la demande du worker attend dans sa file, visible par admission
+                waiting = asyncio.create_task(_enter(server_link.llm_slot("tenant", 1.0, fairqueue.INTERACTIVE, 1.0)))
+                await asyncio.sleep(0.05)
+                assert scheduler.waiting_for(fairqueue.INTERACTIVE) == 1
+                assert not waiting.done()
+            await asyncio.wait_for(waiting, 1)
+            assert scheduler.in_flight[fairqueue.INTERACTIVE] == 1
+            await waiting.result().__aexit__(None, None, None)
+            await asyncio.sleep(0.05)
+            assert scheduler.in_flight[fairqueue.INTERACTIVE] == 0
+            assert worker.leases == {}
+        finally:
+            _disconnect(server_conn, worker_conn)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_worker_request_leaves_server_queue(link):
+    scheduler, server_conn, worker_conn = link
+
+    async def scenario():
+        worker, server_link = _connect(server_conn, worker_conn)
+        try:
+            async with scheduler.slot("local", 1.0, fairqueue.BATCH):
+                waiting = asyncio.create_task(_enter(server_link.llm_slot("tenant", 1.0, fairqueue.BATCH, 1.0)))
+                await asyncio.sleep(0.05)
+                waiting.cancel()
+                await asyncio.sleep(0.05)
+                assert scheduler.waiting_for(fairqueue.BATCH) == 0
+                assert worker.leases == {}
+            assert scheduler.in_flight == {fairqueue.INTERACTIVE: 0, fairqueue.BATCH: 0}
+        finally:
+            _disconnect(server_conn, worker_conn)
+
+    asyncio.run(scenario())
+
+
+def test_worker_finnhub_requests_use_server_cache(link, monkeypatch):
+    _, server_conn, worker_conn = link
+    calls = []
+
+    async def fetch(request, timeout):
+        calls.append(request["path"])
+        if request["path"] == "/missing":
+            raise LookupError("absent")
+        return {"c": 1}
+
+    monkeypatch.setattr(upstream, "_finnhub_fetch", fetch)
+    monkeypatch.setattr(upstream, "mode", lambda: "live")
+    monkeypatch.setattr(upstream, "_finnhub_cache", type(upstream._finnhub_cache)())
+
+    async def scenario():
+        _, server_link = _connect(server_conn, worker_conn)
+        try:
+            for _ in range(2):
+                assert await server_link.finnhub_get("/quote", {"symbol": "NVDA"}, 10, 60) == {"c": 1}
+            with pytest.raises(RuntimeError, match="absent"):
+                await server_link.finnhub_get("/missing", {}, 10, 60)
+        finally:
+            _disconnect(server_conn, worker_conn)
+
+    asyncio.run(scenario())
+    assert calls == ["/quote", "/missing"]
+
+
+async def _enter(manager):
+    await manager.__aenter__()
+    return manager